@@ -0,0 +1,57 @@
+"""
+Báo cáo chấm công theo khoảng ngày từ log đã chia partition (dùng index, không đọc cả log)
+
+Ví dụ:
+    python attendance_report.py 2025-10-01 2025-10-31 --summary -o thang10.csv
+    python attendance_report.py 2024-01-01 2025-12-31 --employee NV001
+    python attendance_report.py 2020-01-01 2025-12-31 -o toan_bo.csv.gz
+"""
+import argparse
+import csv
+import sys
+
+from attendance_rollup import DailyRollup
+from database import AttendanceLog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Báo cáo chấm công theo khoảng ngày")
+    parser.add_argument('start', help="Từ ngày YYYY-MM-DD")
+    parser.add_argument('end', nargs='?', default=None, help="Đến ngày YYYY-MM-DD (mặc định = start)")
+    parser.add_argument('--log', default='attendance_log.csv', help="File log chấm công")
+    parser.add_argument('--log-partition', default='month', choices=['none', 'month', 'day'],
+                        help="Cách chia log (giống ứng dụng chính)")
+    parser.add_argument('--employee', action='append', dest='employees',
+                        help="Chỉ lấy nhân viên này (lặp lại cho nhiều người)")
+    parser.add_argument('--type', default=None, help="Chỉ lấy loại chấm công này (check-in...)")
+    parser.add_argument('--summary', action='store_true',
+                        help="Bảng công mỗi ngày (giờ vào đầu tiên / ra cuối cùng, số giờ) "
+                             "đọc từ file tổng hợp thay vì từng lần chấm công")
+    parser.add_argument('-o', '--output', default='-', help="File CSV đầu ra ('-' = stdout)")
+    args = parser.parse_args()
+
+    log = AttendanceLog(args.log, partition=None if args.log_partition == 'none' else args.log_partition)
+    if not args.summary and args.output != '-':
+        # Xuất thẳng ra file: chép theo khối, bộ nhớ cố định, nén gzip nếu đuôi .gz
+        output_file = log.export_to_csv(args.output, args.start, args.end or args.start,
+                                        args.employees, args.type)
+        print(f"Đã xuất: {output_file}" if output_file else "Không có dữ liệu trong khoảng ngày này")
+        return
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8-sig')
+    try:
+        if args.summary:
+            fields = ['date', 'employee_id', 'name', 'first_in', 'last_out', 'count', 'hours']
+            rows = DailyRollup(log, attach=False).days(args.start, args.end, args.employees)
+        else:
+            fields = AttendanceLog.FIELDS
+            rows = log.query(args.start, args.end, args.employees, args.type)
+        writer = csv.DictWriter(output, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Bảng công theo ngày cập nhật dần theo từng lần chấm công (không quét lại log)
+- Mỗi nhân viên mỗi ngày: giờ thấy đầu tiên / cuối cùng, số lần chấm công, số giờ
+- Lưu gọn mỗi ngày 1 file JSON (attendance_log_rollup/2025-10-04.json, vài KB),
+  báo cáo / dashboard chỉ đọc các file này
+- Ngày thiếu file, chưa chốt hoặc log của ngày đó đã đổi (process khác ghi thêm)
+  mới dựng lại từ log bằng AttendanceLog.query
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import _date_str
+
+
+def _hours(first_seen, last_seen):
+    start = datetime.strptime(first_seen, '%H:%M:%S')
+    end = datetime.strptime(last_seen, '%H:%M:%S')
+    return round((end - start).total_seconds() / 3600, 2)
+
+
+def _date_range(start, end):
+    day = datetime.strptime(start, '%Y-%m-%d')
+    last = datetime.strptime(end, '%Y-%m-%d')
+    while day <= last:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
+class DailyRollup:
+    """
+    Tổng hợp chấm công theo nhân viên / ngày
+    - Hôm nay giữ trong bộ nhớ, cập nhật qua AttendanceLog.listeners, ghi file
+      mỗi save_interval giây (chưa chốt, chỉ gồm dòng của process này)
+    - Ngày đã qua chỉ được chốt (complete) sau khi dựng lại từ log, kèm đoạn byte
+      của ngày đó trong log (span); span trong log khác đi thì dựng lại
+    - File mỗi ngày: {"complete": bool, "span": [file, đầu, cuối],
+      "employees": {mã: [tên, đầu, cuối, số lần]}}
+    """
+
+    def __init__(self, attendance_log, rollup_dir=None, save_interval=5.0, attach=True):
+        """
+        rollup_dir: thư mục file tổng hợp, mặc định <tên log>_rollup cạnh file log
+        attach: theo dõi log_attendance (ứng dụng chấm công); False = chỉ đọc (báo cáo)
+        """
+        self.attendance_log = attendance_log
+        self.rollup_dir = rollup_dir or os.path.splitext(attendance_log.log_file)[0] + '_rollup'
+        self.save_interval = save_interval
+        os.makedirs(self.rollup_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._date = None       # ngày đang giữ trong bộ nhớ
+        self._employees = {}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if attach:
+            with self._lock:
+                today = datetime.now().strftime('%Y-%m-%d')
+                self._date, self._employees = today, self._build(today, today)[today]
+                self._dirty = True
+            attendance_log.listeners.append(self.on_attendance)
+            atexit.register(self.close)
+
+    def _path(self, date):
+        return os.path.join(self.rollup_dir, date + '.json')
+
+    def _load(self, date):
+        """Returns: (employees, complete, span) hoặc None nếu chưa có file"""
+        try:
+            with open(self._path(date), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data['employees'], data['complete'], data.get('span')
+
+    def _save(self, date, employees, complete, span=None):
+        tmp_file = self._path(date) + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'complete': complete, 'span': span, 'employees': employees}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, self._path(date))
+
+    def _build(self, start, end):
+        """Dựng lại các ngày [start, end] từ log; Returns: ngày -> employees"""
+        days = {date: {} for date in _date_range(start, end)}
+        for row in self.attendance_log.query(start, end):
+            self._add(days[row['Thời gian'][:10]], row)
+        return days
+
+    @staticmethod
+    def _add(employees, row):
+        clock = row['Thời gian'][11:19]
+        entry = employees.get(row['ID nhân viên'])
+        if entry is None:
+            employees[row['ID nhân viên']] = [row['Tên'], clock, clock, 1]
+        else:
+            entry[1] = min(entry[1], clock)
+            entry[2] = max(entry[2], clock)
+            entry[3] += 1
+
+    def on_attendance(self, row):
+        """Listener của AttendanceLog: cộng 1 lần chấm công vào bảng của ngày đó"""
+        date = row['Thời gian'][:10]
+        with self._lock:
+            if date < self._date:
+                # Chấm công cho ngày đã qua (video ghi lại): bỏ file, dựng lại khi cần
+                try:
+                    os.remove(self._path(date))
+                except OSError:
+                    pass
+                return
+            if date > self._date:
+                # Sang ngày mới: ghi ngày cũ (chưa chốt, process khác có thể đã ghi
+                # thêm vào log; days() dựng lại từ log rồi mới chốt)
+                self._save(self._date, self._employees, False)
+                self._date, self._employees = date, {}
+            self._add(self._employees, row)
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._save_current()
+
+    def _save_current(self):
+        if self._dirty:
+            self._save(self._date, self._employees, False)
+            self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _first_log_date(self):
+        """Ngày của dòng log đầu tiên (trước đó không cần dựng bảng công)"""
+        for path in self.attendance_log.partition_files():
+            with open(path, 'rb') as f:
+                f.readline()
+                line = f.readline()
+            if line[:4].isdigit():
+                return line[:10].decode('ascii')
+        return '9999-12-31'
+
+    def days(self, start_date, end_date=None, employee_ids=None):
+        """
+        Bảng công các ngày từ start_date đến end_date (gồm cả 2 ngày)
+        Returns: list dict (date, employee_id, name, first_in, last_out, count, hours)
+        """
+        start = _date_str(start_date)
+        end = _date_str(end_date or start_date)
+        today = datetime.now().strftime('%Y-%m-%d')
+        first = self._first_log_date()
+        days, missing = {}, []
+        spans = {}
+        for date in _date_range(start, min(end, today)):
+            with self._lock:
+                if date == self._date == today:
+                    days[date] = {key: list(entry) for key, entry in self._employees.items()}
+                    continue
+            if date < first:
+                continue
+            loaded = self._load(date)
+            spans[date] = self.attendance_log.date_span(date)
+            if loaded is not None and loaded[1] and loaded[2] == spans[date]:
+                days[date] = loaded[0]
+            else:
+                missing.append(date)
+        if missing:
+            # Dựng lại 1 lần cho cả đoạn ngày thiếu, chốt các ngày đã qua (span lấy
+            # trước khi dựng: dòng ghi thêm trong lúc dựng sẽ làm lần sau dựng lại)
+            for date, employees in self._build(missing[0], missing[-1]).items():
+                if date in missing:
+                    days[date] = employees
+                    if date < today:
+                        self._save(date, employees, True, spans[date])
+        if employee_ids:
+            employee_ids = {str(employee_id) for employee_id in employee_ids}
+        rows = []
+        for date in sorted(days):
+            for employee_id, (name, first_in, last_out, count) in sorted(days[date].items()):
+                if employee_ids and employee_id not in employee_ids:
+                    continue
+                rows.append({'date': date, 'employee_id': employee_id, 'name': name,
+                             'first_in': first_in, 'last_out': last_out, 'count': count,
+                             'hours': _hours(first_in, last_out)})
+        return rows
+
+    def hours_worked(self, start_date, end_date=None):
+        """Tổng số giờ (giờ ra cuối - giờ vào đầu mỗi ngày) của từng nhân viên"""
+        totals = {}
+        for row in self.days(start_date, end_date):
+            totals[row['employee_id']] = round(totals.get(row['employee_id'], 0) + row['hours'], 2)
+        return totals
+
+    def late_arrivals(self, date=None, start_time='08:00:00'):
+        """Nhân viên có giờ vào đầu tiên sau start_time trong ngày date (mặc định hôm nay)"""
+        date = _date_str(date or datetime.now())
+        return [row for row in self.days(date) if row['first_in'] > start_time]
+
+    def rebuild(self, start_date, end_date=None):
+        """Dựng lại bảng công từ log (vd. sau khi sửa log hoặc có process khác ghi)"""
+        start = _date_str(start_date)
+        end = _date_str(end_date or start_date)
+        today = datetime.now().strftime('%Y-%m-%d')
+        with self._lock:
+            spans = {date: self.attendance_log.date_span(date)
+                     for date in _date_range(start, min(end, today))}
+            for date, employees in self._build(start, end).items():
+                if date == self._date:
+                    self._employees = employees
+                    self._dirty = True
+                if date < today:
+                    self._save(date, employees, True, spans[date])
+                elif date == today and date != self._date:
+                    self._save(date, employees, False)
+
+    def close(self):
+        """Ghi bảng công đang giữ trong bộ nhớ"""
+        with self._lock:
+            if self._date is not None:
+                self._save_current()
@@ -0,0 +1,116 @@
+"""
+Benchmark IVFIndex và QuantizedMatrix so với tìm vét cạn (EmbeddingMatrix)
+In recall@1, tỉ lệ quyết định giống nhau, thời gian so khớp và RAM để chọn tham số
+
+Ví dụ:
+    python benchmark_ann.py --size 100000 --nprobe 1 4 8 16 32
+    python benchmark_ann.py --db employees.pkl --queries 500
+"""
+import argparse
+import time
+
+import numpy as np
+
+from face_index import EmbeddingMatrix, IVFIndex, QuantizedMatrix
+
+
+def synthetic_roster(size, dim=128, groups=64, seed=0):
+    """Encoding giả lập: các nhóm người (tâm nhóm) + biến thể từng người, độ dài ~1"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(groups, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    members = centers[rng.integers(groups, size=size)] * 0.6
+    members += rng.normal(scale=0.8 / np.sqrt(dim), size=(size, dim)).astype(np.float32)
+    return [f"NV{i:06d}" for i in range(size)], members
+
+
+def load_roster(db_file):
+    from database import open_employee_database
+    employees = open_employee_database(db_file).get_all_employees()
+    ids = list(employees)
+    encodings = np.asarray([employees[emp_id]['face_encoding'] for emp_id in ids], dtype=np.float32)
+    return ids, encodings
+
+
+def make_queries(encodings, count, noise, seed=1):
+    """Query = encoding đã biết + nhiễu (ảnh chụp khác lúc đăng ký)"""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(len(encodings), size=count)
+    queries = encodings[rows] + rng.normal(
+        scale=noise / np.sqrt(encodings.shape[1]), size=(count, encodings.shape[1])
+    ).astype(np.float32)
+    return queries
+
+
+def timed_search(index, queries, batch, **kwargs):
+    start = time.perf_counter()
+    ids, dists = [], []
+    for i in range(0, len(queries), batch):
+        batch_ids, batch_dists = index.search(queries[i:i + batch], **kwargs)
+        ids += batch_ids
+        dists.append(batch_dists)
+    elapsed = time.perf_counter() - start
+    return ids, np.concatenate(dists), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall / tốc độ của IVFIndex so với tìm vét cạn")
+    parser.add_argument('--db', default=None, help="Dùng encoding thật từ file database")
+    parser.add_argument('--size', type=int, default=100000, help="Số nhân viên giả lập")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=4, help="Số khuôn mặt mỗi frame")
+    parser.add_argument('--noise', type=float, default=0.3, help="Độ lệch query so với encoding gốc")
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--nlist', type=int, default=None, help="Số cụm (mặc định ~ sqrt(N))")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--quantize', nargs='*', default=['int8', 'float16'],
+                        help="Các kiểu lượng tử hoá cần so sánh")
+    parser.add_argument('--save', default=None, help="Lưu IVF index ra file .npz")
+    args = parser.parse_args()
+
+    if args.db:
+        ids, encodings = load_roster(args.db)
+    else:
+        ids, encodings = synthetic_roster(args.size)
+    queries = make_queries(encodings, args.queries, args.noise)
+    print(f"Danh sách: {len(ids)} khuôn mặt, {len(queries)} query, {args.batch} khuôn mặt/lần")
+
+    flat = EmbeddingMatrix()
+    flat.load(ids, encodings)
+    exact_ids, exact_dists, flat_time = timed_search(flat, queries, args.batch)
+    exact_match = [i if d <= args.tolerance else None for i, d in zip(exact_ids, exact_dists)]
+
+    start = time.perf_counter()
+    ivf = IVFIndex(nlist=args.nlist)
+    ivf.load(ids, encodings)
+    build_time = time.perf_counter() - start
+    print(f"Train + nạp IVF: {build_time:.2f}s, {len(ivf.lists)} cụm")
+    if args.save:
+        ivf.save(args.save)
+
+    flat_ms = flat_time * 1000 / len(queries)
+    flat_mb = len(ids) * encodings.shape[1] * 4 / 1e6
+
+    def report(name, ann_ids, ann_dists, ann_time, resident_mb):
+        recall = np.mean([a == e for a, e in zip(ann_ids, exact_ids)])
+        # Tỉ lệ khuôn mặt có cùng kết quả chấm công (khớp ai / không khớp ai)
+        ann_match = [i if d <= args.tolerance else None for i, d in zip(ann_ids, ann_dists)]
+        agreement = np.mean([a == e for a, e in zip(ann_match, exact_match)])
+        ann_ms = ann_time * 1000 / len(queries)
+        print(f"{name:<16}{recall:>10.4f}{agreement:>12.4f}{ann_ms:>10.3f}"
+              f"{flat_ms / ann_ms:>10.1f}{resident_mb:>10.1f}")
+
+    print(f"{'index':<16}{'recall@1':>10}{'quyết định':>12}{'ms/query':>10}{'tăng tốc':>10}{'RAM MB':>10}")
+    report('flat', exact_ids, exact_dists, flat_time, flat_mb)
+    for nprobe in args.nprobe:
+        report(f'ivf/{nprobe}', *timed_search(ivf, queries, args.batch, nprobe=nprobe), flat_mb)
+    for dtype in args.quantize:
+        quantized = QuantizedMatrix(dtype=dtype, spill_dir='.')
+        quantized.load(ids, encodings)
+        report(dtype + '+spill', *timed_search(quantized, queries, args.batch),
+               quantized.resident_bytes / 1e6)
+        del quantized
+
+
+if __name__ == "__main__":
+    main()
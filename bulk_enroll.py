@@ -0,0 +1,305 @@
+"""
+Nhập hàng loạt nhân viên từ thư mục ảnh hoặc file CSV
+- Thư mục: mỗi ảnh "MA_Ho Ten.jpg", hoặc mỗi thư mục con "MA_Ho Ten/" chứa
+  nhiều ảnh (mỗi ảnh thành 1 template)
+- CSV: cột employee_id, name, photo (đường dẫn tương đối theo file CSV), birth_date (tuỳ chọn)
+- Ảnh được giải mã ở độ phân giải giảm (IMREAD_REDUCED_*) và encode trên nhiều process
+- Tiến độ ghi vào file JSON lines: chạy lại sẽ bỏ qua ảnh đã xử lý
+- Ảnh không có hoặc có nhiều khuôn mặt được liệt kê trong báo cáo, không được nhập
+- Ghi vào database 1 lần duy nhất ở cuối (add_employees)
+
+Ví dụ:
+    python bulk_enroll.py anh_nhan_vien/ --db employees.db
+    python bulk_enroll.py danh_sach.csv --workers 8 --report anh_loi.csv
+    python bulk_enroll.py anh_nhan_vien/ --greetings gtts   # tổng hợp sẵn lời chào
+"""
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from database import open_employee_database
+from greeting_cache import SYNTHESIZERS, GreetingCache
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _split_name(stem):
+    """'NV001_Nguyễn Văn A' -> ('NV001', 'Nguyễn Văn A'); không có '_' thì tên = mã"""
+    employee_id, _, name = stem.partition('_')
+    return employee_id.strip(), (name.strip() or employee_id.strip())
+
+
+def scan_directory(root):
+    """Danh sách ảnh cần nhập từ thư mục: list dict (photo, employee_id, name, birth_date)"""
+    entries = []
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if entry.is_dir():
+            employee_id, name = _split_name(entry.name)
+            for photo in sorted(os.listdir(entry.path)):
+                if photo.lower().endswith(IMAGE_EXTENSIONS):
+                    entries.append({'photo': os.path.join(entry.path, photo),
+                                    'employee_id': employee_id, 'name': name, 'birth_date': None})
+        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            employee_id, name = _split_name(os.path.splitext(entry.name)[0])
+            entries.append({'photo': entry.path,
+                            'employee_id': employee_id, 'name': name, 'birth_date': None})
+    return entries
+
+
+def read_manifest(csv_file):
+    """Danh sách ảnh cần nhập từ file CSV (employee_id, name, photo, birth_date)"""
+    base = os.path.dirname(os.path.abspath(csv_file))
+    entries = []
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            employee_id = (row.get('employee_id') or '').strip()
+            photo = (row.get('photo') or '').strip()
+            if not employee_id or not photo:
+                print(f"Bỏ qua dòng {line_no}: thiếu employee_id hoặc photo", file=sys.stderr)
+                continue
+            entries.append({
+                'photo': os.path.join(base, photo),
+                'employee_id': employee_id,
+                'name': (row.get('name') or '').strip() or employee_id,
+                'birth_date': (row.get('birth_date') or '').strip() or None,
+            })
+    return entries
+
+
+def _stamp(path):
+    """Kích thước + thời gian sửa: ảnh bị thay thì xử lý lại khi chạy tiếp"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_progress(progress_file):
+    """Kết quả các ảnh đã xử lý ở lần chạy trước: photo -> bản ghi"""
+    done = {}
+    if not os.path.exists(progress_file):
+        return done
+    with open(progress_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # dòng cuối ghi dở khi bị ngắt
+            done[record['photo']] = record
+    return done
+
+
+def decode_image(path, reduce='auto', max_side=1024):
+    """
+    Giải mã ảnh ở độ phân giải giảm ngay trong bộ giải mã JPEG (nhanh, ít RAM)
+    reduce: 1 / 2 / 4 / 8, hoặc 'auto' = hệ số lớn nhất mà cạnh dài vẫn >= max_side
+    Returns: ảnh BGR hoặc None nếu không đọc được
+    """
+    # np.fromfile + imdecode để đọc được đường dẫn có dấu tiếng Việt trên Windows
+    data = np.fromfile(path, dtype=np.uint8)
+    if reduce != 'auto':
+        return cv2.imdecode(data, REDUCED_FLAGS[reduce])
+    if not path.lower().endswith(('.jpg', '.jpeg')):
+        # Chỉ JPEG giảm được độ phân giải khi giải mã, định dạng khác thì thu nhỏ sau
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if image is not None and max(image.shape[:2]) > max_side:
+            scale = max_side / max(image.shape[:2])
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return image
+    # Giải mã thử ở 1/8 (chỉ hệ số DC, rất nhanh) để biết kích thước ảnh
+    factor = 1
+    preview = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if preview is not None:
+        long_side = max(preview.shape[:2]) * 8
+        while factor < 8 and long_side // (factor * 2) >= max_side:
+            factor *= 2
+    return cv2.imdecode(data, REDUCED_FLAGS[factor])
+
+
+_recognizer = None
+
+
+def _init_worker():
+    global _recognizer
+    # Import trong process con để process cha không phải nạp dlib
+    from face_recognition_module import FaceRecognizer
+    _recognizer = FaceRecognizer()
+
+
+def _encode_photo(task):
+    """Chạy ở process worker: giải mã + encode 1 ảnh"""
+    photo, reduce, max_side = task
+    record = {'photo': photo, 'stamp': _stamp(photo)}
+    try:
+        image = decode_image(photo, reduce, max_side)
+        if image is None:
+            record['status'] = 'unreadable'
+            return record
+        encodings = _recognizer.create_face_encodings(image)
+        if not encodings and reduce != 1:
+            # Khuôn mặt quá nhỏ ở độ phân giải giảm: thử lại ảnh gốc
+            image = decode_image(photo, 1)
+            encodings = _recognizer.create_face_encodings(image)
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+        return record
+    record['faces'] = len(encodings)
+    if len(encodings) == 1:
+        record['status'] = 'ok'
+        record['encoding'] = [float(v) for v in encodings[0]]
+    else:
+        record['status'] = 'no_face' if not encodings else 'multiple_faces'
+    return record
+
+
+def encode_photos(photos, progress_file, workers=None, reduce='auto', max_side=1024):
+    """
+    Encode các ảnh chưa có trong progress_file trên nhiều process,
+    mỗi kết quả ghi nối ngay vào progress_file
+    Returns: photo -> bản ghi (gồm cả kết quả các lần chạy trước)
+    """
+    done = load_progress(progress_file)
+    todo = [photo for photo in photos
+            if photo not in done or done[photo].get('stamp') != _stamp(photo)]
+    if len(photos) > len(todo):
+        print(f"Đã xử lý trước đó: {len(photos) - len(todo)} ảnh")
+    if not todo:
+        return done
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Encode {len(todo)} ảnh trên {workers} process...")
+    start = time.perf_counter()
+    ctx = mp.get_context('spawn')
+    with open(progress_file, 'a', encoding='utf-8') as progress, \
+            ctx.Pool(workers, initializer=_init_worker) as pool:
+        tasks = [(photo, reduce, max_side) for photo in todo]
+        for count, record in enumerate(pool.imap_unordered(_encode_photo, tasks, chunksize=4), 1):
+            done[record['photo']] = record
+            progress.write(json.dumps(record, ensure_ascii=False) + '\n')
+            progress.flush()
+            if count % 50 == 0 or count == len(todo):
+                rate = count / (time.perf_counter() - start)
+                print(f"  {count}/{len(todo)} ảnh ({rate:.1f} ảnh/s)")
+    return done
+
+
+def build_records(entries, results, max_templates=10):
+    """
+    Gom encoding theo nhân viên (theo thứ tự ảnh trong danh sách)
+    Returns: (list bản ghi cho add_employees, list ảnh lỗi)
+    """
+    employees = {}
+    problems = []
+    for entry in entries:
+        record = results.get(entry['photo'])
+        if record is None:
+            continue
+        if record['status'] != 'ok':
+            problems.append(dict(entry, status=record['status'], faces=record.get('faces', 0),
+                                 error=record.get('error', '')))
+            continue
+        employee = employees.setdefault(entry['employee_id'], {
+            'name': entry['name'], 'birth_date': entry['birth_date'], 'encodings': []
+        })
+        employee['encodings'].append(record['encoding'])
+    records = [
+        (employee_id, data['name'], np.asarray(data['encodings'][-max_templates:], dtype=np.float64),
+         data['birth_date'])
+        for employee_id, data in employees.items()
+    ]
+    return records, problems
+
+
+def write_report(report_file, problems):
+    with open(report_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['photo', 'employee_id', 'name', 'status', 'faces', 'error'],
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(problems)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nhập hàng loạt nhân viên từ thư mục ảnh / file CSV")
+    parser.add_argument('source', help="Thư mục ảnh hoặc file CSV (employee_id, name, photo, birth_date)")
+    parser.add_argument('--db', default='employees.pkl', help="File database nhân viên (.pkl, .db hoặc .emb)")
+    parser.add_argument('--workers', type=int, default=None, help="Số process encode (mặc định = số core)")
+    parser.add_argument('--reduce', default='auto', choices=['auto', '1', '2', '4', '8'],
+                        help="Hệ số giảm độ phân giải khi giải mã ảnh")
+    parser.add_argument('--max-side', type=int, default=1024,
+                        help="Với --reduce auto: cạnh dài tối thiểu sau khi giảm")
+    parser.add_argument('--progress', default=None,
+                        help="File tiến độ (mặc định <source>.progress.jsonl)")
+    parser.add_argument('--restart', action='store_true', help="Bỏ tiến độ cũ, xử lý lại tất cả ảnh")
+    parser.add_argument('--replace', action='store_true',
+                        help="Ghi đè nhân viên đã có (mặc định bỏ qua)")
+    parser.add_argument('--report', default=None, help="Ghi danh sách ảnh lỗi ra file CSV")
+    parser.add_argument('--dry-run', action='store_true', help="Chỉ encode và báo cáo, không ghi database")
+    parser.add_argument('--greetings', default=None, choices=sorted(SYNTHESIZERS),
+                        help="Tổng hợp sẵn lời chào của nhân viên mới vào greeting_cache/")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        entries = scan_directory(args.source)
+    else:
+        entries = read_manifest(args.source)
+    if not entries:
+        print("Không tìm thấy ảnh nào")
+        return
+    progress_file = args.progress or args.source.rstrip('/\\') + '.progress.jsonl'
+    if args.restart and os.path.exists(progress_file):
+        os.remove(progress_file)
+
+    db = open_employee_database(args.db)
+    try:
+        if not args.replace:
+            existing = {entry['employee_id'] for entry in entries
+                        if db.get_employee(entry['employee_id']) is not None}
+            if existing:
+                print(f"Bỏ qua {len(existing)} nhân viên đã có trong database (dùng --replace để ghi đè)")
+                entries = [entry for entry in entries if entry['employee_id'] not in existing]
+
+        photos = list(dict.fromkeys(entry['photo'] for entry in entries))
+        reduce = args.reduce if args.reduce == 'auto' else int(args.reduce)
+        results = encode_photos(photos, progress_file, args.workers, reduce, args.max_side)
+        records, problems = build_records(entries, results)
+
+        for problem in problems:
+            reason = {
+                'no_face': "không thấy khuôn mặt",
+                'multiple_faces': f"{problem['faces']} khuôn mặt",
+                'unreadable': "không đọc được ảnh",
+            }.get(problem['status'], problem['error'])
+            print(f"  ⚠️ {problem['photo']} ({problem['employee_id']}): {reason}")
+        if args.report:
+            write_report(args.report, problems)
+
+        if args.dry_run:
+            print(f"Dry run: {len(records)} nhân viên hợp lệ, {len(problems)} ảnh lỗi")
+            return
+        added = db.add_employees(records)
+        print(f"✅ Đã nhập {added} nhân viên, {len(problems)} ảnh lỗi")
+        if args.greetings:
+            cache = GreetingCache(synthesizer=SYNTHESIZERS[args.greetings]())
+            count = cache.warm([(employee_id, name) for employee_id, name, _, _ in records])
+            print(f"Đã tổng hợp {count} lời chào")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
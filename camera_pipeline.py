@@ -0,0 +1,478 @@
+"""
+Pipeline đa luồng cho camera: capture -> nhận diện -> hiển thị
+- Thread capture luôn giữ frame mới nhất (không để buffer camera bị dồn)
+- Thread nhận diện chỉ xử lý frame mới nhất, bỏ qua các frame cũ
+- Vòng lặp Tkinter chỉ việc hiển thị frame mới nhất với kết quả mới nhất
+- Scheduler quyết định khi nào cần nhận diện lại, các frame còn lại dùng kết quả cache
+- Hỗ trợ nhiều camera (device index, file video, URL) dùng chung 1 pool worker
+"""
+import json
+import math
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from detection_planner import DetectionPlanner
+from face_detectors import create_detector
+from face_tracker import FaceTracker
+
+
+class LatestFrame:
+    """Slot lưu frame mới nhất (ghi đè frame cũ, không xếp hàng)"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._timestamp = 0.0
+        self.listeners = []  # callback gọi sau mỗi frame mới
+
+    def put(self, frame, timestamp=None):
+        """Ghi frame mới, đánh thức các thread đang chờ"""
+        with self._cond:
+            self._frame = frame
+            self._seq += 1
+            self._timestamp = timestamp if timestamp is not None else time.monotonic()
+            self._cond.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def get(self):
+        """Returns: (seq, frame, timestamp) của frame mới nhất"""
+        with self._cond:
+            return self._seq, self._frame, self._timestamp
+
+    def wait_newer(self, seq, timeout=None):
+        """
+        Chờ đến khi có frame mới hơn seq
+        Returns: (seq, frame, timestamp) hoặc None nếu hết timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > seq, timeout):
+                return None
+            return self._seq, self._frame, self._timestamp
+
+
+class RateMeter:
+    """Đo tốc độ (lần/giây) bằng trung bình trượt"""
+
+    def __init__(self, smoothing=0.9):
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self._last = None
+
+    def tick(self, now=None):
+        now = now if now is not None else time.monotonic()
+        if self._last is not None:
+            dt = now - self._last
+            if dt > 0:
+                instant = 1.0 / dt
+                if self.rate == 0.0:
+                    self.rate = instant
+                else:
+                    self.rate = self.smoothing * self.rate + (1 - self.smoothing) * instant
+        self._last = now
+        return self.rate
+
+
+def parse_source(source):
+    """Chuyển chuỗi cấu hình thành device index (int) hoặc đường dẫn/URL"""
+    if isinstance(source, int):
+        return source
+    source = str(source).strip()
+    if source.isdigit():
+        return int(source)
+    return source
+
+
+def load_camera_config(path):
+    """
+    Đọc cấu hình camera từ file JSON, dạng list:
+        [{"source": 0, "name": "Cửa chính", "detector": "haar",
+          "detection": {"roi": [0.25, 0, 0.5, 1]}},
+         {"source": "rtsp://...", "detector": "dnn",
+          "detector_options": {"confidence": 0.6},
+          "detection": {"tiled": true, "scale": 0.2}}]
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        cameras = json.load(f)
+    return [camera if isinstance(camera, dict) else {'source': camera} for camera in cameras]
+
+
+def open_video_source(source):
+    """
+    Mở nguồn video: device index, file video hoặc URL (rtsp/http)
+    Returns: cv2.VideoCapture (cần kiểm tra isOpened())
+    """
+    source = parse_source(source)
+    if isinstance(source, int):
+        if os.name == 'nt':
+            # Sử dụng DSHOW backend trên Windows để giảm latency
+            camera = cv2.VideoCapture(source, cv2.CAP_DSHOW)
+        else:
+            camera = cv2.VideoCapture(source)
+        if camera.isOpened():
+            # Cấu hình camera cho hiệu suất tối ưu
+            camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            camera.set(cv2.CAP_PROP_FPS, 30)
+            camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # giảm buffer để giảm lag
+        return camera
+    return cv2.VideoCapture(source)
+
+
+class CameraCapture(threading.Thread):
+    """
+    Thread đọc camera liên tục, chỉ giữ lại frame mới nhất
+    Với file video: phát theo đúng FPS của file (realtime) và có thể lặp lại
+    """
+
+    def __init__(self, camera, frames=None, realtime=False, loop=False):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.frames = frames if frames is not None else LatestFrame()
+        self.realtime = realtime
+        self.loop = loop
+        self.finished = False
+        self.fps = RateMeter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        interval = 0.0
+        if self.realtime:
+            file_fps = self.camera.get(cv2.CAP_PROP_FPS) or 30.0
+            interval = 1.0 / file_fps
+        next_time = time.monotonic()
+
+        while not self._stop_event.is_set():
+            ret, frame = self.camera.read()
+            if not ret:
+                if self.realtime:
+                    # Hết file video
+                    if not self.loop:
+                        self.finished = True
+                        break
+                    self.camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                # Camera chưa sẵn sàng hoặc mất kết nối tạm thời
+                time.sleep(0.01)
+                continue
+            if interval:
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+                else:
+                    next_time = time.monotonic()
+            self.frames.put(frame)
+            self.fps.tick()
+
+    def stop(self, timeout=1.0):
+        """Dừng thread capture (không giải phóng camera)"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class RecognitionScheduler:
+    """
+    Quyết định frame nào cần chạy nhận diện
+    - Có người trước camera: nhận diện mỗi N frame, N tính từ chi phí detector
+      đo được và ngân sách CPU (cpu_budget), nhưng không chậm hơn max_latency
+    - Không có ai và không có chuyển động: chỉ kiểm tra định kỳ (idle_interval)
+    - Chuyển động mạnh so với frame nhận diện gần nhất: nhận diện sớm hơn, nhưng chỉ
+      rút ngắn khoảng cách N (chia motion_speedup), không bỏ ngân sách CPU
+    """
+
+    def __init__(self, process_every_n_frames=3, cpu_budget=0.5, max_latency=0.5,
+                 idle_interval=2.0, motion_threshold=0.02, pixel_threshold=25,
+                 motion_speedup=2, min_motion_interval=0.1):
+        """
+        cpu_budget: tỉ lệ thời gian 1 core dành cho nhận diện (0-1)
+        max_latency: thời gian tối đa (giây) giữa 2 lần nhận diện khi có người
+        idle_interval: thời gian (giây) giữa 2 lần kiểm tra khi không có ai
+        motion_threshold: tỉ lệ pixel thay đổi để coi là có chuyển động
+        pixel_threshold: độ chênh lệch mức xám để coi 1 pixel là thay đổi
+        motion_speedup: khi có chuyển động, nhận diện sau N / motion_speedup frame
+        min_motion_interval: thời gian (giây) tối thiểu giữa 2 lần nhận diện do chuyển động
+        """
+        self.process_every_n_frames = process_every_n_frames
+        self.cpu_budget = cpu_budget
+        self.max_latency = max_latency
+        self.idle_interval = idle_interval
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold = pixel_threshold
+        self.motion_speedup = motion_speedup
+        self.min_motion_interval = min_motion_interval
+
+        self.detector_cost = None      # giây/lần, trung bình trượt
+        self.frame_interval = 1 / 30.0  # giây/frame, trung bình trượt
+        self.motion = 0.0
+        self.motion_mask = None  # mask pixel thay đổi (thumbnail 64x48)
+        self.faces_present = False
+
+        self._reference = None  # thumbnail của frame nhận diện gần nhất
+        self._last_seq = None
+        self._last_time = None
+        self._last_frame_time = None
+        self._last_frame_seq = None
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, (64, 48), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _motion_score(self, thumb):
+        """Tỉ lệ pixel thay đổi so với frame nhận diện gần nhất"""
+        if self._reference is None:
+            self.motion_mask = None
+            return 1.0
+        diff = cv2.absdiff(thumb, self._reference)
+        self.motion_mask = diff > self.pixel_threshold
+        return float(np.count_nonzero(self.motion_mask)) / diff.size
+
+    def _update_every_n(self):
+        """Tính lại N từ chi phí detector và tốc độ camera"""
+        max_n = max(1, int(self.max_latency / self.frame_interval))
+        if self.detector_cost is None:
+            return
+        budget_per_frame = self.frame_interval * self.cpu_budget
+        n = math.ceil(self.detector_cost / budget_per_frame) if budget_per_frame > 0 else max_n
+        self.process_every_n_frames = min(max(1, n), max_n)
+
+    def _motion_allowed(self, frame_seq, now):
+        """Chuyển động chỉ được rút ngắn khoảng cách giữa 2 lần nhận diện, có giới hạn"""
+        min_frames = max(1, self.process_every_n_frames // self.motion_speedup)
+        return (frame_seq - self._last_seq >= min_frames
+                and now - self._last_time >= self.min_motion_interval)
+
+    def should_process(self, frame_seq, frame, timestamp=None):
+        """Frame này có cần chạy nhận diện không"""
+        now = timestamp if timestamp is not None else time.monotonic()
+        # Worker có thể bỏ qua frame nên chia cho số frame đã trôi qua
+        if self._last_frame_time is not None and frame_seq > self._last_frame_seq:
+            interval = (now - self._last_frame_time) / (frame_seq - self._last_frame_seq)
+            self.frame_interval = 0.9 * self.frame_interval + 0.1 * interval
+        self._last_frame_time = now
+        self._last_frame_seq = frame_seq
+
+        thumb = self._thumbnail(frame)
+        self.motion = self._motion_score(thumb)
+
+        if self._last_seq is None:
+            process = True
+        elif self.motion >= self.motion_threshold and self._motion_allowed(frame_seq, now):
+            process = True
+        elif self.faces_present:
+            process = frame_seq - self._last_seq >= self.process_every_n_frames
+        else:
+            process = now - self._last_time >= self.idle_interval
+
+        if process:
+            self._reference = thumb
+            self._last_seq = frame_seq
+            self._last_time = now
+        return process
+
+    def record_result(self, faces, cost):
+        """Cập nhật chi phí detector đo được và trạng thái có người hay không"""
+        if self.detector_cost is None:
+            self.detector_cost = cost
+        else:
+            self.detector_cost = 0.8 * self.detector_cost + 0.2 * cost
+        self.faces_present = len(faces) > 0
+        self._update_every_n()
+
+
+class RecognitionResult:
+    """Kết quả nhận diện của một frame"""
+
+    def __init__(self, seq, frame_seq, faces, latency):
+        self.seq = seq
+        self.frame_seq = frame_seq
+        self.faces = faces
+        self.latency = latency  # giây
+        self.timestamp = time.monotonic()
+
+
+class CameraStream:
+    """
+    Một nguồn camera với trạng thái riêng: capture, scheduler, tracker, kết quả
+    Việc nhận diện do RecognitionPool dùng chung đảm nhận
+    """
+
+    def __init__(self, name, camera, realtime=False, loop=False, scheduler=None, tracker=None,
+                 detector=None, planner=None):
+        """
+        detector: FaceDetector riêng cho camera này (None = detector mặc định
+            của FaceRecognizer)
+        planner: DetectionPlanner (ROI, tỉ lệ detect, tile) của camera này
+        """
+        self.name = name
+        self.camera = camera
+        self.detector = detector
+        self.planner = planner if planner is not None else DetectionPlanner()
+        self.capture = CameraCapture(camera, realtime=realtime, loop=loop)
+        self.frames = self.capture.frames
+        self.scheduler = scheduler if scheduler is not None else RecognitionScheduler()
+        self.tracker = tracker if tracker is not None else FaceTracker()
+
+        self.recognition_fps = RateMeter()
+        self.dropped_frames = 0
+        self.skipped_frames = 0
+        self.processed_frames = 0
+
+        # Chỉ 1 worker xử lý stream tại 1 thời điểm (tracker/scheduler không chia sẻ)
+        self.busy = threading.Lock()
+        self.last_seen_seq = 0
+        self._result_seq = 0
+        self._result = None
+        self._result_lock = threading.Lock()
+        self.listeners = []  # callback(stream, result) gọi ở thread nhận diện
+
+    @classmethod
+    def open(cls, source, name=None, loop=True, detector=None, detector_options=None,
+             detection=None, **kwargs):
+        """
+        Mở stream từ device index, file video hoặc URL
+        detector: tên detector ('hog', 'haar', 'dnn') riêng cho camera này
+        detection: tham số DetectionPlanner, ví dụ {"roi": [0.2, 0, 0.6, 1], "tiled": true}
+        """
+        if detector is not None:
+            detector = create_detector(detector, **(detector_options or {}))
+        if detection is not None:
+            kwargs['planner'] = DetectionPlanner(**detection)
+        source = parse_source(source)
+        camera = open_video_source(source)
+        # File video cần phát theo FPS thật, camera/URL tự có nhịp riêng
+        realtime = isinstance(source, str) and os.path.isfile(source)
+        return cls(name if name is not None else str(source), camera,
+                   realtime=realtime, loop=loop and realtime, detector=detector, **kwargs)
+
+    @property
+    def latest_result(self):
+        """Kết quả nhận diện mới nhất (hoặc None)"""
+        with self._result_lock:
+            return self._result
+
+    def publish(self, faces, frame_seq, latency):
+        with self._result_lock:
+            self._result_seq += 1
+            self._result = result = RecognitionResult(self._result_seq, frame_seq, faces, latency)
+        self.processed_frames += 1
+        self.recognition_fps.tick()
+        for listener in self.listeners:
+            listener(self, result)
+
+    def start(self):
+        self.capture.start()
+
+    def stop(self):
+        """Dừng capture và giải phóng camera"""
+        self.capture.stop()
+        self.camera.release()
+
+
+class RecognitionPool:
+    """
+    Pool thread nhận diện dùng chung 1 FaceRecognizer cho nhiều camera
+    Mỗi worker lần lượt (round-robin) lấy frame mới nhất của stream đang rảnh,
+    các frame đến trong lúc đang nhận diện sẽ bị bỏ qua
+    face_recognizer có thể là ProcessPoolRecognizer, khi đó thread chỉ điều
+    phối còn việc nhận diện chạy ở các process worker
+    """
+
+    def __init__(self, face_recognizer, streams, num_workers=1):
+        self.face_recognizer = face_recognizer
+        self.streams = list(streams)
+        self.num_workers = max(1, num_workers)
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._next = 0
+
+        for stream in self.streams:
+            stream.frames.listeners.append(self._notify)
+
+    def _notify(self):
+        with self._cond:
+            self._cond.notify()
+
+    def start(self):
+        for idx in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"recognition-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=1.0):
+        """Dừng tất cả worker"""
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        for stream in self.streams:
+            if self._notify in stream.frames.listeners:
+                stream.frames.listeners.remove(self._notify)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            handled = False
+            count = len(self.streams)
+            with self._cond:
+                start = self._next
+                self._next = (self._next + 1) % max(count, 1)
+            for offset in range(count):
+                if self._process_stream(self.streams[(start + offset) % count]):
+                    handled = True
+            if not handled:
+                with self._cond:
+                    self._cond.wait(0.05)
+
+    def _process_stream(self, stream):
+        """Nhận diện frame mới nhất của stream nếu có. Returns: True nếu đã xử lý"""
+        if stream.frames.get()[0] <= stream.last_seen_seq:
+            return False
+        if not stream.busy.acquire(blocking=False):
+            return False
+        try:
+            frame_seq, frame, timestamp = stream.frames.get()
+            if frame_seq <= stream.last_seen_seq:
+                return False
+            if stream.last_seen_seq:
+                stream.dropped_frames += frame_seq - stream.last_seen_seq - 1
+            stream.last_seen_seq = frame_seq
+
+            if not stream.scheduler.should_process(frame_seq, frame, timestamp):
+                stream.skipped_frames += 1
+                return True
+
+            start = time.perf_counter()
+            try:
+                skip = stream.tracker.locations_to_skip(timestamp)
+                stream.planner.set_hints(
+                    [face['location'] for face in stream.tracker.predicted_faces(timestamp)],
+                    stream.scheduler.motion_mask
+                )
+                faces = self.face_recognizer.detect_and_recognize(
+                    frame, skip, detector=stream.detector, planner=stream.planner
+                )
+                if faces is None:
+                    # Process pool quá tải, frame bị bỏ qua
+                    stream.dropped_frames += 1
+                    return True
+                faces = stream.tracker.update(faces, timestamp)
+            except Exception as e:
+                print(f"Lỗi nhận diện ({stream.name}): {e}")
+                return True
+            latency = time.perf_counter() - start
+            stream.scheduler.record_result(faces, latency)
+            stream.publish(faces, frame_seq, latency)
+            return True
+        finally:
+            stream.busy.release()
@@ -1,39 +1,326 @@
 """
 Database module để quản lý thông tin nhân viên và embedding khuôn mặt
 """
+import atexit
+import bisect
+import calendar
+import gzip
 import pickle
+import io
 import os
+import queue
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
 from datetime import datetime
 import csv
+import json
+
+import numpy as np
+
+# Header mỗi bản ghi journal: độ dài payload, crc32 payload
+_RECORD_HEADER = struct.Struct('<II')
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS employees (
+    employee_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    birth_date TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_employees_name ON employees (name);
+CREATE INDEX IF NOT EXISTS idx_employees_created_at ON employees (created_at);
+CREATE TABLE IF NOT EXISTS face_templates (
+    employee_id TEXT NOT NULL,
+    template_no INTEGER NOT NULL,
+    encoding BLOB NOT NULL,
+    PRIMARY KEY (employee_id, template_no)
+);
+"""
+
+
+def _fsync_dir(path):
+    """fsync thư mục chứa file sau os.replace (bỏ qua trên Windows)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _end_torn_line(path):
+    """Dòng cuối ghi dở (crash) của file CSV / JSON lines: xuống dòng để dòng mới không dính vào"""
+    try:
+        with open(path, 'rb+') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+    except OSError:
+        pass
+
+
+class _FileLock:
+    """
+    Khoá độc quyền giữa các process trên 1 file khoá (flock / msvcrt.locking),
+    hệ điều hành tự nhả khi process chết; lồng nhau trong cùng object được
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._depth = 0
+    
+    def acquire(self, blocking=True):
+        """Returns: False nếu blocking=False và process khác đang giữ khoá"""
+        if self._depth:
+            self._depth += 1
+            return True
+        f = open(self.path, 'a+b')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            f.close()
+            if blocking:
+                raise
+            return False
+        self._file = f
+        self._depth = 1
+        return True
+    
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            # Đóng file là nhả khoá
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self.release()
+
 
 class EmployeeDatabase:
-    def __init__(self, db_file='employees.pkl'):
+    """
+    Database nhân viên: snapshot pickle (employees.pkl) + journal chỉ ghi nối thêm
+    - Mỗi thay đổi ghi 1 bản ghi vào employees.pkl.journal (O(1), không ghi lại cả file)
+    - Khi load: đọc snapshot rồi phát lại journal; bản ghi cuối ghi dở (crash) bị bỏ qua
+    - Journal dài quá compact_every bản ghi thì gộp vào snapshot ở thread nền,
+      snapshot ghi ra file tạm rồi os.replace nên không bao giờ hỏng file chính
+    """
+    
+    def __init__(self, db_file='employees.pkl', compact_every=1000, fsync=True):
+        """
+        compact_every: số bản ghi journal trước khi gộp vào snapshot
+        fsync: fsync sau mỗi bản ghi (an toàn khi mất điện, chậm hơn)
+        """
         self.db_file = db_file
+        self.journal_file = db_file + '.journal'
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._journal = None
+        self._journal_records = 0
+        self._compactor = None
         self.employees = self.load_database()
     
     def load_database(self):
-        """Load database từ file pickle"""
+        """Load snapshot pickle rồi phát lại journal"""
+        employees = {}
         if os.path.exists(self.db_file):
             with open(self.db_file, 'rb') as f:
-                return pickle.load(f)
-        return {}
+                employees = pickle.load(f)
+        # Journal cũ còn lại nếu lần gộp trước bị ngắt giữa chừng
+        rotated = self.journal_file + '.1'
+        if os.path.exists(rotated):
+            self._replay(rotated, employees)
+        if os.path.exists(self.journal_file):
+            self._journal_records = self._replay(self.journal_file, employees)
+        return employees
+    
+    def _replay(self, path, employees):
+        """Áp dụng các bản ghi journal vào employees, cắt bỏ phần đuôi ghi dở"""
+        count = 0
+        good_offset = 0
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                length, checksum = _RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                try:
+                    op, employee_id, data = pickle.loads(payload)
+                except Exception:
+                    break
+                if op == 'put':
+                    employees[employee_id] = data
+                elif op == 'delete':
+                    employees.pop(employee_id, None)
+                count += 1
+                good_offset = f.tell()
+        if good_offset < os.path.getsize(path):
+            print(f"Journal {path} bị ghi dở ở cuối, bỏ qua từ byte {good_offset}")
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+        return count
+    
+    def _append(self, op, employee_id, data=None):
+        """Ghi 1 bản ghi journal: [độ dài][crc32][pickle(op, id, data)]"""
+        self._append_many([(op, employee_id, data)])
+    
+    def _append_many(self, records):
+        """Ghi nhiều bản ghi journal trong 1 lần write + 1 lần fsync"""
+        chunks = []
+        for record in records:
+            payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            chunks.append(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_file, 'ab')
+            self._journal.write(b''.join(chunks))
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._journal_records += len(chunks)
+            if self.compact_every and self._journal_records >= self.compact_every:
+                self.compact(background=True)
+    
+    def compact(self, background=False):
+        """Gộp journal vào snapshot (ghi file tạm, fsync, os.replace)"""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                if not background:
+                    self._compactor.join()
+                else:
+                    return
+            # Chuyển journal hiện tại sang .1, bản ghi mới ghi vào journal mới
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            rotated = self.journal_file + '.1'
+            if os.path.exists(self.journal_file):
+                if os.path.exists(rotated):
+                    # Lần gộp trước chưa xong: nối vào .1 để không mất bản ghi
+                    with open(rotated, 'ab') as dst, open(self.journal_file, 'rb') as src:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(self.journal_file)
+                else:
+                    os.replace(self.journal_file, rotated)
+            self._journal_records = 0
+            snapshot = {emp_id: dict(data) for emp_id, data in self.employees.items()}
+        
+        if background:
+            self._compactor = threading.Thread(
+                target=self._write_snapshot, args=(snapshot, rotated), daemon=True
+            )
+            self._compactor.start()
+        else:
+            self._write_snapshot(snapshot, rotated)
+    
+    def _write_snapshot(self, snapshot, rotated):
+        tmp_file = self.db_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.db_file)
+        _fsync_dir(self.db_file)
+        if os.path.exists(rotated):
+            os.remove(rotated)
     
     def save_database(self):
-        """Lưu database vào file pickle"""
-        with open(self.db_file, 'wb') as f:
-            pickle.dump(self.employees, f)
+        """Lưu toàn bộ database vào snapshot pickle (gộp journal ngay)"""
+        self.compact()
+    
+    def close(self):
+        """Chờ gộp nền xong và đóng journal"""
+        with self._lock:
+            compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
     
     def add_employee(self, employee_id, name, face_encoding, birth_date=None):
         """Thêm nhân viên mới vào database"""
-        self.employees[employee_id] = {
+        employee = {
             'name': name,
             'face_encoding': face_encoding,
+            'face_encodings': [face_encoding],
             'birth_date': birth_date,
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
-        self.save_database()
+        with self._lock:
+            self.employees[employee_id] = employee
+            self._append('put', employee_id, employee)
         return True
     
+    def add_employees(self, records):
+        """
+        Thêm hàng loạt nhân viên (nhập từ thư mục ảnh) trong 1 lần ghi journal
+        records: list (mã, tên, encoding hoặc list template, ngày sinh)
+        Returns: số nhân viên đã thêm
+        """
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        entries = []
+        for employee_id, name, face_encodings, birth_date in records:
+            templates = list(np.atleast_2d(np.asarray(face_encodings)))
+            entries.append(('put', employee_id, {
+                'name': name,
+                'face_encoding': templates[0],
+                'face_encodings': templates,
+                'birth_date': birth_date,
+                'created_at': created_at
+            }))
+        with self._lock:
+            for _, employee_id, employee in entries:
+                self.employees[employee_id] = employee
+            if entries:
+                self._append_many(entries)
+        return len(entries)
+    
+    def add_face_template(self, employee_id, face_encoding, max_templates=10):
+        """
+        Thêm 1 ảnh mẫu khuôn mặt (đeo kính, ánh sáng sáng/tối...) cho nhân viên
+        'face_encoding' vẫn là template đầu tiên để tương thích dữ liệu cũ
+        Returns: số template hiện có, hoặc 0 nếu không có nhân viên
+        """
+        with self._lock:
+            employee = self.employees.get(employee_id)
+            if employee is None:
+                return 0
+            templates = employee.get('face_encodings') or [employee['face_encoding']]
+            templates = (templates + [face_encoding])[-max_templates:]
+            employee = dict(employee, face_encodings=templates, face_encoding=templates[0])
+            self.employees[employee_id] = employee
+            self._append('put', employee_id, employee)
+            return len(templates)
+    
     def get_employee(self, employee_id):
         """Lấy thông tin nhân viên theo ID"""
         return self.employees.get(employee_id)
@@ -44,54 +331,1252 @@ class EmployeeDatabase:
     
     def delete_employee(self, employee_id):
         """Xóa nhân viên khỏi database"""
-        if employee_id in self.employees:
-            del self.employees[employee_id]
-            self.save_database()
-            return True
+        with self._lock:
+            if employee_id in self.employees:
+                del self.employees[employee_id]
+                self._append('delete', employee_id)
+                return True
         return False
 
 
+class SQLiteEmployeeDatabase:
+    """
+    Database nhân viên trên SQLite (WAL) - cùng API với EmployeeDatabase
+    - Thông tin nhân viên nằm trong các cột có index
+    - Encoding lưu dạng BLOB float32 thô, đọc hàng loạt thẳng vào ma trận NumPy
+    - Nhiều process (ứng dụng chính, headless, báo cáo) đọc cùng lúc được
+      mà không phải load cả database vào từng process
+    """
+    
+    def __init__(self, db_file='employees.db', dim=128):
+        self.db_file = db_file
+        self.dim = dim
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.executescript(SQLITE_SCHEMA)
+    
+    def _encode(self, face_encoding):
+        return np.asarray(face_encoding, dtype=np.float32).reshape(self.dim).tobytes()
+    
+    def _decode(self, blob):
+        return np.frombuffer(blob, dtype=np.float32)
+    
+    def _to_dict(self, row, templates):
+        employee_id, name, birth_date, created_at = row
+        return {
+            'name': name,
+            'face_encoding': templates[0] if templates else None,
+            'face_encodings': templates,
+            'birth_date': birth_date,
+            'created_at': created_at,
+        }
+    
+    def add_employee(self, employee_id, name, face_encoding, birth_date=None):
+        """Thêm nhân viên mới vào database"""
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM face_templates WHERE employee_id = ?', (employee_id,))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO employees (employee_id, name, birth_date, created_at) '
+                'VALUES (?, ?, ?, ?)',
+                (employee_id, name, birth_date, created_at)
+            )
+            self.conn.execute(
+                'INSERT INTO face_templates (employee_id, template_no, encoding) VALUES (?, 0, ?)',
+                (employee_id, self._encode(face_encoding))
+            )
+        return True
+    
+    def add_employees(self, records):
+        """
+        Thêm hàng loạt nhân viên (nhập từ thư mục ảnh) trong 1 transaction
+        records: list (mã, tên, encoding hoặc list template, ngày sinh)
+        Returns: số nhân viên đã thêm
+        """
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        employees, templates = [], []
+        for employee_id, name, face_encodings, birth_date in records:
+            employees.append((employee_id, name, birth_date, created_at))
+            vectors = np.asarray(face_encodings, dtype=np.float32).reshape(-1, self.dim)
+            templates += [(employee_id, no, vector.tobytes()) for no, vector in enumerate(vectors)]
+        with self._lock, self.conn:
+            self.conn.executemany('DELETE FROM face_templates WHERE employee_id = ?',
+                                  [(row[0],) for row in employees])
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO employees (employee_id, name, birth_date, created_at) '
+                'VALUES (?, ?, ?, ?)',
+                employees
+            )
+            self.conn.executemany(
+                'INSERT INTO face_templates (employee_id, template_no, encoding) VALUES (?, ?, ?)',
+                templates
+            )
+        return len(employees)
+    
+    def add_face_template(self, employee_id, face_encoding, max_templates=10):
+        """Thêm 1 ảnh mẫu khuôn mặt, giữ tối đa max_templates ảnh mới nhất"""
+        with self._lock, self.conn:
+            if self.conn.execute('SELECT 1 FROM employees WHERE employee_id = ?',
+                                 (employee_id,)).fetchone() is None:
+                return 0
+            (last,) = self.conn.execute(
+                'SELECT COALESCE(MAX(template_no), -1) FROM face_templates WHERE employee_id = ?',
+                (employee_id,)
+            ).fetchone()
+            self.conn.execute(
+                'INSERT INTO face_templates (employee_id, template_no, encoding) VALUES (?, ?, ?)',
+                (employee_id, last + 1, self._encode(face_encoding))
+            )
+            self.conn.execute(
+                'DELETE FROM face_templates WHERE employee_id = ? AND template_no <= ?',
+                (employee_id, last + 1 - max_templates)
+            )
+            (count,) = self.conn.execute(
+                'SELECT COUNT(*) FROM face_templates WHERE employee_id = ?', (employee_id,)
+            ).fetchone()
+            return count
+    
+    def get_employee(self, employee_id):
+        """Lấy thông tin nhân viên theo ID"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT employee_id, name, birth_date, created_at FROM employees WHERE employee_id = ?',
+                (employee_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            templates = [
+                self._decode(blob) for (blob,) in self.conn.execute(
+                    'SELECT encoding FROM face_templates WHERE employee_id = ? ORDER BY template_no',
+                    (employee_id,)
+                )
+            ]
+        return self._to_dict(row, templates)
+    
+    def get_all_employees(self):
+        """Lấy danh sách tất cả nhân viên (dict giống EmployeeDatabase)"""
+        ids, templates = self.load_face_templates()
+        by_id = dict(zip(ids, templates))
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT employee_id, name, birth_date, created_at FROM employees ORDER BY employee_id'
+            ).fetchall()
+        return {row[0]: self._to_dict(row, list(by_id.get(row[0], []))) for row in rows}
+    
+    def count(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM employees').fetchone()[0]
+    
+    def load_face_templates(self):
+        """
+        Đọc hàng loạt encoding vào 1 ma trận float32
+        Returns: (list mã nhân viên, list ma trận template (T x dim) tương ứng)
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT employee_id, encoding FROM face_templates ORDER BY employee_id, template_no'
+            ).fetchall()
+        if not rows:
+            return [], []
+        matrix = np.frombuffer(b''.join(blob for _, blob in rows), dtype=np.float32)
+        matrix = matrix.reshape(-1, self.dim)
+        ids, starts = [], []
+        for row_no, (employee_id, _) in enumerate(rows):
+            if not ids or ids[-1] != employee_id:
+                ids.append(employee_id)
+                starts.append(row_no)
+        return ids, np.split(matrix, starts[1:])
+    
+    def delete_employee(self, employee_id):
+        """Xóa nhân viên khỏi database"""
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM face_templates WHERE employee_id = ?', (employee_id,))
+            cursor = self.conn.execute('DELETE FROM employees WHERE employee_id = ?', (employee_id,))
+            return cursor.rowcount > 0
+    
+    def migrate_from_pickle(self, pickle_file='employees.pkl'):
+        """Chép toàn bộ nhân viên từ database pickle (kể cả journal) trong 1 transaction"""
+        source = EmployeeDatabase(pickle_file)
+        employees = source.get_all_employees()
+        source.close()
+        with self._lock, self.conn:
+            for employee_id, data in employees.items():
+                self.conn.execute('DELETE FROM face_templates WHERE employee_id = ?', (employee_id,))
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO employees (employee_id, name, birth_date, created_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (employee_id, data['name'], data.get('birth_date'), data.get('created_at'))
+                )
+                templates = data.get('face_encodings') or [data['face_encoding']]
+                self.conn.executemany(
+                    'INSERT INTO face_templates (employee_id, template_no, encoding) VALUES (?, ?, ?)',
+                    [(employee_id, no, self._encode(enc)) for no, enc in enumerate(templates)]
+                )
+        return len(employees)
+    
+    def save_database(self):
+        """Mỗi thay đổi đã được commit, giữ để tương thích API"""
+        pass
+    
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class MmapEmployeeDatabase:
+    """
+    Database nhân viên dạng ma trận encoding map từ file - khởi động gần như tức thì
+    - employees.emb: header + các hàng (mã nhân viên 64 byte, encoding float32),
+      mỗi hàng 1 template; thêm hàng chỉ ghi nối cuối file, số hàng trong header
+      cập nhật sau cùng nên hàng ghi dở khi crash bị bỏ qua
+    - employees.emb.meta: journal JSON lines tên / ngày sinh, chỉ đọc khi cần
+    - FaceRecognizer map thẳng cột encoding (np.memmap), các process dùng chung page
+    - Xoá chỉ đánh dấu hàng; gộp file chỉ bằng compact() (python database.py --compact),
+      mỗi lần gộp tăng generation trong header
+    - Mọi lần ghi giữ khoá employees.emb.lock và đọc lại header trước: process khác
+      đã thêm hàng hoặc gộp file thì dựng lại ánh xạ hàng trước khi ghi
+    """
+    
+    MAGIC = b'EMB1'
+    HEADER = struct.Struct('<4sIQQ')  # magic, dim, số hàng, generation (số lần gộp)
+    HEADER_SIZE = 64
+    ID_SIZE = 64  # byte UTF-8 tối đa của 1 mã nhân viên
+    
+    def __init__(self, db_file='employees.emb', dim=128):
+        self.db_file = db_file
+        self.meta_file = db_file + '.meta'
+        self.dim = dim
+        self.row_dtype = np.dtype([('id', f'S{self.ID_SIZE}'), ('encoding', np.float32, (dim,))])
+        self._lock = threading.RLock()
+        self._file_lock = _FileLock(db_file + '.lock')
+        self._meta = None  # load lần đầu khi cần tên / ngày sinh
+        self._rows = None  # mã nhân viên -> list hàng, dựng khi cần
+        with self._file_lock:
+            if not os.path.exists(db_file):
+                self._create(db_file, np.zeros(0, self.row_dtype))
+            self._open()
+    
+    def _create(self, path, records, generation=0):
+        """Ghi file mới (file tạm rồi os.replace)"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            header = self.HEADER.pack(self.MAGIC, self.dim, len(records), generation)
+            f.write(header.ljust(self.HEADER_SIZE, b'\0'))
+            f.write(np.ascontiguousarray(records, dtype=self.row_dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(path)
+    
+    def _read_header(self):
+        """Returns: (số hàng, generation) đọc từ file"""
+        with open(self.db_file, 'rb') as f:
+            magic, dim, count, generation = self.HEADER.unpack(f.read(self.HEADER.size))
+        if magic != self.MAGIC or dim != self.dim:
+            raise ValueError(f"File {self.db_file} không phải embedding store hợp lệ")
+        return count, generation
+    
+    def _open(self):
+        self.count, self.generation = self._read_header()
+        self._rows = None
+    
+    def _refresh(self):
+        """Gọi khi đang giữ khoá file, trước khi ghi: theo kịp thay đổi của process khác"""
+        if self._read_header() != (self.count, self.generation):
+            self._open()
+            self._meta = None
+    
+    def _records(self, mode='r'):
+        if self.count == 0:
+            return np.zeros(0, self.row_dtype)
+        return np.memmap(self.db_file, dtype=self.row_dtype, mode=mode, offset=self.HEADER_SIZE,
+                         shape=(self.count,))
+    
+    def _decoded_ids(self):
+        """Mã nhân viên từng hàng (None với hàng đã xoá)"""
+        raw_ids = np.asarray(self._records()['id']).tolist()
+        return [raw.decode('utf-8') if raw else None for raw in raw_ids]
+    
+    def _row_map(self):
+        if self._rows is None:
+            rows = {}
+            for row, employee_id in enumerate(self._decoded_ids()):
+                if employee_id is not None:
+                    rows.setdefault(employee_id, []).append(row)
+            self._rows = rows
+        return self._rows
+    
+    def metadata(self):
+        """Tên / ngày sinh / ngày tạo của tất cả nhân viên (đọc journal lần đầu)"""
+        with self._lock:
+            if self._meta is None:
+                meta = {}
+                if os.path.exists(self.meta_file):
+                    with open(self.meta_file, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            try:
+                                record = json.loads(line)
+                            except ValueError:
+                                continue  # dòng ghi dở khi crash
+                            if record.get('op') == 'delete':
+                                meta.pop(record['id'], None)
+                            else:
+                                meta[record['id']] = record['data']
+                self._meta = meta
+            return self._meta
+    
+    def _append_meta(self, record):
+        _end_torn_line(self.meta_file)
+        with open(self.meta_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    
+    def _new_rows(self, employee_id, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        raw_id = str(employee_id).encode('utf-8')
+        if len(raw_id) > self.ID_SIZE:
+            raise ValueError(f"Mã nhân viên quá dài (tối đa {self.ID_SIZE} byte): {employee_id}")
+        records = np.zeros(len(vectors), self.row_dtype)
+        records['id'] = raw_id
+        records['encoding'] = vectors
+        return records
+    
+    def _append_rows(self, employee_id, vectors):
+        self._append_records([employee_id], [self._new_rows(employee_id, vectors)])
+    
+    def _append_records(self, employee_ids, blocks):
+        """Ghi nối các khối hàng template, số hàng trong header cập nhật sau cùng"""
+        records = np.concatenate(blocks)
+        start = self.count
+        with open(self.db_file, 'r+b') as f:
+            f.seek(self.HEADER_SIZE + start * self.row_dtype.itemsize)
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            f.write(self.HEADER.pack(self.MAGIC, self.dim, start + len(records), self.generation))
+            f.flush()
+            os.fsync(f.fileno())
+        self.count = start + len(records)
+        if self._rows is not None:
+            for employee_id, block in zip(employee_ids, blocks):
+                self._rows.setdefault(employee_id, []).extend(range(start, start + len(block)))
+                start += len(block)
+    
+    def _drop_rows(self, rows):
+        """Đánh dấu xoá các hàng (mã nhân viên rỗng)"""
+        if not rows:
+            return
+        records = self._records('r+')
+        for row in rows:
+            records['id'][row] = b''
+        records.flush()
+        del records
+    
+    def compact(self):
+        """
+        Tạo lại file chỉ gồm các hàng còn dùng, generation + 1 (process đang map file cũ
+        vẫn đọc được bản cũ; lần ghi sau của chúng thấy generation mới và dựng lại)
+        Returns: số hàng đã bỏ, None nếu process khác đang ghi hoặc không thay được file
+        """
+        with self._lock:
+            if not self._file_lock.acquire(blocking=False):
+                print(f"{self.db_file} đang được process khác ghi, thử gộp lại sau")
+                return None
+            try:
+                self._refresh()
+                records = self._records()
+                live = np.array(records[records['id'] != b''])
+                del records
+                removed = self.count - len(live)
+                if removed:
+                    try:
+                        self._create(self.db_file, live, self.generation + 1)
+                    except OSError as e:
+                        print(f"Không gộp được {self.db_file}: {e}")
+                        return None
+                    self._open()
+                return removed
+            finally:
+                self._file_lock.release()
+    
+    def add_employee(self, employee_id, name, face_encoding, birth_date=None):
+        """Thêm nhân viên mới vào database"""
+        data = {
+            'name': name,
+            'birth_date': birth_date,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self._lock, self._file_lock:
+            self._refresh()
+            # Ghi hàng mới trước rồi mới xoá hàng cũ: lỗi / crash giữa chừng không mất encoding
+            old_rows = self._row_map().pop(employee_id, [])
+            try:
+                self._append_rows(employee_id, face_encoding)
+            except Exception:
+                if old_rows:
+                    self._row_map()[employee_id] = old_rows
+                raise
+            self._drop_rows(old_rows)
+            self._append_meta({'op': 'put', 'id': employee_id, 'data': data})
+            if self._meta is not None:
+                self._meta[employee_id] = data
+        return True
+    
+    def add_employees(self, records):
+        """
+        Thêm hàng loạt nhân viên (nhập từ thư mục ảnh): 1 lần ghi hàng + 1 lần ghi journal
+        records: list (mã, tên, encoding hoặc list template, ngày sinh)
+        Returns: số nhân viên đã thêm
+        """
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        records = list(records)
+        if not records:
+            return 0
+        blocks = [self._new_rows(employee_id, face_encodings)
+                  for employee_id, _, face_encodings, _ in records]
+        meta = [{'op': 'put', 'id': employee_id,
+                 'data': {'name': name, 'birth_date': birth_date, 'created_at': created_at}}
+                for employee_id, name, _, birth_date in records]
+        with self._lock, self._file_lock:
+            self._refresh()
+            rows = self._row_map()
+            old_rows = {record['id']: rows.pop(record['id'], []) for record in meta}
+            try:
+                self._append_records([record['id'] for record in meta], blocks)
+            except Exception:
+                rows.update((employee_id, old) for employee_id, old in old_rows.items() if old)
+                raise
+            self._drop_rows([row for old in old_rows.values() for row in old])
+            _end_torn_line(self.meta_file)
+            with open(self.meta_file, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in meta))
+            if self._meta is not None:
+                self._meta.update((record['id'], record['data']) for record in meta)
+        return len(records)
+    
+    def add_face_template(self, employee_id, face_encoding, max_templates=10):
+        """Thêm 1 ảnh mẫu khuôn mặt, giữ tối đa max_templates ảnh mới nhất"""
+        with self._lock, self._file_lock:
+            self._refresh()
+            rows = self._row_map().get(employee_id)
+            if not rows:
+                return 0
+            self._append_rows(employee_id, face_encoding)
+            rows = self._row_map()[employee_id]
+            if len(rows) > max_templates:
+                self._drop_rows(rows[:-max_templates])
+                del rows[:-max_templates]
+            return len(rows)
+    
+    def _employee(self, employee_id, rows, records):
+        data = self.metadata().get(employee_id, {})
+        templates = [np.array(records['encoding'][row]) for row in rows]
+        return {
+            'name': data.get('name', employee_id),
+            'face_encoding': templates[0] if templates else None,
+            'face_encodings': templates,
+            'birth_date': data.get('birth_date'),
+            'created_at': data.get('created_at'),
+        }
+    
+    def get_employee(self, employee_id):
+        """Lấy thông tin nhân viên theo ID"""
+        with self._lock:
+            rows = self._row_map().get(employee_id)
+            if not rows:
+                return None
+            return self._employee(employee_id, rows, self._records())
+    
+    def get_all_employees(self):
+        """Lấy danh sách tất cả nhân viên (dict giống EmployeeDatabase)"""
+        with self._lock:
+            records = self._records()
+            return {
+                employee_id: self._employee(employee_id, rows, records)
+                for employee_id, rows in self._row_map().items()
+            }
+    
+    def map_face_matrix(self):
+        """
+        Cột encoding map từ file (mode 'c': sửa trong process này không ghi ra file)
+        Returns: (mã nhân viên từng hàng, ma trận N x dim, nguồn để process khác map lại:
+            file, offset, bước hàng, inode - file bị gộp / thay thì inode khác)
+            có hàng đã xoá thì trả về bản copy các hàng còn dùng (không gộp file ở đây)
+        """
+        with self._lock, self._file_lock:
+            self._refresh()
+            row_ids = self._decoded_ids()
+            if None in row_ids:
+                records = self._records()
+                live = records['id'] != b''
+                return ([employee_id for employee_id in row_ids if employee_id is not None],
+                        np.array(records['encoding'][live]), None)
+            if self.count == 0:
+                return [], np.zeros((0, self.dim), np.float32), None
+            matrix = self._records('c')['encoding']
+            source = (os.path.abspath(self.db_file), self.HEADER_SIZE + self.ID_SIZE,
+                      self.row_dtype.itemsize, os.stat(self.db_file).st_ino)
+            return row_ids, matrix, source
+    
+    def delete_employee(self, employee_id):
+        """Xóa nhân viên khỏi database"""
+        with self._lock, self._file_lock:
+            self._refresh()
+            rows = self._row_map().pop(employee_id, None)
+            if not rows:
+                return False
+            self._drop_rows(rows)
+            self._append_meta({'op': 'delete', 'id': employee_id})
+            if self._meta is not None:
+                self._meta.pop(employee_id, None)
+            return True
+    
+    def migrate_from_pickle(self, pickle_file='employees.pkl'):
+        """Chép toàn bộ nhân viên từ database pickle (kể cả journal)"""
+        source = EmployeeDatabase(pickle_file)
+        employees = source.get_all_employees()
+        source.close()
+        for employee_id, data in employees.items():
+            templates = data.get('face_encodings') or [data['face_encoding']]
+            self.add_employee(employee_id, data['name'], templates[0], data.get('birth_date'))
+            for face_encoding in templates[1:]:
+                self.add_face_template(employee_id, face_encoding)
+        return len(employees)
+    
+    def save_database(self):
+        """Mỗi thay đổi đã ghi ra file, giữ để tương thích API"""
+        pass
+    
+    def close(self):
+        """Không tự gộp file (process khác có thể đang map), gộp bằng compact()"""
+        pass
+
+
+def open_employee_database(db_file='employees.pkl'):
+    """
+    Chọn backend theo đuôi file: .db / .sqlite -> SQLite, .emb -> ma trận map từ file,
+    còn lại -> pickle + journal
+    """
+    extension = os.path.splitext(db_file)[1].lower()
+    if extension in ('.db', '.sqlite', '.sqlite3'):
+        return SQLiteEmployeeDatabase(db_file)
+    if extension == '.emb':
+        return MmapEmployeeDatabase(db_file)
+    return EmployeeDatabase(db_file)
+
+
+def _date_str(value):
+    """date / datetime / chuỗi 'YYYY-MM-DD...' -> 'YYYY-MM-DD'"""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
 class AttendanceLog:
-    def __init__(self, log_file='attendance_log.csv'):
+    """
+    Log chấm công CSV ghi nối
+    - partition='month' / 'day': mỗi tháng / ngày 1 file trong thư mục cùng tên
+      (attendance_log/2025-10.csv), kèm index đoạn byte theo ngày và khối theo nhân viên
+      (2025-10.csv.idx, ghi nối) để truy vấn khoảng ngày không phải đọc cả log
+    - log_attendance chỉ đưa dòng vào hàng đợi rồi trả về ngay; thread nền ghi theo lô
+      (flush sau flush_every dòng hoặc flush_interval giây, fsync tuỳ chọn)
+    - Chấm công hôm nay giữ trong bộ nhớ: lần đầu nhảy thẳng tới dòng đầu tiên của
+      hôm nay (offset trong index), sau đó chỉ đọc phần mới ghi thêm,
+      kể cả dòng do process khác (headless, camera khác) ghi
+    - Qua nửa đêm thì tự chuyển sang danh sách của ngày mới
+    - listeners: các hàm nhận từng lần chấm công (dict) ngay khi log_attendance
+      (vd. DailyRollup cập nhật bảng công theo ngày)
+    """
+    FIELDS = ['Thời gian', 'ID nhân viên', 'Tên', 'Loại']
+    PARTITIONS = ('month', 'day')
+    STOP_RETRIES = 3  # số lần thử ghi lại lúc dừng trước khi bỏ dòng
+    EXPORT_CHUNK = 1024 * 1024
+    INDEX_BLOCK = 64 * 1024      # index theo nhân viên ghi khối 64 KB, không ghi từng dòng
+    INDEX_MAX_DELTAS = 256       # số phần nối vào .idx trước khi gộp lại thành 1 dòng
+    
+    def __init__(self, log_file='attendance_log.csv', flush_every=50, flush_interval=0.5,
+                 fsync=True, max_queue=10000, partition=None):
+        """
+        flush_every: số dòng tối đa mỗi lô ghi
+        flush_interval: thời gian (giây) tối đa 1 dòng nằm trong hàng đợi
+        fsync: fsync sau mỗi lô (an toàn khi mất điện, chậm hơn trên thẻ SD)
+        max_queue: hàng đợi đầy thì log_attendance chờ (không bỏ dòng nào)
+        partition: None (1 file log_file), 'month' hoặc 'day'; nếu vẫn còn log 1 file
+            cũ thì tiếp tục ghi 1 file đến khi chia bằng migrate_to_partitions
+        """
+        if partition is not None and partition not in self.PARTITIONS:
+            raise ValueError(f"partition không hỗ trợ: {partition}")
+        if partition and os.path.exists(log_file):
+            print(f"{log_file} chưa được chia theo {partition}, vẫn dùng 1 file. Chia bằng: "
+                  f"python database.py --migrate-log {partition} --log {log_file}", file=sys.stderr)
+            partition = None
         self.log_file = log_file
-        self._init_log_file()
+        self.partition = partition
+        self.log_dir = os.path.splitext(log_file)[0] if partition else None
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._queue = queue.Queue(max_queue)
+        self._writer = None
+        self._lock = threading.RLock()
+        self._index_lock = threading.Lock()
+        self._indexes = {}          # partition -> (index, số phần trong .idx, .idx còn tốt) (cache)
+        self._pending = Counter()   # dòng đã vào hàng đợi, chưa ghi ra file
+        self._today = None          # ngày của danh sách trong bộ nhớ
+        self._today_file = None
+        self._today_rows = []
+        self._offset = 0            # đã đọc file của hôm nay đến byte này
+        self._own_rows = Counter()  # dòng process này ghi, đã có trong danh sách
+        self.write_error = None     # lỗi ghi gần nhất (None khi lô sau ghi được)
+        self.dropped_rows = 0       # dòng bỏ vì vẫn ghi lỗi lúc dừng
+        self.listeners = []
+        if partition:
+            os.makedirs(self.log_dir, exist_ok=True)
+        else:
+            self._init_log_file()
+        atexit.register(self.close)
     
-    def _init_log_file(self):
+    def _init_log_file(self, path=None):
         """Khởi tạo file log nếu chưa tồn tại"""
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, 'w', newline='', encoding='utf-8') as f:
+        path = path or self.log_file
+        if not os.path.exists(path):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow(['Thời gian', 'ID nhân viên', 'Tên', 'Loại'])
-    
-    def log_attendance(self, employee_id, name, attendance_type='check-in'):
-        """Ghi log chấm công"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.log_file, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([timestamp, employee_id, name, attendance_type])
+                writer.writerow(self.FIELDS)
+    
+    def partition_file(self, date):
+        """File chứa các dòng của ngày date ('YYYY-MM-DD...')"""
+        if not self.partition:
+            return self.log_file
+        key = date[:7] if self.partition == 'month' else date[:10]
+        return os.path.join(self.log_dir, key + '.csv')
+    
+    def partition_files(self, start_date='0000-01-01', end_date='9999-12-31'):
+        """Các file log (đang có) chứa ngày trong khoảng [start_date, end_date]"""
+        start, end = _date_str(start_date), _date_str(end_date)
+        if not self.partition:
+            return [self.log_file] if os.path.exists(self.log_file) else []
+        paths = []
+        for name in sorted(os.listdir(self.log_dir)):
+            key = name[:-4]
+            if name.endswith('.csv') and start[:len(key)] <= key <= end[:len(key)]:
+                paths.append(os.path.join(self.log_dir, name))
+        return paths
+    
+    def date_span(self, date):
+        """[file, offset đầu, offset cuối] các dòng của ngày date trong log, None nếu chưa có"""
+        path = self.partition_file(date)
+        if not os.path.exists(path):
+            return None
+        with self._index_lock:
+            span = self._index(path)['dates'].get(date[:10])
+        return [os.path.basename(path)] + span if span else None
+    
+    @classmethod
+    def migrate_to_partitions(cls, log_file='attendance_log.csv', partition='month'):
+        """
+        Chia log 1 file cũ vào các partition (chạy 1 lần, khi không có process nào đang ghi log)
+        - File khoá log_file + '.lock' chặn 2 lần chia cùng lúc
+        - Chia vào thư mục tạm rồi mới chuyển sang thư mục partition, file cũ đổi thành .bak
+        Returns: số dòng đã chia, None nếu không có log 1 file hoặc đang có process khác chia
+        """
+        if partition not in cls.PARTITIONS:
+            raise ValueError(f"partition không hỗ trợ: {partition}")
+        lock_file = log_file + '.lock'
+        try:
+            os.close(os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            print(f"Đang có process khác chia {log_file} (xoá {lock_file} nếu không phải)")
+            return None
+        try:
+            if not os.path.exists(log_file):
+                return None
+            log_dir = os.path.splitext(log_file)[0]
+            tmp_dir = log_dir + '.tmp'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            key_size = 7 if partition == 'month' else 10
+            print(f"Chia {log_file} theo {partition} vào {log_dir}/ ...")
+            count, key, dst, writer = 0, None, None, None
+            try:
+                with open(log_file, 'r', newline='', encoding='utf-8') as src:
+                    reader = csv.reader(src)
+                    next(reader, None)
+                    for row in reader:
+                        if len(row) < len(cls.FIELDS):
+                            continue
+                        if row[0][:key_size] != key:
+                            # Log ghi theo thời gian nên mỗi lúc chỉ cần mở 1 partition
+                            if dst is not None:
+                                dst.close()
+                            key = row[0][:key_size]
+                            path = os.path.join(tmp_dir, key + '.csv')
+                            new_file = not os.path.exists(path)
+                            dst = open(path, 'a', newline='', encoding='utf-8')
+                            writer = csv.writer(dst)
+                            if new_file:
+                                writer.writerow(cls.FIELDS)
+                        writer.writerow(row)
+                        count += 1
+            finally:
+                if dst is not None:
+                    dst.close()
+            os.makedirs(log_dir, exist_ok=True)
+            for name in sorted(os.listdir(tmp_dir)):
+                path, target = os.path.join(tmp_dir, name), os.path.join(log_dir, name)
+                if not os.path.exists(target):
+                    os.replace(path, target)
+                    continue
+                # Partition đã có (ghi trước khi chia): nối thêm, bỏ dòng tiêu đề
+                with open(path, 'rb') as src, open(target, 'ab') as out:
+                    src.readline()
+                    shutil.copyfileobj(src, out)
+            shutil.rmtree(tmp_dir)
+            os.replace(log_file, log_file + '.bak')
+            if os.path.exists(log_file + '.idx'):
+                os.remove(log_file + '.idx')
+            return count
+        finally:
+            os.remove(lock_file)
+    
+    def log_attendance(self, employee_id, name, attendance_type='check-in', when=None):
+        """
+        Ghi log chấm công (ghi ra file ở thread nền, trả về ngay)
+        when: thời điểm chấm công (datetime), mặc định là hiện tại
+        """
+        timestamp = (when or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+        row = tuple(str(v) for v in (timestamp, employee_id, name, attendance_type))
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+            self._pending[row] += 1
+            if self._today is not None and timestamp.startswith(self._today):
+                # Thêm ngay vào danh sách, lần đọc file sau bỏ qua dòng này
+                self._today_rows.append(dict(zip(self.FIELDS, row)))
+                self._own_rows[row] += 1
+        self._queue.put(row)
+        record = dict(zip(self.FIELDS, row))
+        for listener in self.listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"Lỗi xử lý sự kiện chấm công: {e}")
         return timestamp
     
+    def _write_loop(self):
+        """
+        Thread ghi: gom dòng thành lô, ghi + flush 1 lần, fsync theo cấu hình
+        Dòng chỉ được task_done khi đã nằm trong file: ghi lỗi thì giữ lại, thử lại sau
+        flush_interval; lúc dừng vẫn lỗi sau STOP_RETRIES lần thì bỏ và đếm vào dropped_rows
+        """
+        files = {}  # partition -> file đang mở
+        unwritten = []
+        taken = 0  # số item đã lấy khỏi hàng đợi nhưng chưa task_done
+        stopping = False
+        retries = 0
+        while True:
+            batch = []
+            if not stopping:
+                try:
+                    # Còn dòng ghi lỗi thì không chờ mãi dòng mới, hết hạn là thử ghi lại
+                    batch.append(self._queue.get(timeout=self.flush_interval if unwritten else None))
+                except queue.Empty:
+                    pass
+                deadline = time.monotonic() + self.flush_interval
+                while batch and batch[-1] is not None and len(batch) < self.flush_every:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                stopping = bool(batch) and batch[-1] is None
+            taken += len(batch)
+            unwritten += [row for row in batch if row is not None]
+            if unwritten:
+                by_file = {}
+                for row in unwritten:
+                    by_file.setdefault(self.partition_file(row[0]), []).append(row)
+                try:
+                    with self._lock:
+                        if len(files) + len(by_file) > 4:
+                            # Sang partition mới: đóng các file cũ
+                            for path in [path for path in files if path not in by_file]:
+                                files.pop(path).close()
+                        for path, rows in by_file.items():
+                            if path not in files:
+                                self._init_log_file(path)
+                                _end_torn_line(path)
+                                files[path] = open(path, 'a', newline='', encoding='utf-8')
+                            csv.writer(files[path]).writerows(rows)
+                            files[path].flush()
+                        self._pending.subtract(unwritten)
+                        self._pending += Counter()  # bỏ các dòng đã về 0
+                    if self.fsync:
+                        for path in by_file:
+                            os.fsync(files[path].fileno())
+                    unwritten = []
+                    self.write_error = None
+                except OSError as e:
+                    # Giữ lại các dòng (chưa task_done nên flush() không trả về), thử ghi lại
+                    print(f"Lỗi ghi log chấm công ({len(unwritten)} dòng chờ ghi lại): {e}")
+                    self.write_error = e
+                    for f in files.values():
+                        f.close()
+                    files = {}
+                    if stopping:
+                        retries += 1
+                        if retries < self.STOP_RETRIES:
+                            time.sleep(self.flush_interval)
+                            continue
+                        print(f"Bỏ {len(unwritten)} dòng chấm công không ghi được khi dừng")
+                        with self._lock:
+                            self.dropped_rows += len(unwritten)
+                            self._pending.subtract(unwritten)
+                            self._pending += Counter()
+                        unwritten = []
+            if not unwritten:
+                for _ in range(taken):
+                    self._queue.task_done()
+                taken = 0
+                if stopping:
+                    break
+        for f in files.values():
+            f.close()
+    
+    def flush(self):
+        """
+        Chờ tất cả dòng trong hàng đợi được ghi ra file
+        Raises: OSError nếu đang ghi lỗi (các dòng vẫn được giữ, thread ghi thử lại)
+        """
+        done = self._queue.all_tasks_done
+        with done:
+            while self._queue.unfinished_tasks:
+                if self.write_error is not None:
+                    raise OSError(f"Chưa ghi được log chấm công: {self.write_error}")
+                done.wait(0.1)
+    
+    def close(self):
+        """
+        Ghi nốt hàng đợi và dừng thread ghi
+        Raises: OSError nếu có dòng bị bỏ vì không ghi được
+        """
+        with self._lock:
+            writer = self._writer
+            self._writer = None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        if self.dropped_rows:
+            dropped, self.dropped_rows = self.dropped_rows, 0
+            raise OSError(f"{dropped} dòng chấm công không ghi được vào {self.log_file}")
+    
+    def _read_new_rows(self):
+        """Đọc các dòng hoàn chỉnh ghi thêm từ lần đọc trước"""
+        with open(self._today_file, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1  # dòng cuối đang ghi dở thì để lần sau
+        self._offset += end
+        for row in csv.reader(io.StringIO(data[:end].decode('utf-8'))):
+            if len(row) < len(self.FIELDS) or not row[0].startswith(self._today):
+                continue
+            key = tuple(row[:len(self.FIELDS)])
+            if self._own_rows[key] > 0:
+                self._own_rows[key] -= 1
+                continue
+            self._today_rows.append(dict(zip(self.FIELDS, row)))
+    
+    def _refresh_today(self):
+        today = datetime.now().strftime('%Y-%m-%d')
+        today_file = self.partition_file(today)
+        size = os.path.getsize(today_file) if os.path.exists(today_file) else 0
+        if today != self._today or today_file != self._today_file or size < self._offset:
+            # Lần đầu, sang ngày mới, hoặc file log bị thay: tìm lại vị trí của hôm nay
+            self._today = today
+            self._today_file = today_file
+            self._today_rows = []
+            self._own_rows.clear()
+            self._offset = 0
+            if size:
+                # Log không chắc theo thứ tự thời gian (headless --start-time ghi dòng
+                # của ngày cũ): bắt đầu từ dòng đầu tiên của hôm nay theo index .idx
+                with self._index_lock:
+                    index = self._index(today_file)
+                span = index['dates'].get(today)
+                self._offset = span[0] if span else index['size']
+                self._read_new_rows()
+            # Dòng còn trong hàng đợi chưa có trong file
+            for row, count in self._pending.items():
+                if row[0].startswith(today):
+                    self._today_rows += [dict(zip(self.FIELDS, row)) for _ in range(count)]
+                    self._own_rows[row] += count
+            return
+        if size > self._offset:
+            self._read_new_rows()
+    
     def get_today_attendance(self):
         """Lấy danh sách chấm công hôm nay"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        attendance = []
-        
-        if os.path.exists(self.log_file):
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row['Thời gian'].startswith(today):
-                        attendance.append(row)
-        return attendance
-    
-    def export_to_csv(self, output_file=None):
-        """Xuất log ra file CSV khác (để backup hoặc gửi HR)"""
+        with self._lock:
+            self._refresh_today()
+            return list(self._today_rows)
+    
+    def _load_index(self, path):
+        """
+        Đọc file .idx: mỗi dòng là 1 phần index {'from', 'size', 'dates', 'employees'} của
+        đoạn byte [from, size); dừng ở dòng hỏng hoặc phần bị hở (from > size đã index)
+        Returns: (index, số dòng đọc được, đọc hết file hay không)
+        """
+        index = {'size': 0, 'dates': {}, 'employees': {}}
+        count = 0
+        try:
+            with open(path + '.idx', 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        delta = json.loads(line)
+                    except ValueError:
+                        return index, count, False
+                    if not isinstance(delta, dict) or delta.get('from', index['size'] + 1) > index['size']:
+                        return index, count, False  # index kiểu cũ hoặc thiếu 1 phần
+                    self._merge_index(index, delta)
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return index, count, True
+    
+    @staticmethod
+    def _merge_index(index, delta):
+        """Gộp 1 phần index vào index (gộp lại phần đã có cũng không sai)"""
+        for date, (first, last) in delta['dates'].items():
+            span = index['dates'].setdefault(date, [first, last])
+            span[0] = min(span[0], first)
+            span[1] = max(span[1], last)
+        for employee_id, blocks in delta['employees'].items():
+            known = index['employees'].setdefault(employee_id, [])
+            for block in blocks:
+                if not known or block > known[-1]:
+                    known.append(block)
+                elif block not in known:
+                    bisect.insort(known, block)
+        index['size'] = max(index['size'], delta['size'])
+    
+    def _index(self, path):
+        """
+        Index của 1 file log: {'size', 'dates': ngày -> [offset đầu, offset cuối],
+        'employees': mã -> [số thứ tự các khối INDEX_BLOCK byte có dòng của nhân viên]}
+        Chỉ index phần mới ghi và nối phần đó vào cuối .idx; ghi lại cả file .idx
+        (gộp thành 1 dòng) khi đã có INDEX_MAX_DELTAS phần hoặc .idx bị hỏng
+        """
+        cached = self._indexes.pop(path, None)
+        if cached is None:
+            cached = self._load_index(path)
+        index, deltas, clean = cached
+        size = os.path.getsize(path)
+        if index['size'] > size:
+            # File log bị thay / cắt: index lại từ đầu
+            index, deltas, clean = {'size': 0, 'dates': {}, 'employees': {}}, 0, False
+        if index['size'] < size:
+            with open(path, 'rb') as f:
+                f.seek(index['size'])
+                data = f.read(size - index['size'])
+            data = data[:data.rfind(b'\n') + 1]
+            lines = data.split(b'\n')[:-1]
+            offset = index['size']
+            delta = {'from': offset, 'size': offset, 'dates': {}, 'employees': {}}
+            dates, employees = delta['dates'], delta['employees']
+            for line, row in zip(lines, csv.reader(line.decode('utf-8') for line in lines)):
+                if len(row) >= len(self.FIELDS) and row[0][:4].isdigit():
+                    span = dates.setdefault(row[0][:10], [offset, offset])
+                    span[1] = offset + len(line) + 1
+                    blocks = employees.setdefault(row[1], [])
+                    if not blocks or blocks[-1] != offset // self.INDEX_BLOCK:
+                        blocks.append(offset // self.INDEX_BLOCK)
+                offset += len(line) + 1
+            delta['size'] = offset
+            if offset > index['size']:
+                self._merge_index(index, delta)
+                try:
+                    if clean and deltas < self.INDEX_MAX_DELTAS:
+                        with open(path + '.idx', 'a', encoding='utf-8') as f:
+                            f.write(json.dumps(delta, ensure_ascii=False, separators=(',', ':')) + '\n')
+                        deltas += 1
+                    else:
+                        tmp_file = path + '.idx.tmp'
+                        with open(tmp_file, 'w', encoding='utf-8') as f:
+                            f.write(json.dumps(dict(index, **{'from': 0}), ensure_ascii=False,
+                                               separators=(',', ':')) + '\n')
+                        os.replace(tmp_file, path + '.idx')
+                        deltas, clean = 1, True
+                except OSError as e:
+                    # Index chỉ để tra nhanh: không ghi được thì lần sau index lại
+                    print(f"Không ghi được index {path}.idx: {e}")
+        self._indexes[path] = (index, deltas, clean)
+        if len(self._indexes) > 8:
+            # Chỉ giữ index của vài partition dùng gần nhất
+            del self._indexes[next(iter(self._indexes))]
+        return index
+    
+    def _lines_between(self, f, first, last):
+        f.seek(first)
+        remaining = last - first
+        while remaining > 0:
+            line = f.readline()
+            if not line:
+                break
+            remaining -= len(line)
+            yield line.decode('utf-8')
+    
+    def _lines_in_blocks(self, f, blocks, first, last):
+        """Các dòng bắt đầu trong các khối blocks, chỉ trong đoạn byte [first, last)"""
+        runs = []
+        for block in blocks:
+            if runs and runs[-1][1] == block:
+                runs[-1][1] = block + 1  # khối liền nhau: đọc 1 lần
+            else:
+                runs.append([block, block + 1])
+        for block_start, block_end in runs:
+            start = max(block_start * self.INDEX_BLOCK, first)
+            end = min(block_end * self.INDEX_BLOCK, last)
+            if start >= end:
+                continue
+            f.seek(max(start - 1, 0))
+            if start and f.read(1) != b'\n':
+                f.readline()  # bỏ phần cuối của dòng bắt đầu ở khối trước
+            position = f.tell()
+            while position < end:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                position += len(line)
+                yield line.decode('utf-8')
+    
+    def _rows(self, path, start, end, employee_ids=None):
+        """
+        Các dòng (list) của 1 file log trong khoảng ngày [start, end], đọc dần từng dòng
+        theo đoạn byte của các ngày, lọc thêm theo khối có dòng của từng nhân viên trong index
+        """
+        with self._index_lock:
+            index = self._index(path)
+            spans = [span for date, span in index['dates'].items() if start <= date <= end]
+            if not spans:
+                return
+            first, last = min(span[0] for span in spans), max(span[1] for span in spans)
+            if employee_ids is not None:
+                blocks = sorted({block for employee_id in employee_ids
+                                 for block in index['employees'].get(employee_id, [])})
+        with open(path, 'rb') as f:
+            if employee_ids is not None:
+                lines = self._lines_in_blocks(f, blocks, first, last)
+            else:
+                lines = self._lines_between(f, first, last)
+            for row in csv.reader(lines):
+                if len(row) < len(self.FIELDS) or not start <= row[0][:10] <= end:
+                    continue
+                if employee_ids is not None and row[1] not in employee_ids:
+                    continue
+                yield row
+    
+    def query(self, start_date, end_date=None, employee_ids=None, attendance_type=None):
+        """
+        Các lần chấm công từ start_date đến end_date (gồm cả 2 ngày)
+        Chỉ đọc các partition trong khoảng và các đoạn byte index chỉ ra
+        employee_ids: chỉ lấy các nhân viên này; attendance_type: 'check-in'...
+        Yields: dict giống get_today_attendance
+        """
+        start = _date_str(start_date)
+        end = _date_str(end_date or start_date)
+        employee_ids = {str(employee_id) for employee_id in employee_ids} if employee_ids else None
+        self.flush()
+        for path in self.partition_files(start, end):
+            for row in self._rows(path, start, end, employee_ids):
+                if attendance_type and row[3] != attendance_type:
+                    continue
+                yield dict(zip(self.FIELDS, row))
+    
+    def employee_history(self, employee_id, start_date='0000-01-01', end_date='9999-12-31'):
+        """Lịch sử chấm công của 1 nhân viên (dùng index theo nhân viên)"""
+        return list(self.query(start_date, end_date, employee_ids=[employee_id]))
+    
+    def first_in_last_out(self, start_date, end_date=None, employee_ids=None):
+        """
+        Giờ vào đầu tiên / giờ ra cuối cùng của từng nhân viên mỗi ngày
+        Returns: list dict (date, employee_id, name, first_in, last_out, count)
+        """
+        days = {}
+        for row in self.query(start_date, end_date, employee_ids):
+            date, clock = row['Thời gian'][:10], row['Thời gian'][11:]
+            key = (date, row['ID nhân viên'])
+            day = days.get(key)
+            if day is None:
+                days[key] = {'date': date, 'employee_id': row['ID nhân viên'], 'name': row['Tên'],
+                             'first_in': clock, 'last_out': clock, 'count': 1}
+            else:
+                day['first_in'] = min(day['first_in'], clock)
+                day['last_out'] = max(day['last_out'], clock)
+                day['count'] += 1
+        return [days[key] for key in sorted(days)]
+    
+    def _partition_covered(self, path, start, end):
+        """Partition nằm trọn trong khoảng ngày [start, end] (chép nguyên được)"""
+        if not self.partition:
+            return start <= '0000-01-01' and end >= '9999-12-31'
+        key = os.path.basename(path)[:-4]
+        if self.partition == 'month':
+            last_day = calendar.monthrange(int(key[:4]), int(key[5:7]))[1]
+            return start <= key + '-01' and end >= f'{key}-{last_day:02d}'
+        return start <= key <= end
+    
+    def _copy_range(self, src, dst, start, end, kernel, on_copied):
+        """
+        Chép đoạn byte [start, end) của src sang dst, bộ nhớ cố định
+        kernel: thử os.sendfile (chép trong kernel, Linux), lỗi thì chép từng khối
+        """
+        offset = start
+        if kernel:
+            dst.flush()
+            try:
+                while offset < end:
+                    sent = os.sendfile(dst.fileno(), src.fileno(), offset,
+                                       min(end - offset, self.EXPORT_CHUNK * 8))
+                    if sent == 0:
+                        break
+                    offset += sent
+                    on_copied(sent)
+            except OSError:
+                pass  # ví dụ macOS chỉ sendfile ra socket
+            dst.seek(0, os.SEEK_END)
+        src.seek(offset)
+        while offset < end:
+            chunk = src.read(min(end - offset, self.EXPORT_CHUNK))
+            if not chunk:
+                break
+            dst.write(chunk)
+            offset += len(chunk)
+            on_copied(len(chunk))
+    
+    def export_to_csv(self, output_file=None, start_date=None, end_date=None, employee_ids=None,
+                      attendance_type=None, compress=None, progress=None):
+        """
+        Xuất log ra file CSV khác (để backup hoặc gửi HR), bộ nhớ dùng cố định
+        - Partition nằm trọn trong khoảng ngày được chép nguyên theo khối
+          (os.sendfile nếu được), partition ở 2 đầu khoảng thì lọc từng dòng
+        - Lọc theo nhân viên / loại chấm công: lọc từng dòng
+        compress: nén gzip (mặc định: khi output_file có đuôi .gz)
+        progress: hàm progress(số byte log đã xử lý, tổng số byte), gọi từ thread đang xuất
+        Returns: đường dẫn file đã xuất hoặc None nếu không có log
+        """
+        self.flush()
         if output_file is None:
             output_file = f'attendance_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        if compress is None:
+            compress = output_file.endswith('.gz')
+        start = _date_str(start_date) if start_date else '0000-01-01'
+        end = _date_str(end_date) if end_date else '9999-12-31'
+        employee_ids = {str(employee_id) for employee_id in employee_ids} if employee_ids else None
+        
+        paths = self.partition_files(start, end)
+        if not paths:
+            return None
+        total = sum(os.path.getsize(path) for path in paths)
+        done = 0
         
-        if os.path.exists(self.log_file):
-            with open(self.log_file, 'r', encoding='utf-8') as src:
-                with open(output_file, 'w', newline='', encoding='utf-8') as dst:
-                    dst.write(src.read())
-            return output_file
-        return None
+        def on_copied(count):
+            nonlocal done
+            done += count
+            if progress is not None:
+                progress(done, total)
+        
+        raw = open(output_file, 'wb')
+        dst = gzip.GzipFile(fileobj=raw, mode='wb') if compress else raw
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(self.FIELDS)
+            for path in paths:
+                size = os.path.getsize(path)
+                if (self._partition_covered(path, start, end) and employee_ids is None
+                        and not attendance_type):
+                    dst.write(buffer.getvalue().encode('utf-8'))
+                    buffer.seek(0)
+                    buffer.truncate()
+                    with open(path, 'rb') as src:
+                        header = len(src.readline())
+                        on_copied(header)
+                        self._copy_range(src, dst, header, size, not compress, on_copied)
+                    continue
+                for row in self._rows(path, start, end, employee_ids):
+                    if attendance_type and row[3] != attendance_type:
+                        continue
+                    writer.writerow(row)
+                    if buffer.tell() >= self.EXPORT_CHUNK:
+                        dst.write(buffer.getvalue().encode('utf-8'))
+                        buffer.seek(0)
+                        buffer.truncate()
+                on_copied(size)
+            dst.write(buffer.getvalue().encode('utf-8'))
+        finally:
+            if compress:
+                dst.close()
+            raw.close()
+        return output_file
+
+
+class AttendanceCooldown:
+    """Chống ghi log chấm công liên tục cho cùng 1 nhân viên"""
+    def __init__(self, cooldown=30):
+        """cooldown: số giây tối thiểu giữa 2 lần chấm công của cùng 1 người"""
+        self.cooldown = cooldown
+        self.last_recognized = {}  # {employee_id: thời điểm (giây)}
+        self._lock = threading.Lock()  # nhiều thread nhận diện cùng gọi
+    
+    def should_log(self, employee_id, now):
+        """
+        Kiểm tra và ghi nhận lần chấm công
+        now: thời điểm tính bằng giây (time.time(), thời gian trong video...)
+        Returns: True nếu được phép ghi log
+        """
+        with self._lock:
+            last = self.last_recognized.get(employee_id)
+            if last is not None and now - last < self.cooldown:
+                return False
+            self.last_recognized[employee_id] = now
+            return True
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="Chuyển database nhân viên từ pickle sang SQLite (.db) hoặc ma trận map file (.emb), "
+                    "hoặc chia log chấm công 1 file theo tháng / ngày (--migrate-log)"
+    )
+    parser.add_argument('source', nargs='?', default='employees.pkl')
+    parser.add_argument('target', nargs='?', default='employees.db')
+    parser.add_argument('--migrate-log', choices=AttendanceLog.PARTITIONS, default=None,
+                        help="Chia log --log theo tháng / ngày (tắt ứng dụng trước khi chạy)")
+    parser.add_argument('--log', default='attendance_log.csv', help="File log chấm công 1 file")
+    parser.add_argument('--compact', default=None, metavar='EMB_FILE',
+                        help="Gộp file .emb, bỏ các hàng đã xoá (tắt ứng dụng trước khi chạy)")
+    args = parser.parse_args()
+    
+    if args.compact:
+        removed = MmapEmployeeDatabase(args.compact).compact()
+        if removed is not None:
+            print(f"Đã bỏ {removed} hàng đã xoá khỏi {args.compact}")
+        raise SystemExit(0 if removed is not None else 1)
+    
+    if args.migrate_log:
+        count = AttendanceLog.migrate_to_partitions(args.log, args.migrate_log)
+        if count is not None:
+            print(f"Đã chia {count} dòng, file cũ đổi tên thành {args.log}.bak")
+        raise SystemExit(0 if count is not None else 1)
+    
+    target = open_employee_database(args.target)
+    count = target.migrate_from_pickle(args.source)
+    target.close()
+    print(f"Đã chuyển {count} nhân viên từ {args.source} sang {args.target}")
@@ -0,0 +1,166 @@
+"""
+Lập kế hoạch detect cho từng frame: vùng quan tâm (ROI), tỉ lệ thu nhỏ và chia tile
+- ROI: chỉ detect trong vùng cửa ra vào, bỏ qua phần còn lại của khung hình
+- Tỉ lệ thu nhỏ tự điều chỉnh theo kích thước khuôn mặt quan sát được
+- Camera độ phân giải cao: 1 lượt thô toàn ROI + lượt phóng to chỉ ở các tile
+  có khả năng có khuôn mặt (vị trí track cũ, vùng có chuyển động)
+"""
+from collections import deque
+
+
+class DetectionPass:
+    """Một lượt detect: vùng (x0, y0, x1, y1) của frame gốc và tỉ lệ thu nhỏ"""
+
+    def __init__(self, region, scale):
+        self.region = region
+        self.scale = scale
+
+    def __repr__(self):
+        return f"DetectionPass(region={self.region}, scale={self.scale:.3f})"
+
+
+class FixedPlan:
+    """Kế hoạch detect đã tính sẵn (gửi sang process worker), không tự điều chỉnh"""
+
+    def __init__(self, passes):
+        self.passes = passes
+
+    def plan(self, frame_shape):
+        return self.passes
+
+    def observe(self, locations):
+        pass
+
+
+def _to_pixels(roi, width, height):
+    """ROI (x, y, w, h) theo pixel hoặc theo tỉ lệ 0-1 -> (x0, y0, x1, y1)"""
+    if roi is None:
+        return 0, 0, width, height
+    x, y, w, h = roi
+    if all(0 <= v <= 1 for v in roi):
+        x, y, w, h = x * width, y * height, w * width, h * height
+    x0 = max(0, int(x))
+    y0 = max(0, int(y))
+    x1 = min(width, int(x + w))
+    y1 = min(height, int(y + h))
+    return x0, y0, x1, y1
+
+
+class DetectionPlanner:
+    """
+    Quyết định detect ở đâu và ở tỉ lệ nào cho 1 camera
+    Với adaptive=False, tiled=False và roi=None thì giống hành vi cũ:
+    detect toàn frame ở tỉ lệ 0.25
+    """
+
+    def __init__(self, roi=None, scale=0.25, adaptive=True, min_scale=0.1, max_scale=1.0,
+                 target_face_size=60, history=30, tiled='auto', tile_size=640,
+                 tile_min_width=1600, max_tiles=6):
+        """
+        roi: vùng cửa ra vào (x, y, w, h), pixel hoặc tỉ lệ 0-1; None = cả frame
+        scale: tỉ lệ khởi đầu (cũng là tỉ lệ khi không thấy ai, để người ở xa
+            vẫn được phát hiện)
+        adaptive: tự điều chỉnh tỉ lệ theo kích thước khuôn mặt
+        target_face_size: chiều cao khuôn mặt mong muốn trên ảnh detect (pixel)
+        tiled: True / False / 'auto' (bật khi frame rộng >= tile_min_width)
+        tile_size: kích thước tile (pixel frame gốc)
+        max_tiles: số tile phóng to tối đa mỗi frame
+        """
+        self.roi = roi
+        self.base_scale = scale
+        self.scale = scale
+        self.adaptive = adaptive
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.target_face_size = target_face_size
+        self.tiled = tiled
+        self.tile_size = tile_size
+        self.tile_min_width = tile_min_width
+        self.max_tiles = max_tiles
+
+        # Gợi ý cho tile: box dự đoán của tracker, mask chuyển động từ scheduler
+        self.hints = []
+        self.motion_mask = None
+        self._face_heights = deque(maxlen=history)
+        self._empty_passes = 0
+
+    def set_hints(self, boxes=None, motion_mask=None):
+        """Cập nhật vị trí khuôn mặt dự đoán và mask chuyển động (tuỳ chọn)"""
+        self.hints = list(boxes or [])
+        self.motion_mask = motion_mask
+
+    def _use_tiles(self, width):
+        if self.tiled == 'auto':
+            return width >= self.tile_min_width
+        return bool(self.tiled)
+
+    def plan(self, frame_shape):
+        """Returns: list DetectionPass cho frame có kích thước frame_shape"""
+        height, width = frame_shape[:2]
+        region = _to_pixels(self.roi, width, height)
+        passes = [DetectionPass(region, self.scale)]
+        if self._use_tiles(width):
+            passes += self._tile_passes(region, width, height)
+        return passes
+
+    def snapshot(self, frame_shape):
+        """Kế hoạch cố định cho 1 frame (an toàn khi gửi sang process khác)"""
+        return FixedPlan(self.plan(frame_shape))
+
+    def _tile_passes(self, region, width, height):
+        """Các tile cần phóng to: chứa khuôn mặt nhỏ dự đoán hoặc có chuyển động"""
+        fine_scale = min(self.max_scale, self.scale * 2)
+        if fine_scale <= self.scale:
+            return []
+        x0, y0, x1, y1 = region
+        step = max(1, int(self.tile_size * 0.8))  # chồng lấn 20% để không cắt mặt
+        scored = []
+        for ty in range(y0, max(y0 + 1, y1 - self.tile_size // 5), step):
+            for tx in range(x0, max(x0 + 1, x1 - self.tile_size // 5), step):
+                tile = (tx, ty, min(x1, tx + self.tile_size), min(y1, ty + self.tile_size))
+                score = self._tile_score(tile, width, height)
+                if score > 0:
+                    scored.append((score, tile))
+        scored.sort(reverse=True)
+        return [DetectionPass(tile, fine_scale) for _, tile in scored[:self.max_tiles]]
+
+    def _tile_score(self, tile, width, height):
+        tx0, ty0, tx1, ty1 = tile
+        score = 0.0
+        for top, right, bottom, left in self.hints:
+            # Chỉ cần phóng to cho khuôn mặt quá nhỏ ở lượt thô
+            if (bottom - top) * self.scale >= self.target_face_size:
+                continue
+            if left < tx1 and right > tx0 and top < ty1 and bottom > ty0:
+                score += 1.0
+        if self.motion_mask is not None:
+            mask_h, mask_w = self.motion_mask.shape[:2]
+            mx0, mx1 = tx0 * mask_w // width, max(tx0 * mask_w // width + 1, tx1 * mask_w // width)
+            my0, my1 = ty0 * mask_h // height, max(ty0 * mask_h // height + 1, ty1 * mask_h // height)
+            cell = self.motion_mask[my0:my1, mx0:mx1]
+            if cell.size:
+                score += float(cell.mean())
+        return score
+
+    def observe(self, locations):
+        """Cập nhật tỉ lệ theo kích thước khuôn mặt vừa detect (toạ độ frame gốc)"""
+        if not self.adaptive:
+            return
+        if locations:
+            self._empty_passes = 0
+            for top, right, bottom, left in locations:
+                self._face_heights.append(bottom - top)
+        else:
+            self._empty_passes += 1
+            if self._empty_passes >= self._face_heights.maxlen:
+                # Lâu không thấy ai: quay về tỉ lệ gốc để phát hiện người ở xa
+                self._face_heights.clear()
+
+        if self._face_heights:
+            # Khuôn mặt nhỏ nhất gần đây (trừ hao 20% cho người đứng xa hơn)
+            smallest = min(self._face_heights) * 0.8
+            wanted = self.target_face_size / max(smallest, 1)
+        else:
+            wanted = self.base_scale
+        wanted = min(self.max_scale, max(self.min_scale, wanted))
+        self.scale = 0.7 * self.scale + 0.3 * wanted
@@ -0,0 +1,64 @@
+"""
+Hàng đợi sự kiện giữa các thread nền (nhận diện, chấm công) và vòng lặp Tkinter
+- Thread nền publish sự kiện, không chạm vào widget
+- Vòng lặp Tk lấy hết sự kiện mỗi interval_ms (root.after), xử lý theo lô nên
+  số lần vẽ lại giao diện không tăng theo số người đến cùng lúc
+- Sự kiện dạng trạng thái (publish_latest) chỉ giữ giá trị mới nhất theo key
+"""
+import threading
+from collections import deque
+
+
+class EventBus:
+    """Hàng đợi sự kiện nhiều thread ghi, 1 thread (Tk) đọc theo lô"""
+
+    def __init__(self, max_events=10000):
+        """max_events: số sự kiện tối đa chờ xử lý (quá thì bỏ sự kiện cũ nhất)"""
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        self._latest = {}
+        self.dropped = 0
+
+    def publish(self, kind, data=None):
+        """Thêm 1 sự kiện (mọi sự kiện đều được giao, theo thứ tự)"""
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append((kind, data))
+
+    def publish_latest(self, key, data):
+        """Cập nhật trạng thái; các giá trị chưa được đọc bị thay bằng giá trị mới"""
+        with self._lock:
+            self._latest[key] = data
+
+    def drain(self):
+        """Returns: (list (kind, data) theo thứ tự, dict trạng thái mới nhất)"""
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            latest, self._latest = self._latest, {}
+        return events, latest
+
+    def pump(self, root, handler, interval_ms=100):
+        """
+        Gọi handler(events, latest) trên thread Tk mỗi interval_ms nếu có sự kiện
+        Returns: hàm dừng vòng lặp
+        """
+        state = {'after_id': None}
+
+        def tick():
+            events, latest = self.drain()
+            if events or latest:
+                try:
+                    handler(events, latest)
+                except Exception as e:
+                    print(f"Lỗi xử lý sự kiện giao diện: {e}")
+            state['after_id'] = root.after(interval_ms, tick)
+
+        def stop():
+            if state['after_id'] is not None:
+                root.after_cancel(state['after_id'])
+                state['after_id'] = None
+
+        state['after_id'] = root.after(interval_ms, tick)
+        return stop
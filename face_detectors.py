@@ -0,0 +1,159 @@
+"""
+Các backend phát hiện khuôn mặt cho FaceRecognizer
+- hog:  face_recognition (dlib HOG) - mặc định, chính xác, chậm nhất
+- haar: Haar cascade có sẵn trong opencv-python - rất nhanh, cho máy yếu
+- dnn:  OpenCV DNN (SSD ResNet-10) từ file model local - cân bằng
+Mọi detector nhận ảnh RGB, trả về list (top, right, bottom, left) và tự đo
+chi phí mỗi frame
+"""
+import os
+import threading
+import time
+
+import cv2
+
+
+class FaceDetector:
+    """Interface chung cho các detector"""
+    name = 'base'
+
+    def __init__(self, **options):
+        self.options = options
+        self.last_cost = 0.0   # giây
+        self.avg_cost = None   # giây, trung bình trượt
+        self.calls = 0
+        # Nhiều thread nhận diện (nhiều camera) dùng chung 1 detector
+        self._cost_lock = threading.Lock()
+
+    @property
+    def spec(self):
+        """(tên, tham số) để tạo lại detector ở process khác"""
+        return self.name, dict(self.options)
+
+    @property
+    def avg_cost_ms(self):
+        return (self.avg_cost or 0.0) * 1000
+
+    def record_cost(self, cost):
+        """Ghi nhận chi phí 1 lần detect (gọi được từ nhiều thread)"""
+        with self._cost_lock:
+            self.last_cost = cost
+            self.avg_cost = cost if self.avg_cost is None else 0.9 * self.avg_cost + 0.1 * cost
+            self.calls += 1
+
+    def detect(self, rgb_image):
+        """Returns: list (top, right, bottom, left) trên ảnh đầu vào"""
+        start = time.perf_counter()
+        boxes = self._detect(rgb_image)
+        self.record_cost(time.perf_counter() - start)
+        return boxes
+
+    def warm_up(self, rgb_image):
+        """Chạy detect 1 lần (nạp model) mà không ghi chi phí"""
+        self._detect(rgb_image)
+
+    def _detect(self, rgb_image):
+        raise NotImplementedError
+
+
+class HogDetector(FaceDetector):
+    """Detector HOG của dlib qua face_recognition (hành vi cũ)"""
+    name = 'hog'
+
+    def __init__(self, upsample=1):
+        super().__init__(upsample=upsample)
+        self.upsample = upsample
+
+    def _detect(self, rgb_image):
+        import face_recognition
+        return face_recognition.face_locations(
+            rgb_image, number_of_times_to_upsample=self.upsample, model='hog'
+        )
+
+
+class HaarCascadeDetector(FaceDetector):
+    """Haar cascade đi kèm opencv-python (cv2.data.haarcascades)"""
+    name = 'haar'
+
+    def __init__(self, cascade='haarcascade_frontalface_default.xml', scale_factor=1.1,
+                 min_neighbors=5, min_size=20):
+        super().__init__(cascade=cascade, scale_factor=scale_factor,
+                         min_neighbors=min_neighbors, min_size=min_size)
+        path = cascade if os.path.isfile(cascade) else os.path.join(cv2.data.haarcascades, cascade)
+        self.classifier = cv2.CascadeClassifier(path)
+        if self.classifier.empty():
+            raise FileNotFoundError(f"Không load được Haar cascade: {path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def _detect(self, rgb_image):
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        gray = cv2.equalizeHist(gray)
+        faces = self.classifier.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=(self.min_size, self.min_size)
+        )
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in faces]
+
+
+class DnnDetector(FaceDetector):
+    """
+    OpenCV DNN với model SSD (mặc định ResNet-10 300x300 của OpenCV)
+    Cần tải model về thư mục models/:
+        deploy.prototxt
+        res10_300x300_ssd_iter_140000.caffemodel
+    """
+    name = 'dnn'
+
+    def __init__(self, model='models/res10_300x300_ssd_iter_140000.caffemodel',
+                 config='models/deploy.prototxt', input_size=300, confidence=0.5):
+        super().__init__(model=model, config=config, input_size=input_size,
+                         confidence=confidence)
+        for path in (model, config):
+            if path and not os.path.isfile(path):
+                raise FileNotFoundError(f"Không tìm thấy file model DNN: {path}")
+        self.net = cv2.dnn.readNet(model, config) if config else cv2.dnn.readNet(model)
+        self.input_size = input_size
+        self.confidence = confidence
+
+    def _detect(self, rgb_image):
+        height, width = rgb_image.shape[:2]
+        # Model được train với ảnh BGR nên đổi kênh R/B khi tạo blob
+        blob = cv2.dnn.blobFromImage(
+            rgb_image, 1.0, (self.input_size, self.input_size),
+            (104.0, 177.0, 123.0), swapRB=True
+        )
+        self.net.setInput(blob)
+        detections = self.net.forward()
+
+        boxes = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < self.confidence:
+                continue
+            x1, y1, x2, y2 = detections[0, 0, i, 3:7]
+            left = max(0, int(x1 * width))
+            top = max(0, int(y1 * height))
+            right = min(width, int(x2 * width))
+            bottom = min(height, int(y2 * height))
+            if right > left and bottom > top:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+
+DETECTORS = {
+    HogDetector.name: HogDetector,
+    HaarCascadeDetector.name: HaarCascadeDetector,
+    DnnDetector.name: DnnDetector,
+}
+
+
+def create_detector(name='hog', **options):
+    """Tạo detector theo tên ('hog', 'haar', 'dnn')"""
+    if isinstance(name, FaceDetector):
+        return name
+    if name not in DETECTORS:
+        raise ValueError(f"Detector không hỗ trợ: {name} (chọn: {', '.join(DETECTORS)})")
+    return DETECTORS[name](**options)
@@ -0,0 +1,793 @@
+"""
+Chỉ mục encoding khuôn mặt đã biết cho bước so khớp
+- Ma trận float32 liên tục, cấp phát trước, tăng gấp đôi khi đầy
+- Lưu sẵn bình phương độ dài từng vector (|k|²)
+- So khớp tất cả khuôn mặt của 1 frame trong 1 phép nhân ma trận:
+  d² = |q|² + |k|² - 2 q·kᵀ
+- Thêm / xoá 1 nhân viên O(1) (xoá bằng cách đổi chỗ với hàng cuối)
+- QuantizedMatrix (tuỳ chọn): quét trên bản float16 / int8, xếp hạng lại
+  chính xác bằng float32
+- IVFIndex (tuỳ chọn): tìm gần đúng cho danh sách rất lớn (100k+ khuôn mặt),
+  chia cụm bằng k-means, chỉ quét nprobe cụm gần query nhất
+- TemplateGallery: nhiều template mỗi nhân viên, lọc theo tâm trước khi so từng template
+"""
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+def _same_file(source):
+    """File nguồn (file, offset, bước, [inode]) vẫn là file đã map (chưa bị gộp / thay)"""
+    if len(source) < 4:
+        return os.path.exists(source[0])
+    try:
+        return os.stat(source[0]).st_ino == source[3]
+    except OSError:
+        return False
+
+
+class EmbeddingMatrix:
+    """Ma trận encoding (N x dim) kèm ánh xạ mã nhân viên <-> hàng"""
+
+    def __init__(self, dim=128, capacity=64):
+        self.dim = dim
+        self._data = np.zeros((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self.ids = []     # hàng i -> mã nhân viên
+        self._rows = {}   # mã nhân viên -> hàng
+        self._mapped = None  # (file, offset) nếu _data là memmap chưa bị sửa
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getstate__(self):
+        # Gửi được sang process khác (chỉ các hàng đang dùng, không kèm lock);
+        # ma trận map từ file thì process kia map lại cùng file (dùng chung page)
+        with self._lock:
+            if self._mapped is not None and _same_file(self._mapped):
+                return {'dim': self.dim, 'ids': list(self.ids), 'mapped': self._mapped}
+        ids, matrix = self.snapshot()
+        return {'dim': self.dim, 'ids': ids, 'matrix': matrix}
+
+    def __setstate__(self, state):
+        self.__init__(state['dim'], max(len(state['ids']), 1))
+        if state.get('mapped'):
+            if not _same_file(state['mapped']):
+                raise ValueError(f"{state['mapped'][0]} đã bị thay (gộp file), cần gửi bản copy")
+            path, offset, stride = state['mapped'][:3]
+            raw = np.memmap(path, dtype=np.uint8, mode='c')
+            matrix = np.ndarray((len(state['ids']), state['dim']), dtype=np.float32, buffer=raw,
+                                offset=offset, strides=(stride, 4))
+            self.map(state['ids'], matrix, state['mapped'])
+        else:
+            self.load(state['ids'], state['matrix'])
+
+    def __contains__(self, employee_id):
+        return employee_id in self._rows
+
+    @property
+    def capacity(self):
+        return self._sq_norms.shape[0]
+
+    @property
+    def matrix(self):
+        """View (N x dim) các hàng đang dùng, không copy"""
+        return self._data[:len(self.ids)]
+
+    def _reserve(self, size):
+        if size <= self.capacity:
+            return
+        capacity = max(self.capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        self._grow(capacity, len(self.ids))
+
+    def _grow(self, capacity, count):
+        data = np.zeros((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        data[:count] = self._data[:count]
+        sq_norms[:count] = self._sq_norms[:count]
+        self._data, self._sq_norms = data, sq_norms
+        self._mapped = None
+
+    def _write_rows(self, start, vectors):
+        end = start + len(vectors)
+        self._data[start:end] = vectors
+        self._sq_norms[start:end] = np.einsum('ij,ij->i', vectors, vectors)
+        self._mapped = None
+
+    def _move_row(self, dst, src):
+        self._data[dst] = self._data[src]
+        self._sq_norms[dst] = self._sq_norms[src]
+        self._mapped = None
+
+    def map(self, employee_ids, matrix, source=None):
+        """
+        Dùng trực tiếp ma trận float32 có sẵn (ví dụ np.memmap mode 'c'), không copy
+        source: (file, offset byte hàng đầu, bước byte giữa 2 hàng, inode) để process
+            khác map lại cùng file thay vì nhận bản copy (file đã bị thay thì gửi copy)
+        Thêm nhân viên sau đó sẽ chép ma trận vào RAM (khi cần tăng dung lượng)
+        """
+        employee_ids = list(employee_ids)
+        if matrix.ndim != 2 or matrix.dtype != np.float32 or matrix.strides[1] != 4:
+            self.load(employee_ids, matrix)
+            return
+        sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+        mapped = tuple(source) if source else None
+        with self._lock:
+            self._data, self._sq_norms = matrix, sq_norms
+            self.ids = employee_ids
+            self._rows = {employee_id: row for row, employee_id in enumerate(employee_ids)}
+            self._mapped = mapped
+
+    def load(self, employee_ids, encodings):
+        """Thay toàn bộ nội dung (N mã nhân viên, ma trận N x dim)"""
+        employee_ids = list(employee_ids)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            self.ids = []
+            self._rows = {}
+            if self._mapped is not None or not self._data.flags.writeable:
+                # Không ghi đè lên ma trận đang map từ file
+                self._data = np.zeros((0, self.dim), dtype=np.float32)
+                self._sq_norms = np.zeros(0, dtype=np.float32)
+                self._mapped = None
+            self._reserve(len(employee_ids))
+            self._write_rows(0, encodings)
+            self.ids = employee_ids
+            self._rows = {employee_id: row for row, employee_id in enumerate(employee_ids)}
+
+    def add(self, employee_id, encoding):
+        """Thêm (hoặc thay) encoding của 1 nhân viên"""
+        vector = np.asarray(encoding, dtype=np.float32).reshape(1, self.dim)
+        with self._lock:
+            row = self._rows.get(employee_id)
+            if row is None:
+                row = len(self.ids)
+                self._reserve(row + 1)
+                self.ids.append(employee_id)
+                self._rows[employee_id] = row
+            self._write_rows(row, vector)
+
+    def remove(self, employee_id):
+        """Xoá 1 nhân viên: chuyển hàng cuối vào chỗ trống"""
+        with self._lock:
+            row = self._rows.pop(employee_id, None)
+            if row is None:
+                return False
+            last = len(self.ids) - 1
+            if row != last:
+                moved_id = self.ids[last]
+                self._move_row(row, last)
+                self.ids[row] = moved_id
+                self._rows[moved_id] = row
+            self.ids.pop()
+            return True
+
+    def snapshot(self):
+        """(list mã nhân viên, bản copy ma trận) để gửi sang process khác"""
+        with self._lock:
+            return list(self.ids), self.matrix.copy()
+
+    def search(self, queries):
+        """
+        Nhân viên gần nhất cho từng query
+        queries: ma trận (M x dim)
+        Returns: (list mã nhân viên, mảng khoảng cách Euclid); mã là None nếu chưa có ai
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if len(queries) == 0:
+            return [], np.empty(0, dtype=np.float32)
+        with self._lock:
+            count = len(self.ids)
+            if count == 0:
+                return [None] * len(queries), np.full(len(queries), np.inf, dtype=np.float32)
+            best, best_sq = self._nearest(queries, count)
+            best_ids = [self.ids[row] for row in best]
+        best_sq = best_sq + np.einsum('ij,ij->i', queries, queries)
+        return best_ids, np.sqrt(np.maximum(best_sq, 0.0))
+
+    def _scores(self, queries, count):
+        """|k|² - 2 q·k cho tất cả các hàng (M x N), thứ tự giống khoảng cách"""
+        return self._sq_norms[:count] - 2.0 * (queries @ self._data[:count].T)
+
+    def _nearest(self, queries, count):
+        """Hàng gần nhất và |k|² - 2 q·k tương ứng (chưa cộng |q|²)"""
+        sq_dists = self._scores(queries, count)
+        best = np.argmin(sq_dists, axis=1)
+        return best, sq_dists[np.arange(len(queries)), best]
+
+    def candidates(self, queries, k):
+        """k nhân viên gần nhất (không theo thứ tự) cho từng query"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            count = len(self.ids)
+            if count == 0 or len(queries) == 0:
+                return [[] for _ in range(len(queries))]
+            scores = self._scores(queries, count)
+            k = min(k, count)
+            rows = np.argpartition(scores, k - 1, axis=1)[:, :k] if k < count else \
+                np.broadcast_to(np.arange(count), (len(queries), count))
+            return [[self.ids[row] for row in query_rows] for query_rows in rows]
+
+    def get(self, employee_id):
+        """Encoding float32 của 1 nhân viên (None nếu không có)"""
+        with self._lock:
+            row = self._rows.get(employee_id)
+            return None if row is None else np.array(self._data[row])
+
+    def match(self, queries, tolerance):
+        """Returns: list mã nhân viên (None nếu khoảng cách > tolerance)"""
+        best_ids, dists = self.search(queries)
+        return [
+            employee_id if dist <= tolerance else None
+            for employee_id, dist in zip(best_ids, dists)
+        ]
+
+
+class QuantizedMatrix(EmbeddingMatrix):
+    """
+    EmbeddingMatrix quét trên bản lượng tử hoá (float16 hoặc int8 + scale từng vector)
+    - Quét gần đúng toàn bộ danh sách, lấy `shortlist` ứng viên gần nhất
+    - Tính lại chính xác bằng float32 cho các ứng viên rồi mới so tolerance,
+      nên quyết định nhận diện giống EmbeddingMatrix
+    - spill_dir: hàng float32 chính xác nằm trong file memmap tạm, không tên, riêng
+      của object này trong thư mục đó (tự xoá khi đóng); RAM chỉ giữ bản lượng tử
+      hoá (int8: ~136 byte/người thay vì 1 KB float64)
+    - Không spill thì bản float32 nằm trong RAM cạnh bản lượng tử hoá (tốn hơn
+      EmbeddingMatrix), chỉ nên dùng khi danh sách nhỏ
+    """
+
+    def __init__(self, dim=128, capacity=64, dtype='int8', shortlist=8, spill_dir=None,
+                 chunk_rows=4096):
+        if dtype not in ('int8', 'float16'):
+            raise ValueError(f"Kiểu lượng tử hoá không hỗ trợ: {dtype} (chọn: int8, float16)")
+        self.code_dtype = np.dtype(dtype)
+        self.shortlist = shortlist
+        self.spill_dir = spill_dir
+        self.chunk_rows = chunk_rows
+        self._spill_file = None
+        self._codes = np.zeros((0, dim), dtype=self.code_dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        super().__init__(dim, 0)
+        self._grow(capacity, 0)
+
+    def __getstate__(self):
+        # Process khác nhận bản copy; nếu đang spill thì bản copy spill ra file tạm
+        # riêng cùng thư mục (không dùng chung file vì process này còn ghi)
+        state = super().__getstate__()
+        state.update(dtype=self.code_dtype.name, shortlist=self.shortlist, spill_dir=self.spill_dir)
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(state['dim'], max(len(state['ids']), 1), state['dtype'], state['shortlist'],
+                      spill_dir=state.get('spill_dir'))
+        self.load(state['ids'], state['matrix'])
+
+    def map(self, employee_ids, matrix, source=None):
+        # Cần tạo bản lượng tử hoá nên luôn chép vào RAM
+        self.load(employee_ids, matrix)
+
+    @property
+    def resident_bytes(self):
+        """Số byte giữ trong RAM cho phần đang dùng"""
+        count = len(self.ids)
+        exact = 0 if self.spill_dir else count * self.dim * 4
+        return count * (self.dim * self.code_dtype.itemsize + 8) + exact
+
+    def _grow(self, capacity, count):
+        codes = np.zeros((capacity, self.dim), dtype=self.code_dtype)
+        scales = np.zeros(capacity, dtype=np.float32)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        codes[:count] = self._codes[:count]
+        scales[:count] = self._scales[:count]
+        sq_norms[:count] = self._sq_norms[:count]
+        if self.spill_dir:
+            # File chỉ dài thêm, dữ liệu cũ giữ nguyên; map lại với kích thước mới
+            if self._spill_file is None:
+                self._spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+            self._spill_file.truncate(capacity * self.dim * 4)
+            data = np.memmap(self._spill_file, dtype=np.float32, mode='r+',
+                             shape=(capacity, self.dim))
+        else:
+            data = np.zeros((capacity, self.dim), dtype=np.float32)
+            data[:count] = self._data[:count]
+        self._codes, self._scales, self._sq_norms, self._data = codes, scales, sq_norms, data
+
+    def _write_rows(self, start, vectors):
+        super()._write_rows(start, vectors)
+        end = start + len(vectors)
+        if self.code_dtype == np.int8:
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._codes[start:end] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[start:end] = scales
+        else:
+            self._codes[start:end] = vectors.astype(np.float16)
+            self._scales[start:end] = 1.0
+
+    def _move_row(self, dst, src):
+        super()._move_row(dst, src)
+        self._codes[dst] = self._codes[src]
+        self._scales[dst] = self._scales[src]
+
+    def _scores(self, queries, count):
+        # Quét gần đúng theo từng khối để bản float32 tạm luôn nhỏ
+        approx = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, self.chunk_rows):
+            end = min(count, start + self.chunk_rows)
+            dots = queries @ self._codes[start:end].astype(np.float32).T
+            approx[:, start:end] = self._sq_norms[start:end] - 2.0 * dots * self._scales[start:end]
+        return approx
+
+    def _nearest(self, queries, count):
+        approx = self._scores(queries, count)
+
+        # Xếp hạng lại chính xác bằng float32 trên shortlist
+        k = min(self.shortlist, count)
+        if k < count:
+            candidates = np.argpartition(approx, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(count), (len(queries), count))
+        best = np.empty(len(queries), dtype=np.int64)
+        best_sq = np.empty(len(queries), dtype=np.float32)
+        for i, rows in enumerate(candidates):
+            rows = np.sort(rows)  # đọc memmap theo thứ tự
+            exact = self._sq_norms[rows] - 2.0 * (self._data[rows] @ queries[i])
+            j = int(np.argmin(exact))
+            best[i], best_sq[i] = rows[j], exact[j]
+        return best, best_sq
+
+
+def kmeans(data, k, iterations=10, seed=0):
+    """K-means đơn giản bằng NumPy, trả về ma trận tâm cụm (k x dim) float32"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = max(1, min(k, len(data)))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    data_sq = np.einsum('ij,ij->i', data, data)
+    for _ in range(iterations):
+        sq_dists = (data_sq[:, None] + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+                    - 2.0 * (data @ centroids.T))
+        assign = np.argmin(sq_dists, axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Cụm rỗng: lấy ngẫu nhiên 1 điểm làm tâm mới
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index: mỗi cụm k-means là 1 EmbeddingMatrix riêng
+    Cùng interface với EmbeddingMatrix (load, add, remove, search, match...)
+    nprobe càng lớn càng chính xác (nprobe = nlist giống tìm vét cạn) nhưng chậm hơn
+    """
+
+    def __init__(self, nlist=None, nprobe=8, dim=128, train_size=64, iterations=10,
+                 path=None, quantize=None, spill_dir=None):
+        """
+        nlist: số cụm (mặc định ~ sqrt(N) khi train)
+        nprobe: số cụm quét cho mỗi query
+        train_size: số điểm mẫu mỗi cụm dùng để train k-means
+        path: file .npz để lưu / load index (ví dụ cạnh employees.pkl)
+        quantize: None, 'int8' hoặc 'float16' - các cụm là QuantizedMatrix
+        spill_dir: với quantize, hàng float32 của mỗi cụm nằm trong file tạm riêng
+            trong thư mục này (mỗi cụm giữ 2 file handle, ~sqrt(N) cụm)
+        """
+        self.dim = dim
+        self.quantize = quantize
+        self.spill_dir = spill_dir
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.iterations = iterations
+        self.path = path
+        self.centroids = None
+        self.lists = []
+        self._assign = {}  # mã nhân viên -> cụm
+        self._trained_size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._assign)
+
+    def __contains__(self, employee_id):
+        return employee_id in self._assign
+
+    def __getstate__(self):
+        ids, matrix = self.snapshot()
+        return {
+            'dim': self.dim, 'nlist': self.nlist, 'nprobe': self.nprobe,
+            'train_size': self.train_size, 'iterations': self.iterations,
+            'centroids': self.centroids, 'ids': ids, 'matrix': matrix,
+            'trained_size': self._trained_size, 'quantize': self.quantize,
+            'spill_dir': self.spill_dir,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['nlist'], state['nprobe'], state['dim'], state['train_size'],
+                      state['iterations'], quantize=state['quantize'],
+                      spill_dir=state.get('spill_dir'))
+        self._restore(state['centroids'], state['ids'], state['matrix'], state['trained_size'])
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    @property
+    def ids(self):
+        with self._lock:
+            return [employee_id for item in self.lists for employee_id in item.ids]
+
+    @property
+    def matrix(self):
+        return self.snapshot()[1]
+
+    def snapshot(self):
+        """(list mã nhân viên, ma trận) gộp tất cả các cụm"""
+        with self._lock:
+            ids = [employee_id for item in self.lists for employee_id in item.ids]
+            matrices = [item.matrix for item in self.lists]
+        matrix = np.concatenate(matrices) if matrices else np.zeros((0, self.dim), np.float32)
+        return ids, matrix
+
+    def train(self, encodings):
+        """Chia cụm k-means trên mẫu của encodings (N x dim)"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(encodings) == 0:
+            return
+        nlist = self.nlist or max(1, int(round(np.sqrt(len(encodings)))))
+        sample = encodings
+        if len(encodings) > nlist * self.train_size:
+            rng = np.random.default_rng(0)
+            sample = encodings[rng.choice(len(encodings), nlist * self.train_size, replace=False)]
+        centroids = kmeans(sample, nlist, self.iterations)
+        with self._lock:
+            self.centroids = centroids
+            self.lists = [self._new_list() for _ in range(len(centroids))]
+            self._assign = {}
+            self._trained_size = len(encodings)
+
+    def _new_list(self):
+        if self.quantize:
+            return QuantizedMatrix(self.dim, 16, dtype=self.quantize, spill_dir=self.spill_dir)
+        return EmbeddingMatrix(self.dim, 16)
+
+    def _nearest_lists(self, queries, count, centroids=None):
+        """Chỉ số `count` cụm gần nhất cho từng query (M x count)"""
+        centroids = self.centroids if centroids is None else centroids
+        sq_dists = np.einsum('ij,ij->i', centroids, centroids)[None, :] - 2.0 * (queries @ centroids.T)
+        count = min(count, len(centroids))
+        if count == len(centroids):
+            return np.argsort(sq_dists, axis=1)
+        nearest = np.argpartition(sq_dists, count - 1, axis=1)[:, :count]
+        return nearest
+
+    def _restore(self, centroids, employee_ids, encodings, trained_size):
+        self.centroids = np.asarray(centroids, dtype=np.float32) if centroids is not None else None
+        self.lists = []
+        self._assign = {}
+        self._trained_size = trained_size
+        if self.centroids is not None:
+            self.lists = [self._new_list() for _ in range(len(self.centroids))]
+            self._add_many(employee_ids, encodings)
+
+    def _add_many(self, employee_ids, encodings):
+        employee_ids = list(employee_ids)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if not employee_ids:
+            return
+        assign = self._nearest_lists(encodings, 1)[:, 0]
+        with self._lock:
+            for list_idx in np.unique(assign):
+                rows = np.flatnonzero(assign == list_idx)
+                target = self.lists[list_idx]
+                for row in rows:
+                    target.add(employee_ids[row], encodings[row])
+                    self._assign[employee_ids[row]] = int(list_idx)
+
+    def load(self, employee_ids, encodings):
+        """
+        Thay toàn bộ nội dung; chỉ train lại k-means khi chưa train hoặc danh
+        sách đã lớn gấp đôi lúc train (tâm cụm load từ file được dùng lại)
+        """
+        employee_ids = list(employee_ids)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        retrained = False
+        if not self.trained or len(employee_ids) > 2 * max(self._trained_size, 1):
+            self.train(encodings)
+            retrained = True
+        with self._lock:
+            for item in self.lists:
+                item.load([], [])
+            self._assign = {}
+        self._add_many(employee_ids, encodings)
+        if retrained and self.path:
+            self.save()
+
+    def add(self, employee_id, encoding):
+        """Thêm (hoặc thay) encoding của 1 nhân viên vào cụm gần nhất"""
+        vector = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        if not self.trained:
+            self.train(vector[None, :])
+        self.remove(employee_id)
+        list_idx = int(self._nearest_lists(vector[None, :], 1)[0, 0])
+        with self._lock:
+            self.lists[list_idx].add(employee_id, vector)
+            self._assign[employee_id] = list_idx
+
+    def remove(self, employee_id):
+        with self._lock:
+            list_idx = self._assign.pop(employee_id, None)
+            if list_idx is None:
+                return False
+            return self.lists[list_idx].remove(employee_id)
+
+    def search(self, queries, nprobe=None):
+        """Giống EmbeddingMatrix.search nhưng chỉ quét nprobe cụm gần nhất"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        best_ids = [None] * len(queries)
+        best_dists = np.full(len(queries), np.inf, dtype=np.float32)
+        with self._lock:
+            centroids, lists = self.centroids, self.lists
+        if len(queries) == 0 or centroids is None:
+            return best_ids, best_dists
+        probes = self._nearest_lists(queries, nprobe or self.nprobe, centroids)
+        # Gom các query cùng quét 1 cụm để mỗi cụm chỉ nhân ma trận 1 lần
+        for list_idx in np.unique(probes):
+            rows = np.flatnonzero((probes == list_idx).any(axis=1))
+            ids, dists = lists[list_idx].search(queries[rows])
+            for row, employee_id, dist in zip(rows, ids, dists):
+                if employee_id is not None and dist < best_dists[row]:
+                    best_dists[row] = dist
+                    best_ids[row] = employee_id
+        return best_ids, best_dists
+
+    def candidates(self, queries, k, nprobe=None):
+        """k nhân viên gần nhất trong mỗi cụm được quét (gộp lại) cho từng query"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        result = [[] for _ in range(len(queries))]
+        with self._lock:
+            centroids, lists = self.centroids, self.lists
+        if len(queries) == 0 or centroids is None:
+            return result
+        probes = self._nearest_lists(queries, nprobe or self.nprobe, centroids)
+        for list_idx in np.unique(probes):
+            rows = np.flatnonzero((probes == list_idx).any(axis=1))
+            for row, ids in zip(rows, lists[list_idx].candidates(queries[rows], k)):
+                result[row] += ids
+        return result
+
+    def get(self, employee_id):
+        with self._lock:
+            list_idx = self._assign.get(employee_id)
+            target = None if list_idx is None else self.lists[list_idx]
+        return None if target is None else target.get(employee_id)
+
+    def match(self, queries, tolerance):
+        best_ids, dists = self.search(queries)
+        return [
+            employee_id if dist <= tolerance else None
+            for employee_id, dist in zip(best_ids, dists)
+        ]
+
+    def save(self, path=None):
+        """Lưu tâm cụm và nội dung các cụm ra file .npz (ghi file tạm rồi thay thế)"""
+        path = path or self.path
+        ids, matrix = self.snapshot()
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            centroids=self.centroids if self.trained else np.zeros((0, self.dim), np.float32),
+            ids=np.array([str(employee_id) for employee_id in ids]),
+            matrix=matrix,
+            params=np.array([self.nlist or 0, self.nprobe, self._trained_size]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path, nprobe=None, **options):
+        """Load index từ file nếu có, ngược lại tạo index rỗng (train khi load dữ liệu)"""
+        index = cls(path=path, **options)
+        if os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    nlist, saved_nprobe, trained_size = (int(v) for v in data['params'])
+                    index.nlist = nlist or index.nlist
+                    index.nprobe = saved_nprobe
+                    centroids = data['centroids'] if len(data['centroids']) else None
+                    index._restore(centroids, [str(v) for v in data['ids']], data['matrix'],
+                                   trained_size)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Không load được ANN index {path}: {e}")
+        if nprobe:
+            index.nprobe = nprobe
+        return index
+
+
+class TemplateGallery:
+    """
+    Nhiều ảnh mẫu (template) cho mỗi nhân viên
+    - Index bên trong (flat / lượng tử hoá / IVF) chỉ chứa tâm (trung bình) các
+      template của từng người, nên chi phí quét gần như 1 vector/người
+    - Lọc trước `candidates` người có tâm gần nhất, rồi mới so chính xác với
+      từng template của những người này
+    - Chỉ nhân viên có từ 2 template trở lên mới giữ thêm template trong RAM
+    - Giữ tối đa max_templates template mới nhất mỗi người (giống database)
+    """
+
+    def __init__(self, index=None, candidates=4, dim=128, max_templates=10):
+        self.index = index if index is not None else EmbeddingMatrix(dim)
+        self.candidate_count = candidates
+        self.dim = dim
+        self.max_templates = max_templates
+        self.templates = {}  # mã nhân viên -> ma trận template (T x dim), chỉ khi T > 1
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, employee_id):
+        return employee_id in self.index
+
+    def __getstate__(self):
+        with self._lock:
+            templates = dict(self.templates)
+        return {'index': self.index, 'candidates': self.candidate_count, 'dim': self.dim,
+                'max_templates': self.max_templates, 'templates': templates}
+
+    def __setstate__(self, state):
+        self.__init__(state['index'], state['candidates'], state['dim'], state['max_templates'])
+        self.templates = state['templates']
+
+    @property
+    def ids(self):
+        return self.index.ids
+
+    @property
+    def matrix(self):
+        """Ma trận tâm template của từng nhân viên"""
+        return self.index.matrix
+
+    @property
+    def path(self):
+        return getattr(self.index, 'path', None)
+
+    def save(self, path=None):
+        self.index.save(path)
+
+    def snapshot(self):
+        return self.index.snapshot()
+
+    def _as_templates(self, encodings):
+        """Ma trận template (T x dim), bỏ các template cũ nhất nếu quá max_templates"""
+        return np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)[-self.max_templates:]
+
+    def load(self, employee_ids, encodings):
+        """
+        employee_ids: N mã nhân viên
+        encodings: N phần tử, mỗi phần tử 1 encoding hoặc list / ma trận template
+        """
+        employee_ids = list(employee_ids)
+        templates = {}
+        centroids = np.zeros((len(employee_ids), self.dim), dtype=np.float32)
+        for row, (employee_id, encoding) in enumerate(zip(employee_ids, encodings)):
+            vectors = self._as_templates(encoding)
+            centroids[row] = vectors.mean(axis=0)
+            if len(vectors) > 1:
+                templates[employee_id] = vectors
+        with self._lock:
+            self.templates = templates
+        self.index.load(employee_ids, centroids)
+
+    def map(self, row_ids, matrix, source=None):
+        """
+        Load từ ma trận template có sẵn (mỗi hàng 1 template, row_ids[i] là chủ hàng i)
+        Mỗi người 1 template và index hỗ trợ map: dùng thẳng ma trận, không copy
+        """
+        row_ids = list(row_ids)
+        if len(set(row_ids)) == len(row_ids) and hasattr(self.index, 'map'):
+            with self._lock:
+                self.templates = {}
+            self.index.map(row_ids, matrix, source)
+            return
+        groups = {}
+        for row, employee_id in enumerate(row_ids):
+            groups.setdefault(employee_id, []).append(row)
+        self.load(list(groups), [matrix[rows] for rows in groups.values()])
+
+    def add(self, employee_id, encodings):
+        """Thêm / thay toàn bộ template của 1 nhân viên"""
+        vectors = self._as_templates(encodings)
+        with self._lock:
+            if len(vectors) > 1:
+                self.templates[employee_id] = vectors
+            else:
+                self.templates.pop(employee_id, None)
+        self.index.add(employee_id, vectors.mean(axis=0))
+
+    def add_template(self, employee_id, encoding):
+        """Thêm 1 template cho nhân viên đã có (hoặc tạo mới)"""
+        current = self.templates.get(employee_id)
+        if current is None:
+            current = self.index.get(employee_id)
+        vectors = self._as_templates(encoding)
+        if current is not None:
+            vectors = np.vstack([self._as_templates(current), vectors])
+        self.add(employee_id, vectors)
+
+    def remove(self, employee_id):
+        with self._lock:
+            self.templates.pop(employee_id, None)
+        return self.index.remove(employee_id)
+
+    def search(self, queries):
+        """Nhân viên có template gần nhất (sau khi lọc theo tâm) cho từng query"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        best_ids, best_dists = self.index.search(queries)
+        with self._lock:
+            templates = self.templates
+        if not templates or len(queries) == 0:
+            # Mỗi người 1 template: tâm chính là template, kết quả index là chính xác
+            return best_ids, best_dists
+
+        best_dists = np.array(best_dists, dtype=np.float32)
+        candidates = self.index.candidates(queries, self.candidate_count)
+        for i, query in enumerate(queries):
+            names = set(candidates[i])
+            if best_ids[i] is not None:
+                names.add(best_ids[i])
+            best_ids[i], best_dists[i] = None, np.inf
+            for employee_id in names:
+                vectors = templates.get(employee_id)
+                if vectors is None:
+                    vectors = self.index.get(employee_id)
+                    if vectors is None:
+                        continue
+                dist = float(np.sqrt(((self._as_templates(vectors) - query) ** 2).sum(axis=1).min()))
+                if dist < best_dists[i]:
+                    best_ids[i], best_dists[i] = employee_id, dist
+        return best_ids, best_dists
+
+    def match(self, queries, tolerance):
+        best_ids, dists = self.search(queries)
+        return [
+            employee_id if dist <= tolerance else None
+            for employee_id, dist in zip(best_ids, dists)
+        ]
+
+
+INDEXES = ('flat', 'ivf')
+QUANTIZE = ('int8', 'float16')
+
+
+def create_index(name='flat', db_file=None, quantize=None, spill=False, **options):
+    """
+    Tạo index so khớp theo tên
+    flat: EmbeddingMatrix, tìm chính xác (mặc định)
+    ivf: IVFIndex, lưu cạnh file database (employees.pkl -> employees.ivf.npz)
+    quantize: 'int8' / 'float16' để quét trên bản lượng tử hoá (QuantizedMatrix)
+    spill: với quantize (flat hoặc ivf), hàng float32 nằm trong file tạm riêng của
+        process này (cùng thư mục database, tự xoá khi thoát) thay vì RAM
+    """
+    spill_dir = None
+    if quantize and spill:
+        spill_dir = os.path.dirname(os.path.abspath(db_file)) if db_file else tempfile.gettempdir()
+    if name == 'flat':
+        if not quantize:
+            return EmbeddingMatrix()
+        return QuantizedMatrix(dtype=quantize, spill_dir=spill_dir, **options)
+    if name == 'ivf':
+        if db_file:
+            return IVFIndex.open(os.path.splitext(db_file)[0] + '.ivf.npz', quantize=quantize,
+                                 spill_dir=spill_dir, **options)
+        return IVFIndex(quantize=quantize, spill_dir=spill_dir, **options)
+    raise ValueError(f"Index không hỗ trợ: {name} (chọn: {', '.join(INDEXES)})")
@@ -1,85 +1,255 @@
 """
 Module nhận diện khuôn mặt sử dụng face_recognition library
+face_recognition (dlib + model) chỉ được import khi cần hoặc trong warm_up()
+để cửa sổ ứng dụng hiện lên trước
 """
+import time
+
 import cv2
-import face_recognition
 import numpy as np
 
+from detection_planner import DetectionPass
+from face_detectors import create_detector
+from face_index import EmbeddingMatrix, TemplateGallery
+from face_tracker import box_iou
+
+def face_templates(employee):
+    """Các template của 1 nhân viên (database cũ chỉ có 'face_encoding')"""
+    return employee.get('face_encodings') or [employee['face_encoding']]
+
+
 class FaceRecognizer:
-    def __init__(self, tolerance=0.6):
+    def __init__(self, tolerance=0.6, detector='hog', two_stage=False, crop_padding=0.25,
+                 crop_face_size=150, index=None):
         """
         tolerance: Ngưỡng để nhận diện (càng nhỏ càng strict)
         0.6 là giá trị mặc định tốt
+        detector: backend phát hiện khuôn mặt mặc định ('hog', 'haar', 'dnn')
+            hoặc 1 FaceDetector có sẵn
+        two_stage: True = detector rẻ chỉ đề xuất box trên frame nhỏ, landmark và
+            encoding chạy trên vùng cắt từ frame gốc độ phân giải đầy đủ
+        crop_padding: phần mở rộng quanh box khi cắt (tỉ lệ theo kích thước mặt)
+        crop_face_size: chiều cao khuôn mặt tối đa (pixel) trên vùng cắt khi encode
+        index: index so khớp (EmbeddingMatrix mặc định, IVFIndex cho danh sách rất lớn)
         """
         self.tolerance = tolerance
-        self.known_face_encodings = []
-        self.known_face_ids = []
+        self.detector = create_detector(detector)
+        self.two_stage = two_stage
+        self.crop_padding = crop_padding
+        self.crop_face_size = crop_face_size
+        index = index if index is not None else EmbeddingMatrix()
+        # Mỗi nhân viên có thể có nhiều template, index chỉ chứa tâm template
+        self.known_faces = index if isinstance(index, TemplateGallery) else TemplateGallery(index)
+    
+    @property
+    def known_face_ids(self):
+        return list(self.known_faces.ids)
+    
+    @property
+    def known_face_encodings(self):
+        return self.known_faces.matrix
     
     def load_known_faces(self, employees_dict):
         """Load danh sách khuôn mặt đã biết từ database"""
-        self.known_face_encodings = []
-        self.known_face_ids = []
-        
-        for emp_id, emp_data in employees_dict.items():
-            self.known_face_encodings.append(emp_data['face_encoding'])
-            self.known_face_ids.append(emp_id)
+        ids = list(employees_dict)
+        templates = [face_templates(employees_dict[emp_id]) for emp_id in ids]
+        self.known_faces.load(ids, templates)
+    
+    def load_database(self, db):
+        """
+        Load danh sách khuôn mặt từ database; backend .emb map thẳng ma trận từ file,
+        backend SQLite đọc hàng loạt ma trận, không dựng dict nhân viên
+        """
+        if hasattr(db, 'map_face_matrix'):
+            self.known_faces.map(*db.map_face_matrix())
+        elif hasattr(db, 'load_face_templates'):
+            self.known_faces.load(*db.load_face_templates())
+        else:
+            self.load_known_faces(db.get_all_employees())
     
-    def detect_and_recognize(self, frame):
+    def load_known_matrix(self, employee_ids, encodings):
+        """Load danh sách khuôn mặt đã biết từ ma trận encoding có sẵn (N x 128)"""
+        self.known_faces.load(employee_ids, encodings)
+    
+    def add_known_face(self, employee_id, face_encoding):
+        """Thêm / cập nhật 1 nhân viên mà không load lại toàn bộ"""
+        self.known_faces.add(employee_id, face_encoding)
+    
+    def add_face_template(self, employee_id, face_encoding):
+        """Thêm 1 ảnh mẫu (template) cho nhân viên đã có"""
+        self.known_faces.add_template(employee_id, face_encoding)
+    
+    def remove_known_face(self, employee_id):
+        """Xoá 1 nhân viên khỏi danh sách nhận diện"""
+        return self.known_faces.remove(employee_id)
+    
+    def detect_and_recognize(self, frame, skip_locations=None, skip_iou=0.3, detector=None,
+                             planner=None):
         """
         Phát hiện và nhận diện khuôn mặt trong frame
-        Returns: List of tuples (face_location, employee_id, name)
+        skip_locations: các box (toạ độ frame gốc) đã biết danh tính, ví dụ từ
+            FaceTracker; khuôn mặt trùng các box này sẽ không encode lại
+        detector: FaceDetector riêng (ví dụ theo từng camera), mặc định self.detector
+        planner: DetectionPlanner của camera (ROI, tỉ lệ tự điều chỉnh, tile);
+            None = detect toàn frame ở tỉ lệ 0.25
+        Returns: List of dict (location, employee_id, encoding)
+            encoding là None với khuôn mặt được bỏ qua bước encode
         """
-        # Resize frame để tăng tốc độ xử lý
-        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        detector = detector or self.detector
+        passes = planner.plan(frame.shape) if planner is not None else [
+            DetectionPass((0, 0, frame.shape[1], frame.shape[0]), 0.25)
+        ]
+        
+        # Mỗi lượt: cắt vùng, resize, detect; giữ ảnh RGB để encode sau
+        candidates = []  # (location frame gốc, chỉ số lượt, location trên ảnh lượt đó)
+        pass_images = []
+        for pass_idx, detection_pass in enumerate(passes):
+            x0, y0, x1, y1 = detection_pass.region
+            scale = detection_pass.scale
+            region = frame[y0:y1, x0:x1]
+            if region.size == 0:
+                pass_images.append(None)
+                continue
+            # Resize frame để tăng tốc độ xử lý
+            small_frame = cv2.resize(region, (0, 0), fx=scale, fy=scale)
+            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            pass_images.append(rgb_small_frame)
+            
+            for top, right, bottom, left in detector.detect(rgb_small_frame):
+                # Scale lại vị trí về kích thước ban đầu
+                location = (
+                    int(top / scale) + y0, int(right / scale) + x0,
+                    int(bottom / scale) + y0, int(left / scale) + x0
+                )
+                candidates.append((location, pass_idx, (top, right, bottom, left)))
         
-        # Tìm tất cả khuôn mặt và encoding trong frame
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+        # Bỏ trùng giữa các lượt (ưu tiên lượt có tỉ lệ lớn hơn, box chính xác hơn)
+        candidates.sort(key=lambda c: passes[c[1]].scale, reverse=True)
+        detections = []
+        for candidate in candidates:
+            if all(box_iou(candidate[0], kept[0]) < 0.3 for kept in detections):
+                detections.append(candidate)
         
-        results = []
+        if planner is not None:
+            planner.observe([location for location, _, _ in detections])
         
-        for face_encoding, face_location in zip(face_encodings, face_locations):
-            employee_id = None
-            
-            # Vectorized matching nhanh hơn compare_faces
-            if len(self.known_face_encodings) > 0:
-                enc = face_encoding.astype(np.float32)
-                # Tính khoảng cách Euclidean với tất cả encodings đã biết
-                dists = np.linalg.norm(self.known_face_encodings - enc, axis=1)
-                best_idx = int(np.argmin(dists))
-                
-                # So sánh với tolerance (face_recognition dùng 0.6 mặc định)
-                if dists[best_idx] <= self.tolerance:
-                    employee_id = self.known_face_ids[best_idx]
-            
-            # Scale lại vị trí về kích thước ban đầu
-            top, right, bottom, left = face_location
-            top *= 4
-            right *= 4
-            bottom *= 4
-            left *= 4
-            
+        # Chỉ encode các khuôn mặt chưa có danh tính (bước tốn kém nhất)
+        encodings = {}
+        by_pass = {}
+        for idx, (location, pass_idx, small_location) in enumerate(detections):
+            if skip_locations and any(box_iou(location, box) >= skip_iou for box in skip_locations):
+                continue
+            if self.two_stage:
+                face_encoding = self.encode_crop(frame, location)
+                if face_encoding is not None:
+                    encodings[idx] = face_encoding
+                continue
+            by_pass.setdefault(pass_idx, []).append((idx, small_location))
+        if by_pass:
+            import face_recognition
+        for pass_idx, items in by_pass.items():
+            face_encodings = face_recognition.face_encodings(
+                pass_images[pass_idx], [small_location for _, small_location in items]
+            )
+            for (idx, _), face_encoding in zip(items, face_encodings):
+                encodings[idx] = face_encoding
+        
+        # So khớp tất cả khuôn mặt của frame trong 1 lần
+        encoded = sorted(encodings)
+        matched = dict(zip(encoded, self.match_encodings([encodings[idx] for idx in encoded])))
+        
+        results = []
+        for idx, (location, _, _) in enumerate(detections):
             results.append({
-                'location': (top, right, bottom, left),
-                'employee_id': employee_id,
-                'encoding': face_encoding
+                'location': location,
+                'employee_id': matched.get(idx),
+                'encoding': encodings.get(idx)
             })
         
         return results
     
+    def encode_crop(self, frame, location):
+        """
+        Encode 1 khuôn mặt trên vùng cắt (có padding) từ frame gốc
+        Returns: face_encoding hoặc None nếu không lấy được landmark
+        """
+        height, width = frame.shape[:2]
+        top, right, bottom, left = location
+        face_size = max(bottom - top, right - left, 1)
+        pad = int(face_size * self.crop_padding)
+        y0, y1 = max(0, top - pad), min(height, bottom + pad)
+        x0, x1 = max(0, left - pad), min(width, right + pad)
+        crop = frame[y0:y1, x0:x1]
+        if crop.size == 0:
+            return None
+        
+        # Mặt to thì thu nhỏ về crop_face_size, mặt nhỏ giữ nguyên độ phân giải gốc
+        scale = min(1.0, self.crop_face_size / float(face_size))
+        if scale < 1.0:
+            crop = cv2.resize(crop, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        rgb_crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+        crop_location = (
+            int((top - y0) * scale), int((right - x0) * scale),
+            int((bottom - y0) * scale), int((left - x0) * scale)
+        )
+        import face_recognition
+        face_encodings = face_recognition.face_encodings(rgb_crop, [crop_location])
+        if len(face_encodings) > 0:
+            return face_encodings[0]
+        return None
+    
+    def warm_up(self, frame_shape=(480, 640)):
+        """
+        Nạp dlib + model và chạy detector, encoder trên frame giả
+        để lần nhận diện thật đầu tiên không bị chậm
+        Returns: list (tên bước, số giây)
+        """
+        timings = []
+        start = time.perf_counter()
+        import face_recognition
+        timings.append(('import face_recognition', time.perf_counter() - start))
+        
+        # Frame giả cùng kích thước ảnh detect thật (frame thu nhỏ 0.25)
+        height, width = frame_shape[0] // 4, frame_shape[1] // 4
+        rgb_frame = np.zeros((height, width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        self.detector.warm_up(rgb_frame)
+        timings.append((f'detector {self.detector.name}', time.perf_counter() - start))
+        
+        # Frame trống không có mặt nên chỉ định sẵn box để encoder chạy thật
+        start = time.perf_counter()
+        face_recognition.face_encodings(rgb_frame, [(height // 4, width * 3 // 4, height * 3 // 4, width // 4)])
+        timings.append(('encoder', time.perf_counter() - start))
+        return timings
+    
+    def match_encoding(self, face_encoding):
+        """Tìm nhân viên khớp với encoding, None nếu không khớp ai"""
+        return self.match_encodings([face_encoding])[0]
+    
+    def match_encodings(self, face_encodings):
+        """So khớp nhiều encoding cùng lúc, trả về list mã nhân viên / None"""
+        if len(face_encodings) == 0:
+            return []
+        # Khoảng cách Euclid (face_recognition dùng tolerance 0.6 mặc định)
+        return self.known_faces.match(np.asarray(face_encodings), self.tolerance)
+    
     def create_face_encoding(self, image):
         """
         Tạo encoding từ ảnh khuôn mặt
         Returns: face_encoding hoặc None nếu không tìm thấy khuôn mặt
         """
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        face_encodings = face_recognition.face_encodings(rgb_image)
+        face_encodings = self.create_face_encodings(image)
         
         if len(face_encodings) > 0:
             return face_encodings[0]
         return None
     
+    def create_face_encodings(self, image):
+        """Encoding của tất cả khuôn mặt trong ảnh (để phát hiện ảnh có nhiều người)"""
+        import face_recognition
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return face_recognition.face_encodings(rgb_image)
+    
     def draw_face_box(self, frame, face_info, employee_name=None):
         """Vẽ bounding box và tên lên frame"""
         top, right, bottom, left = face_info['location']
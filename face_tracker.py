@@ -0,0 +1,216 @@
+"""
+Theo dõi (tracking) nhiều khuôn mặt giữa các frame
+- Mỗi khuôn mặt có track ID ổn định, giữ danh tính qua các frame
+- Ghép cặp bằng IoU, dự phòng bằng khoảng cách tâm, có dự đoán chuyển động
+- Chỉ encode lại khi track mới, bị mất dấu hoặc đến hạn xác minh lại
+"""
+import threading
+import time
+
+
+def box_iou(a, b):
+    """IoU giữa 2 box dạng (top, right, bottom, left)"""
+    top = max(a[0], b[0])
+    right = min(a[1], b[1])
+    bottom = min(a[2], b[2])
+    left = max(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    inter = (right - left) * (bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+def box_center(box):
+    top, right, bottom, left = box
+    return (left + right) / 2.0, (top + bottom) / 2.0
+
+
+class FaceTrack:
+    """Một khuôn mặt đang được theo dõi"""
+
+    def __init__(self, track_id, location, now):
+        self.track_id = track_id
+        self.location = location
+        self.velocity = (0.0, 0.0)  # pixel/giây (x, y) của tâm box
+        self.employee_id = None
+        self.encoding = None
+        self.first_seen = now
+        self.last_seen = now
+        self.last_encoded = None
+        self.encode_count = 0
+        self.missed = 0  # số lần detect liên tiếp không thấy track này
+
+    def predict(self, now, max_ahead=0.5):
+        """Dự đoán vị trí box tại thời điểm now (chuyển động thẳng đều)"""
+        dt = min(max(now - self.last_seen, 0.0), max_ahead)
+        dx = int(round(self.velocity[0] * dt))
+        dy = int(round(self.velocity[1] * dt))
+        top, right, bottom, left = self.location
+        return (top + dy, right + dx, bottom + dy, left + dx)
+
+    def update(self, location, now):
+        """Cập nhật vị trí mới, tính lại vận tốc"""
+        dt = now - self.last_seen
+        if dt > 0:
+            old_x, old_y = box_center(self.location)
+            new_x, new_y = box_center(location)
+            vx = (new_x - old_x) / dt
+            vy = (new_y - old_y) / dt
+            self.velocity = (
+                0.5 * self.velocity[0] + 0.5 * vx,
+                0.5 * self.velocity[1] + 0.5 * vy,
+            )
+        self.location = location
+        self.last_seen = now
+        self.missed = 0
+
+    def to_face_info(self, location=None):
+        """Chuyển sang dict giống kết quả của FaceRecognizer.detect_and_recognize"""
+        return {
+            'location': location if location is not None else self.location,
+            'employee_id': self.employee_id,
+            'encoding': self.encoding,
+            'track_id': self.track_id,
+        }
+
+
+class FaceTracker:
+    """
+    Theo dõi khuôn mặt giữa các lần detect
+    Dùng cùng FaceRecognizer.detect_and_recognize(frame, skip_locations):
+    các track đã có danh tính được bỏ qua bước encode (tốn kém nhất)
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_distance=0.6, max_age=1.0,
+                 reverify_interval=5.0, unknown_reverify_interval=1.0):
+        """
+        iou_threshold: IoU tối thiểu để ghép detection với track
+        max_center_distance: khoảng cách tâm tối đa (tính theo kích thước box)
+            khi ghép dự phòng
+        max_age: thời gian (giây) không thấy thì xóa track
+        reverify_interval: chu kỳ (giây) encode lại track đã nhận diện
+        unknown_reverify_interval: chu kỳ encode lại track chưa nhận diện được
+        """
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_age = max_age
+        self.reverify_interval = reverify_interval
+        self.unknown_reverify_interval = unknown_reverify_interval
+
+        self.tracks = {}
+        self.encode_count = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def _needs_encoding(self, track, now):
+        if track.last_encoded is None or track.missed > 0:
+            return True
+        interval = self.reverify_interval if track.employee_id else self.unknown_reverify_interval
+        return now - track.last_encoded >= interval
+
+    def locations_to_skip(self, now=None):
+        """Vị trí dự đoán của các track chưa cần encode lại"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            return [
+                track.predict(now)
+                for track in self.tracks.values()
+                if not self._needs_encoding(track, now)
+            ]
+
+    def _match(self, predicted, detections):
+        """Ghép detection với track: IoU trước, khoảng cách tâm sau"""
+        pairs = []
+        for track_id, box in predicted.items():
+            for det_idx, det in enumerate(detections):
+                iou = box_iou(box, det['location'])
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, track_id, det_idx))
+        pairs.sort(reverse=True)
+
+        matches = {}
+        used_dets = set()
+        for _, track_id, det_idx in pairs:
+            if track_id in matches or det_idx in used_dets:
+                continue
+            matches[track_id] = det_idx
+            used_dets.add(det_idx)
+
+        # Dự phòng: chuyển động nhanh làm IoU thấp, ghép theo tâm box
+        for track_id, box in predicted.items():
+            if track_id in matches:
+                continue
+            cx, cy = box_center(box)
+            size = max(box[1] - box[3], box[2] - box[0], 1)
+            best = None
+            for det_idx, det in enumerate(detections):
+                if det_idx in used_dets:
+                    continue
+                dx, dy = box_center(det['location'])
+                dist = ((cx - dx) ** 2 + (cy - dy) ** 2) ** 0.5 / size
+                if dist <= self.max_center_distance and (best is None or dist < best[0]):
+                    best = (dist, det_idx)
+            if best is not None:
+                matches[track_id] = best[1]
+                used_dets.add(best[1])
+        return matches, used_dets
+
+    def update(self, detections, now=None):
+        """
+        Cập nhật tracker với kết quả detect mới
+        detections: list dict từ detect_and_recognize ('encoding' là None nếu
+            khuôn mặt được bỏ qua bước encode)
+        Returns: list dict khuôn mặt (kèm 'track_id') thấy trong lần detect này
+        """
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            predicted = {tid: t.predict(now) for tid, t in self.tracks.items()}
+            matches, used_dets = self._match(predicted, detections)
+
+            for track_id, det_idx in matches.items():
+                self.tracks[track_id].update(detections[det_idx]['location'], now)
+
+            for det_idx, det in enumerate(detections):
+                if det_idx not in used_dets:
+                    track = FaceTrack(self._next_id, det['location'], now)
+                    self._next_id += 1
+                    self.tracks[track.track_id] = track
+                    matches[track.track_id] = det_idx
+
+            # Cập nhật danh tính cho các track vừa được encode
+            for track_id, det_idx in matches.items():
+                det = detections[det_idx]
+                if det.get('encoding') is None:
+                    continue
+                track = self.tracks[track_id]
+                track.employee_id = det['employee_id']
+                track.encoding = det['encoding']
+                track.last_encoded = now
+                track.encode_count += 1
+                self.encode_count += 1
+
+            for track_id, track in list(self.tracks.items()):
+                if track_id in matches:
+                    continue
+                track.missed += 1
+                if now - track.last_seen > self.max_age:
+                    del self.tracks[track_id]
+
+            return [self.tracks[tid].to_face_info() for tid in sorted(matches)]
+
+    def predicted_faces(self, now=None):
+        """Khuôn mặt tại thời điểm now với vị trí dự đoán (để vẽ overlay mượt)"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            return [
+                track.to_face_info(track.predict(now))
+                for track in self.tracks.values()
+                if track.missed == 0
+            ]
+
+    def reset(self):
+        """Xóa tất cả track"""
+        with self._lock:
+            self.tracks.clear()
@@ -0,0 +1,201 @@
+"""
+Cache file âm thanh lời chào đã tổng hợp sẵn (không gọi gTTS lúc chào)
+- Mỗi (nhân viên, lời chào theo buổi) 1 file trong greeting_cache/, tên = hash nội dung
+- Tổng hợp trước khi thêm nhân viên hoặc chạy định kỳ ban đêm:
+    python greeting_cache.py --db employees.pkl
+    python greeting_cache.py --db employees.pkl --engine pyttsx3   # offline
+- Giới hạn dung lượng: quá max_bytes thì xoá file dùng lâu nhất (LRU theo mtime,
+  mỗi lần phát cập nhật mtime)
+- get() trả về bytes để phát thẳng từ bộ nhớ (pygame.mixer.music.load(BytesIO))
+"""
+import argparse
+import hashlib
+import os
+import threading
+
+# Lời chào theo buổi: (giờ bắt đầu, câu chào)
+TIME_GREETINGS = [(0, "Chào buổi sáng"), (12, "Chào buổi chiều"), (18, "Chào buổi tối")]
+
+
+def greeting_message(name, hour):
+    """Câu chào nhân viên theo giờ trong ngày"""
+    phrase = [text for start, text in TIME_GREETINGS if hour >= start][-1]
+    return f"{phrase} {name}, chúc một ngày làm việc vui vẻ!"
+
+
+class GTTSSynthesizer:
+    """Google TTS giọng nữ Việt Nam (cần internet)"""
+    extension = '.mp3'
+
+    def __call__(self, message, path):
+        from gtts import gTTS
+        gTTS(text=message, lang='vi', slow=False).save(path)
+
+
+class Pyttsx3Synthesizer:
+    """pyttsx3 save_to_file (offline, dùng được khi không có mạng / khi test)"""
+    extension = '.wav'
+
+    def __init__(self, rate=150):
+        self.rate = rate
+        self.engine = None
+
+    def __call__(self, message, path):
+        if self.engine is None:
+            import pyttsx3
+            self.engine = pyttsx3.init()
+            self.engine.setProperty('rate', self.rate)
+        self.engine.save_to_file(message, path)
+        self.engine.runAndWait()
+
+
+SYNTHESIZERS = {'gtts': GTTSSynthesizer, 'pyttsx3': Pyttsx3Synthesizer}
+
+
+class GreetingCache:
+    """
+    Cache lời chào trên đĩa, LRU giới hạn theo dung lượng
+    synthesizer: object có extension ('.mp3') và gọi được (message, path) -> ghi file
+    """
+
+    def __init__(self, cache_dir='greeting_cache', max_bytes=100 * 1024 * 1024, synthesizer=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.synthesizer = synthesizer or GTTSSynthesizer()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # key -> (tên file, dung lượng); quét thư mục 1 lần lúc khởi tạo
+        self._files = {}
+        self.total_bytes = 0
+        for name in os.listdir(cache_dir):
+            key, ext = os.path.splitext(name)
+            if '.tmp' in name:
+                self._remove_file(name)  # tổng hợp dở lần trước
+            elif ext:
+                size = os.path.getsize(os.path.join(cache_dir, name))
+                self._files[key] = (name, size)
+                self.total_bytes += size
+
+    @staticmethod
+    def key(message):
+        return hashlib.sha1(message.encode('utf-8')).hexdigest()[:20]
+
+    def __contains__(self, message):
+        with self._lock:
+            return self.key(message) in self._files
+
+    def get(self, message):
+        """Returns: (bytes âm thanh, đuôi file không có dấu chấm) hoặc None nếu chưa có"""
+        key = self.key(message)
+        with self._lock:
+            entry = self._files.get(key)
+        if entry is None:
+            return None
+        path = os.path.join(self.cache_dir, entry[0])
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # đánh dấu vừa dùng (LRU)
+        except OSError:
+            with self._lock:
+                self._drop(key)
+            return None
+        return data, os.path.splitext(entry[0])[1][1:]
+
+    def put(self, message, data, extension):
+        """Lưu âm thanh đã có sẵn (vd. vừa tải từ gTTS khi chào lần đầu)"""
+        key = self.key(message)
+        name = key + extension
+        tmp_path = os.path.join(self.cache_dir, key + '.tmp' + extension)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        self._add(key, name, tmp_path)
+
+    def synthesize(self, message):
+        """Tổng hợp lời chào nếu chưa có trong cache. Returns: True nếu vừa tổng hợp"""
+        if message in self:
+            return False
+        key = self.key(message)
+        name = key + self.synthesizer.extension
+        tmp_path = os.path.join(self.cache_dir, key + '.tmp' + self.synthesizer.extension)
+        self.synthesizer(message, tmp_path)
+        self._add(key, name, tmp_path)
+        return True
+
+    def _add(self, key, name, tmp_path):
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, os.path.join(self.cache_dir, name))
+        with self._lock:
+            old = self._files.get(key)
+            if old is not None and old[0] != name:
+                self._remove_file(old[0])
+            self._drop(key)
+            self._files[key] = (name, size)
+            self.total_bytes += size
+            self._evict()
+
+    def _drop(self, key):
+        entry = self._files.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def _remove_file(self, name):
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Xoá file dùng lâu nhất đến khi tổng dung lượng <= max_bytes"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        by_age = []
+        for key, (name, _) in self._files.items():
+            try:
+                by_age.append((os.path.getmtime(os.path.join(self.cache_dir, name)), key))
+            except OSError:
+                by_age.append((0, key))
+        for _, key in sorted(by_age):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove_file(self._files[key][0])
+            self._drop(key)
+
+    def warm(self, employees):
+        """
+        Tổng hợp trước mọi lời chào theo buổi cho các nhân viên
+        employees: list (mã, tên)
+        Returns: số file vừa tổng hợp
+        """
+        count = 0
+        for _, name in employees:
+            for start, _ in TIME_GREETINGS:
+                try:
+                    count += self.synthesize(greeting_message(name, start))
+                except Exception as e:
+                    print(f"Lỗi tổng hợp lời chào cho {name}: {e}")
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tổng hợp trước lời chào của tất cả nhân viên")
+    parser.add_argument('--db', default='employees.pkl', help="File database nhân viên")
+    parser.add_argument('--cache-dir', default='greeting_cache')
+    parser.add_argument('--max-mb', type=float, default=100, help="Dung lượng tối đa của cache (MB)")
+    parser.add_argument('--engine', default='gtts', choices=sorted(SYNTHESIZERS),
+                        help="gtts (giọng tự nhiên, cần mạng) hoặc pyttsx3 (offline)")
+    args = parser.parse_args()
+
+    from database import open_employee_database
+    db = open_employee_database(args.db)
+    employees = [(employee_id, employee['name'])
+                 for employee_id, employee in db.get_all_employees().items()]
+    db.close()
+    cache = GreetingCache(args.cache_dir, int(args.max_mb * 1024 * 1024), SYNTHESIZERS[args.engine]())
+    count = cache.warm(employees)
+    print(f"Đã tổng hợp {count} lời chào mới cho {len(employees)} nhân viên "
+          f"({cache.total_bytes / 1e6:.1f} MB trong {args.cache_dir}/)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,57 @@
 """
 Hệ thống chào hỏi nhân viên bằng text-to-speech
 Hỗ trợ giọng nữ Tiếng Việt
+pyttsx3 / gTTS / pygame chỉ được import khi khởi tạo engine ở thread nền
+Lời chào đã có trong GreetingCache được phát thẳng từ bộ nhớ, không gọi mạng
 """
-import pyttsx3
+import importlib.util
+import io
 import threading
 from datetime import datetime
-import os
-import tempfile
 
-# Import gTTS cho giọng Việt tốt hơn (optional)
-try:
-    from gtts import gTTS
-    import pygame
-    GTTS_AVAILABLE = True
-except ImportError:
-    GTTS_AVAILABLE = False
+from greeting_cache import greeting_message
+
+# gTTS cho giọng Việt tốt hơn (optional) - chỉ kiểm tra có cài, chưa import
+GTTS_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ('gtts', 'pygame'))
 
 class GreetingSystem:
-    def __init__(self, use_gtts=True):
+    def __init__(self, use_gtts=True, verbose=False, cache=None):
         """
         use_gtts: True = dùng Google TTS (giọng Việt tự nhiên, cần internet)
                   False = dùng pyttsx3 (offline, giọng robot hơn)
+        verbose: in danh sách giọng pyttsx3 có sẵn (debug)
+        cache: GreetingCache chứa lời chào tổng hợp sẵn (phát qua pygame)
         """
         self.use_gtts = use_gtts and GTTS_AVAILABLE
+        self.verbose = verbose
+        self.cache = cache
         self.greeted_today = set()  # Tránh chào lặp lại trong cùng 1 ngày
+        self.engine = None
+        self.mixer = False  # pygame.mixer đã khởi tạo
         
-        if not self.use_gtts:
-            self.engine = pyttsx3.init()
-            self.setup_voice()
-        else:
-            # Khởi tạo pygame mixer cho phát âm thanh
-            try:
-                pygame.mixer.init()
-            except:
-                # Fallback về pyttsx3 nếu pygame không hoạt động
-                self.use_gtts = False
+        # Khởi tạo pygame mixer / pyttsx3 ở thread nền để không chặn giao diện
+        self.ready = threading.Event()
+        threading.Thread(target=self._init_engine, daemon=True).start()
+    
+    def _init_engine(self):
+        try:
+            if self.use_gtts or self.cache is not None:
+                # Khởi tạo pygame mixer cho phát âm thanh
+                try:
+                    import pygame
+                    pygame.mixer.init()
+                    self.mixer = True
+                except Exception:
+                    # Fallback về pyttsx3 nếu pygame không hoạt động
+                    self.use_gtts = False
+            if not self.use_gtts:
+                import pyttsx3
                 self.engine = pyttsx3.init()
                 self.setup_voice()
+        except Exception as e:
+            print(f"Lỗi khởi tạo TTS: {e}")
+        finally:
+            self.ready.set()
     
     def setup_voice(self):
         """Cấu hình giọng nói cho pyttsx3 (offline)"""
@@ -50,11 +65,12 @@ class GreetingSystem:
         voices = self.engine.getProperty('voices')
         
         # In ra danh sách giọng để debug
-        print("=== Danh sách giọng có sẵn ===")
-        for idx, voice in enumerate(voices):
-            print(f"{idx}: {voice.name} - {voice.id}")
-            print(f"   Languages: {voice.languages}")
-            print(f"   Gender: {getattr(voice, 'gender', 'unknown')}")
+        if self.verbose:
+            print("=== Danh sách giọng có sẵn ===")
+            for idx, voice in enumerate(voices):
+                print(f"{idx}: {voice.name} - {voice.id}")
+                print(f"   Languages: {voice.languages}")
+                print(f"   Gender: {getattr(voice, 'gender', 'unknown')}")
         
         # Thử tìm giọng nữ Tiếng Việt hoặc giọng nữ
         female_voice = None
@@ -63,17 +79,16 @@ class GreetingSystem:
             
             # Ưu tiên giọng Việt Nam nữ
             if 'vietnam' in voice_name_lower and 'female' in voice_name_lower:
-                female_voice = voice.id
-                print(f"\n✅ Đã chọn giọng: {voice.name}")
+                female_voice = voice
                 break
             
             # Thử tìm giọng nữ tiếng Anh (Zira, Hazel, Susan, etc.)
             if any(name in voice_name_lower for name in ['zira', 'hazel', 'susan', 'female']):
-                female_voice = voice.id
+                female_voice = voice
         
         if female_voice:
-            self.engine.setProperty('voice', female_voice)
-            print(f"✅ Đã đặt giọng nữ")
+            self.engine.setProperty('voice', female_voice.id)
+            print(f"✅ Đã chọn giọng: {female_voice.name}")
         else:
             print("⚠️ Không tìm thấy giọng nữ, dùng giọng mặc định")
     
@@ -89,15 +104,7 @@ class GreetingSystem:
             return False
         
         # Tạo lời chào theo thời gian trong ngày
-        hour = datetime.now().hour
-        if hour < 12:
-            time_greeting = "Chào buổi sáng"
-        elif hour < 18:
-            time_greeting = "Chào buổi chiều"
-        else:
-            time_greeting = "Chào buổi tối"
-        
-        message = f"{time_greeting} {name}, chúc một ngày làm việc vui vẻ!"
+        message = greeting_message(name, datetime.now().hour)
         
         # Chạy TTS trong thread riêng để không block UI
         thread = threading.Thread(target=self._speak, args=(message,))
@@ -107,13 +114,34 @@ class GreetingSystem:
         self.greeted_today.add(greeting_key)
         return True
     
+    def prepare_greetings(self, name):
+        """Tổng hợp trước các lời chào của 1 nhân viên (thread nền, gọi khi thêm nhân viên)"""
+        if self.cache is None:
+            return
+        thread = threading.Thread(target=self.cache.warm, args=([(None, name)],))
+        thread.daemon = True
+        thread.start()
+    
+    def _play(self, data, extension):
+        """Phát âm thanh từ bộ nhớ bằng pygame, chờ phát xong"""
+        import pygame
+        pygame.mixer.music.load(io.BytesIO(data), extension)
+        pygame.mixer.music.play()
+        while pygame.mixer.music.get_busy():
+            pygame.time.Clock().tick(10)
+    
     def _speak(self, message):
         """Phát âm thanh (chạy trong thread riêng)"""
+        self.ready.wait()
         try:
-            if self.use_gtts:
+            cached = self.cache.get(message) if self.cache is not None and self.mixer else None
+            if cached is not None:
+                # Lời chào đã tổng hợp sẵn: phát ngay, không cần mạng
+                self._play(*cached)
+            elif self.use_gtts:
                 # Dùng Google TTS - giọng nữ Việt Nam tự nhiên
                 self._speak_gtts(message)
-            else:
+            elif self.engine is not None:
                 # Dùng pyttsx3 - offline
                 self.engine.say(message)
                 self.engine.runAndWait()
@@ -123,34 +151,27 @@ class GreetingSystem:
     def _speak_gtts(self, message):
         """Phát âm bằng Google TTS (giọng nữ Việt Nam)"""
         try:
-            # Tạo file âm thanh tạm
-            tts = gTTS(text=message, lang='vi', slow=False)
+            from gtts import gTTS
             
-            # Lưu vào file tạm
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-            temp_filename = temp_file.name
-            temp_file.close()
-            
-            tts.save(temp_filename)
-            
-            # Phát âm thanh
-            pygame.mixer.music.load(temp_filename)
-            pygame.mixer.music.play()
+            # Tải âm thanh vào bộ nhớ (không cần file tạm)
+            tts = gTTS(text=message, lang='vi', slow=False)
+            buffer = io.BytesIO()
+            tts.write_to_fp(buffer)
+            data = buffer.getvalue()
             
-            # Đợi phát xong
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
+            # Lưu lại cho lần chào sau
+            if self.cache is not None:
+                try:
+                    self.cache.put(message, data, '.mp3')
+                except OSError as e:
+                    print(f"Không lưu được lời chào vào cache: {e}")
             
-            # Xóa file tạm
-            try:
-                os.unlink(temp_filename)
-            except:
-                pass
+            self._play(data, 'mp3')
                 
         except Exception as e:
             print(f"Lỗi Google TTS: {e}")
             # Fallback về pyttsx3
-            if hasattr(self, 'engine'):
+            if self.engine is not None:
                 self.engine.say(message)
                 self.engine.runAndWait()
     
@@ -0,0 +1,320 @@
+"""
+Chạy nhận diện chấm công không cần giao diện (server, CI, xử lý video đã ghi)
+- Nguồn: file video, thư mục ảnh hoặc camera (device index / URL)
+- Dùng cùng FaceRecognizer, FaceTracker và AttendanceLog với ứng dụng chính
+- Sự kiện chấm công in ra dạng JSON lines, cuối cùng in thống kê FPS/latency
+
+Ví dụ:
+    python headless_runner.py video_cua_chinh.mp4 --start-time "2025-10-04 07:30:00"
+    python headless_runner.py anh_test/ --no-log
+    python headless_runner.py 0 --adaptive
+    python headless_runner.py 0 --greet      # kiosk không màn hình, có loa
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from datetime import datetime, timedelta
+
+import cv2
+
+from camera_pipeline import RecognitionScheduler, open_video_source, parse_source
+from attendance_rollup import DailyRollup
+from database import AttendanceLog, AttendanceCooldown, open_employee_database
+from detection_planner import DetectionPlanner
+from face_detectors import DETECTORS
+from face_index import INDEXES, QUANTIZE, create_index
+from face_recognition_module import FaceRecognizer
+from face_tracker import FaceTracker
+from greeting_cache import GreetingCache
+from greeting_system import GreetingSystem
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def iter_frames(source, image_fps=1.0, stop_event=None):
+    """
+    Đọc frame từ nguồn
+    Yields: (chỉ số frame, thời điểm trong nguồn tính bằng giây, frame)
+    """
+    source = parse_source(source)
+
+    if isinstance(source, str) and os.path.isdir(source):
+        names = sorted(
+            name for name in os.listdir(source)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        for idx, name in enumerate(names):
+            if stop_event is not None and stop_event():
+                return
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is None:
+                print(f"Bỏ qua ảnh lỗi: {name}", file=sys.stderr)
+                continue
+            yield idx, idx / image_fps, frame
+        return
+
+    camera = open_video_source(source)
+    if not camera.isOpened():
+        raise RuntimeError(f"Không thể mở nguồn video: {source}")
+    is_file = isinstance(source, str) and os.path.isfile(source)
+    start = time.monotonic()
+    idx = 0
+    try:
+        while stop_event is None or not stop_event():
+            ret, frame = camera.read()
+            if not ret:
+                if is_file:
+                    return
+                # Camera mất kết nối tạm thời
+                time.sleep(0.01)
+                continue
+            if is_file:
+                media_time = camera.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            else:
+                media_time = time.monotonic() - start
+            yield idx, media_time, frame
+            idx += 1
+    finally:
+        camera.release()
+
+
+def is_still_source(source):
+    """Thư mục ảnh hoặc 1 file ảnh: các frame không liên quan nhau (không tracking)"""
+    source = str(source)
+    return os.path.isdir(source) or source.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class HeadlessRunner:
+    """Vòng lặp nhận diện + chấm công không có giao diện"""
+
+    def __init__(self, db, attendance_log, face_recognizer, cooldown=30,
+                 start_time=None, adaptive=False, output=sys.stdout, source_name='',
+                 planner=None, still_images=False, greeting_system=None):
+        """
+        attendance_log: AttendanceLog hoặc None (chỉ in sự kiện, không ghi log)
+        start_time: thời điểm bắt đầu của video đã ghi (datetime); None = dùng giờ hiện tại
+        adaptive: dùng RecognitionScheduler để bỏ qua frame (như ứng dụng chính)
+        planner: DetectionPlanner (ROI, tỉ lệ detect, tile); None = toàn frame tỉ lệ 0.25
+        still_images: các frame là ảnh rời (thư mục ảnh): xoá track trước mỗi ảnh để
+            khuôn mặt ở cùng vị trí trong ảnh sau vẫn được encode lại
+        greeting_system: GreetingSystem chào nhân viên khi chấm công; None = không chào
+        """
+        self.db = db
+        self.attendance_log = attendance_log
+        self.face_recognizer = face_recognizer
+        self.cooldown = AttendanceCooldown(cooldown)
+        self.start_time = start_time
+        self.scheduler = RecognitionScheduler() if adaptive else None
+        self.tracker = FaceTracker()
+        self.still_images = still_images
+        self.planner = planner
+        self.output = output
+        self.source_name = source_name
+        self.greeting_system = greeting_system
+
+        self.frames = 0
+        self.processed = 0
+        self.events = 0
+        self.latencies = []
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def emit(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.output.flush()
+
+    def process_frame(self, idx, media_time, frame):
+        """Nhận diện 1 frame và ghi chấm công"""
+        self.frames += 1
+        if self.scheduler is not None and not self.scheduler.should_process(idx, frame, media_time):
+            return
+
+        start = time.perf_counter()
+        if self.still_images:
+            self.tracker.reset()
+        skip = self.tracker.locations_to_skip(media_time)
+        if self.planner is not None:
+            self.planner.set_hints(
+                [face['location'] for face in self.tracker.predicted_faces(media_time)],
+                self.scheduler.motion_mask if self.scheduler is not None else None
+            )
+        faces = self.face_recognizer.detect_and_recognize(frame, skip, planner=self.planner)
+        faces = self.tracker.update(faces, media_time)
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.processed += 1
+        if self.scheduler is not None:
+            self.scheduler.record_result(faces, latency)
+
+        for face_info in faces:
+            employee_id = face_info['employee_id']
+            if not employee_id or not self.cooldown.should_log(employee_id, media_time):
+                continue
+            employee = self.db.get_employee(employee_id)
+            if not employee:
+                continue
+            if self.start_time is not None:
+                when = self.start_time + timedelta(seconds=media_time)
+            else:
+                when = datetime.now()
+            if self.attendance_log is not None:
+                timestamp = self.attendance_log.log_attendance(employee_id, employee['name'], when=when)
+            else:
+                timestamp = when.strftime('%Y-%m-%d %H:%M:%S')
+            self.events += 1
+            record = {
+                'event': 'attendance',
+                'time': timestamp,
+                'employee_id': employee_id,
+                'name': employee['name'],
+                'source': self.source_name,
+                'frame': idx,
+                'media_time': round(media_time, 3),
+                'track_id': face_info.get('track_id'),
+            }
+            if self.greeting_system is not None:
+                record['greeted'] = self.greeting_system.greet_employee(employee['name'], employee_id)
+            self.emit(record)
+
+    def run(self, frames):
+        """Xử lý toàn bộ frame, trả về thống kê"""
+        wall_start = time.perf_counter()
+        for idx, media_time, frame in frames:
+            if self.stopped:
+                break
+            self.process_frame(idx, media_time, frame)
+        return self.summary(time.perf_counter() - wall_start)
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        mean = sum(latencies) / len(latencies) if latencies else 0.0
+        return {
+            'event': 'summary',
+            'source': self.source_name,
+            'frames': self.frames,
+            'processed_frames': self.processed,
+            'attendance_events': self.events,
+            'encodings': self.tracker.encode_count,
+            'detector': self.face_recognizer.detector.name,
+            'detector_ms': round(self.face_recognizer.detector.avg_cost_ms, 2),
+            'elapsed_s': round(elapsed, 3),
+            'fps': round(self.frames / elapsed, 2) if elapsed > 0 else 0.0,
+            'latency_ms': {
+                'mean': round(mean * 1000, 2),
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nhận diện chấm công không cần giao diện")
+    parser.add_argument('source', help="File video, thư mục ảnh, device index hoặc URL camera")
+    parser.add_argument('--db', default='employees.pkl', help="File database nhân viên (.pkl, .db SQLite hoặc .emb)")
+    parser.add_argument('--log', default='attendance_log.csv', help="File log chấm công")
+    parser.add_argument('--log-partition', default='month', choices=['none', 'month', 'day'],
+                        help="Chia log chấm công mỗi tháng / mỗi ngày 1 file")
+    parser.add_argument('--no-log', action='store_true', help="Chỉ in sự kiện, không ghi log")
+    parser.add_argument('--output', default='-', help="File JSON lines đầu ra ('-' = stdout)")
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--detector', default='hog', choices=sorted(DETECTORS),
+                        help="Backend phát hiện khuôn mặt")
+    parser.add_argument('--cooldown', type=float, default=30, help="Giây giữa 2 lần chấm công")
+    parser.add_argument('--start-time', default=None,
+                        help="Thời điểm bắt đầu của video đã ghi, dạng 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument('--image-fps', type=float, default=1.0,
+                        help="Số ảnh/giây khi nguồn là thư mục ảnh (để tính cooldown)")
+    parser.add_argument('--two-stage', action='store_true',
+                        help="Detect trên frame nhỏ, encode trên vùng cắt độ phân giải đầy đủ")
+    parser.add_argument('--index', default='flat', choices=INDEXES,
+                        help="Index so khớp: flat (chính xác) hoặc ivf (gần đúng)")
+    parser.add_argument('--nprobe', type=int, default=8, help="Số cụm IVF quét mỗi khuôn mặt")
+    parser.add_argument('--quantize', default=None, choices=QUANTIZE,
+                        help="Quét danh sách dạng int8 / float16, xếp hạng lại bằng float32")
+    parser.add_argument('--spill', action='store_true',
+                        help="Với --quantize: giữ bản float32 trong file tạm trên đĩa")
+    parser.add_argument('--roi', default=None,
+                        help="Vùng detect x,y,w,h (pixel hoặc tỉ lệ 0-1), ví dụ 0.25,0,0.5,1")
+    parser.add_argument('--tiled', choices=['auto', 'on', 'off'], default='auto',
+                        help="Detect theo tile cho video độ phân giải cao")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Bỏ qua frame theo scheduler như ứng dụng chính")
+    parser.add_argument('--greet', action='store_true',
+                        help="Phát lời chào khi chấm công (lời chào tổng hợp sẵn trong --greeting-cache)")
+    parser.add_argument('--greeting-cache', default='greeting_cache',
+                        help="Thư mục cache lời chào (tạo bằng greeting_cache.py)")
+    args = parser.parse_args()
+
+    start_time = None
+    if args.start_time:
+        start_time = datetime.strptime(args.start_time, '%Y-%m-%d %H:%M:%S')
+
+    db = open_employee_database(args.db)
+    attendance_log = None
+    if not args.no_log:
+        partition = None if args.log_partition == 'none' else args.log_partition
+        attendance_log = AttendanceLog(args.log, partition=partition)
+        rollup = DailyRollup(attendance_log)
+    index_options = {'nprobe': args.nprobe} if args.index == 'ivf' else {}
+    face_recognizer = FaceRecognizer(
+        tolerance=args.tolerance, detector=args.detector, two_stage=args.two_stage,
+        index=create_index(args.index, args.db, quantize=args.quantize, spill=args.spill,
+                           **index_options)
+    )
+    face_recognizer.load_database(db)
+
+    roi = [float(v) for v in args.roi.split(',')] if args.roi else None
+    tiled = {'auto': 'auto', 'on': True, 'off': False}[args.tiled]
+    planner = DetectionPlanner(roi=roi, tiled=tiled)
+
+    greeting_system = None
+    if args.greet:
+        greeting_system = GreetingSystem(use_gtts=True, cache=GreetingCache(args.greeting_cache))
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'a', encoding='utf-8')
+    runner = HeadlessRunner(
+        db, attendance_log, face_recognizer,
+        cooldown=args.cooldown, start_time=start_time, adaptive=args.adaptive,
+        output=output, source_name=str(args.source), planner=planner,
+        still_images=is_still_source(args.source), greeting_system=greeting_system
+    )
+
+    # Dừng nhẹ nhàng khi chạy dạng daemon (SIGTERM) hoặc Ctrl+C
+    def handle_signal(signum, frame):
+        runner.stop()
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+    frames = iter_frames(args.source, image_fps=args.image_fps, stop_event=lambda: runner.stopped)
+    summary = runner.run(frames)
+    runner.emit(summary)
+    print(
+        f"Đã xử lý {summary['frames']} frame ({summary['processed_frames']} nhận diện) "
+        f"trong {summary['elapsed_s']}s - {summary['fps']} fps, "
+        f"latency trung bình {summary['latency_ms']['mean']} ms, "
+        f"p95 {summary['latency_ms']['p95']} ms",
+        file=sys.stderr
+    )
+    if attendance_log is not None:
+        rollup.close()
+        attendance_log.close()
+    if output is not sys.stdout:
+        output.close()
+
+
+if __name__ == "__main__":
+    main()
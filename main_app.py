@@ -2,53 +2,183 @@
 Desktop App Chấm Công với Nhận Diện Khuôn Mặt
 Main Application - GUI sử dụng Tkinter + OpenCV
 """
+import time
+_import_start = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 import cv2
 from PIL import Image, ImageTk
 from datetime import datetime
 import threading
+import argparse
+import math
 import os
 
-from database import EmployeeDatabase, AttendanceLog
+from attendance_rollup import DailyRollup
+from database import AttendanceLog, AttendanceCooldown, open_employee_database
+from event_bus import EventBus
 from face_recognition_module import FaceRecognizer
+from greeting_cache import GreetingCache
 from greeting_system import GreetingSystem
+from camera_pipeline import CameraStream, RecognitionPool, RecognitionScheduler, load_camera_config
+from face_detectors import DETECTORS
+from face_index import INDEXES, QUANTIZE, create_index
+from process_pool import ProcessPoolRecognizer
+
+
+class StartupTimer:
+    """Đo thời gian từng bước khởi động để tìm chỗ chậm"""
+    
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.last = self.start
+        self.steps = []
+    
+    def mark(self, name):
+        """Ghi thời gian từ bước trước đến giờ"""
+        now = time.perf_counter()
+        self.steps.append((name, now - self.last))
+        self.last = now
+    
+    def add(self, name, seconds):
+        """Ghi 1 bước đã đo ở nơi khác (thread nền)"""
+        self.steps.append((name, seconds))
+    
+    def elapsed(self):
+        return time.perf_counter() - self.start
+    
+    def report(self):
+        print("⏱ Thời gian khởi động:")
+        for name, seconds in self.steps:
+            print(f"   {name:<32}{seconds:>7.2f}s")
+
 
 class AttendanceApp:
-    def __init__(self, root):
+    def __init__(self, root, sources=None, recognition_workers=None, recognition_processes=0,
+                 detector='hog', two_stage=False, index='flat', nprobe=8, quantize=None,
+                 spill=False, db_file='employees.pkl', log_partition='month', startup=None,
+                 ui_interval_ms=100):
+        """
+        sources: danh sách nguồn camera (device index, file video, URL) hoặc dict
+            cấu hình camera ({"source", "name", "detector", "detector_options"})
+        recognition_workers: số thread nhận diện dùng chung cho tất cả camera
+        recognition_processes: > 0 để nhận diện bằng nhiều process (nhiều core)
+        detector: detector mặc định cho camera không cấu hình riêng
+            ('hog', 'haar' cho máy yếu, 'dnn')
+        two_stage: detect trên frame nhỏ, encode trên vùng cắt từ frame gốc
+        index: 'flat' (so khớp chính xác) hoặc 'ivf' (gần đúng, cho 100k+ nhân viên)
+        nprobe: số cụm IVF quét mỗi khuôn mặt (lớn hơn = chính xác hơn, chậm hơn)
+        quantize: 'int8' / 'float16' để giữ danh sách nhân viên dạng lượng tử hoá
+        spill: hàng float32 dùng để xếp hạng lại nằm trong file tạm trên đĩa thay vì RAM
+        db_file: database nhân viên (.pkl: pickle + journal, .db: SQLite, .emb: map file)
+        log_partition: chia log chấm công theo 'month' / 'day', None = 1 file
+        startup: StartupTimer đo thời gian khởi động (in ra khi mô hình đã sẵn sàng)
+        ui_interval_ms: chu kỳ cập nhật giao diện theo sự kiện chấm công (gom theo lô)
+        """
         self.root = root
         self.root.title("Hệ Thống Chấm Công Nhận Diện Khuôn Mặt")
         self.root.geometry("1200x700")
+        self.startup = startup or StartupTimer()
         
         # Initialize components
-        self.db = EmployeeDatabase()
-        self.attendance_log = AttendanceLog()
-        self.face_recognizer = FaceRecognizer(tolerance=0.5)
+        self.db = open_employee_database(db_file)
+        self.attendance_log = AttendanceLog(partition=log_partition)
+        self.rollup = DailyRollup(self.attendance_log)
+        self.startup.mark('database')
+        index_options = {'nprobe': nprobe} if index == 'ivf' else {}
+        self.face_recognizer = FaceRecognizer(
+            tolerance=0.5, detector=detector, two_stage=two_stage,
+            index=create_index(index, self.db.db_file, quantize=quantize, spill=spill,
+                               **index_options)
+        )
+        self.recognition_processes = recognition_processes
         # Sử dụng Google TTS cho giọng nữ Việt Nam tự nhiên
         # use_gtts=True: giọng nữ Việt tự nhiên (cần internet)
         # use_gtts=False: giọng robot offline
-        self.greeting_system = GreetingSystem(use_gtts=True)
+        # Lời chào tổng hợp sẵn trong greeting_cache/ phát ngay, không cần mạng
+        self.greeting_system = GreetingSystem(use_gtts=True, cache=GreetingCache())
         
         # Load known faces
-        self.face_recognizer.load_known_faces(self.db.get_all_employees())
+        self.face_recognizer.load_database(self.db)
+        # Tên theo mã nhân viên cho vòng vẽ / chấm công (không hỏi database mỗi khuôn mặt)
+        self.employee_names = self._load_employee_names()
+        self.startup.mark('danh sách khuôn mặt')
+        if self.recognition_processes > 0:
+            # Process worker nhận frame qua shared memory, dùng chung interface
+            self.face_recognizer = ProcessPoolRecognizer(
+                self.face_recognizer, self.recognition_processes
+            )
+            self.startup.mark('khởi động process nhận diện')
         
         # Camera
-        self.camera = None
+        self.sources = list(sources) if sources else [0]
+        self.recognition_workers = recognition_workers or max(
+            min(len(self.sources), os.cpu_count() or 1), self.recognition_processes
+        )
+        self.streams = []
+        self.camera_views = []  # mỗi stream: label, fps_var, seq đã vẽ/đã xử lý
+        self.recognition_pool = None
         self.camera_running = False
         self.current_frame = None
         
         # Tracking attendance
-        self.last_recognized = {}  # {employee_id: timestamp}
         self.recognition_cooldown = 30  # seconds (tránh ghi log liên tục)
+        self.attendance_cooldown = AttendanceCooldown(self.recognition_cooldown)
         
         # Frame skipping để giảm lag
         self.frame_count = 0
-        self.process_every_n_frames = 3  # chỉ nhận diện mỗi 3 frame
+        self.process_every_n_frames = 3  # giá trị khởi đầu, scheduler tự điều chỉnh
         self.last_face_results = []  # cache kết quả nhận diện gần nhất
+        self.recognition_budget = 0.5  # tỉ lệ CPU (1 core) dành cho nhận diện
+        
+        # Chấm công xử lý ở thread nhận diện, giao diện chỉ cập nhật theo lô
+        self.events = EventBus()
+        self._listbox_day = None
+        self._listbox_count = 0
         
         # Setup GUI
         self.setup_ui()
-        
+        self.startup.mark('giao diện')
+        self._stop_events = self.events.pump(self.root, self._handle_events, ui_interval_ms)
+        
+        # dlib / model nạp ở thread nền sau khi cửa sổ đã hiện
+        self.status_var.set("Đang nạp mô hình nhận diện...")
+        self._warm_up_timings = []
+        self._warm_up_thread = threading.Thread(target=self._warm_up, daemon=True)
+        self.root.after_idle(self._on_window_shown)
+        
+    def _load_employee_names(self):
+        """Mã -> tên; backend .emb chỉ đọc journal tên, không đọc encoding"""
+        if hasattr(self.db, 'metadata'):
+            return {employee_id: data['name'] for employee_id, data in self.db.metadata().items()}
+        return {employee_id: employee['name']
+                for employee_id, employee in self.db.get_all_employees().items()}
+    
+    def _on_window_shown(self):
+        self.startup.add('→ cửa sổ hiện sau', self.startup.elapsed())
+        self._warm_up_thread.start()
+        self._check_warm_up()
+    
+    def _warm_up(self):
+        """Chạy ở thread nền: import face_recognition, chạy thử detector + encoder"""
+        try:
+            self._warm_up_timings = self.face_recognizer.warm_up()
+        except Exception as e:
+            print(f"Lỗi warm-up mô hình: {e}")
+    
+    def _check_warm_up(self):
+        if self._warm_up_thread.is_alive():
+            self.root.after(100, self._check_warm_up)
+            return
+        for name, seconds in self._warm_up_timings:
+            self.startup.add(f'[nền] {name}', seconds)
+        ready_after = self.startup.elapsed()
+        self.startup.add('→ sẵn sàng nhận diện sau', ready_after)
+        self.startup.report()
+        if not self.camera_running:
+            self.status_var.set(f"Sẵn sàng (khởi động {ready_after:.1f}s)")
+    
     def setup_ui(self):
         """Thiết lập giao diện"""
         # Main container
@@ -65,8 +195,9 @@ class AttendanceApp:
         left_panel = ttk.LabelFrame(main_container, text="Camera Trực Tiếp", padding="10")
         left_panel.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5)
         
-        self.camera_label = ttk.Label(left_panel)
-        self.camera_label.pack()
+        # Lưới hiển thị các camera (tạo khi bật camera)
+        self.camera_grid = ttk.Frame(left_panel)
+        self.camera_grid.pack()
         
         # Camera controls
         camera_controls = ttk.Frame(left_panel)
@@ -155,96 +286,177 @@ class AttendanceApp:
         self.refresh_today_attendance()
     
     def start_camera(self):
-        """Bật camera"""
-        if not self.camera_running:
-            # Sử dụng DSHOW backend trên Windows để giảm latency
-            self.camera = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-            if self.camera.isOpened():
-                # Cấu hình camera cho hiệu suất tối ưu
-                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                self.camera.set(cv2.CAP_PROP_FPS, 30)
-                self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # giảm buffer để giảm lag
-                
-                self.camera_running = True
-                self.start_camera_btn.config(state=tk.DISABLED)
-                self.stop_camera_btn.config(state=tk.NORMAL)
-                self.status_var.set("Camera đang chạy...")
-                self.update_camera_feed()
+        """Bật tất cả camera đã cấu hình"""
+        if self.camera_running:
+            return
+        
+        failed = []
+        for source in self.sources:
+            config = dict(source) if isinstance(source, dict) else {'source': source}
+            scheduler = RecognitionScheduler(
+                process_every_n_frames=self.process_every_n_frames,
+                cpu_budget=self.recognition_budget
+            )
+            try:
+                stream = CameraStream.open(scheduler=scheduler, **config)
+            except (FileNotFoundError, ValueError) as e:
+                print(f"Lỗi cấu hình camera {config['source']}: {e}")
+                failed.append(str(config['source']))
+                continue
+            if stream.camera.isOpened():
+                stream.listeners.append(self._on_recognition)
+                self.streams.append(stream)
             else:
-                messagebox.showerror("Lỗi", "Không thể mở camera!")
+                stream.camera.release()
+                failed.append(str(config['source']))
+        
+        if not self.streams:
+            messagebox.showerror("Lỗi", "Không thể mở camera!")
+            return
+        
+        self.camera_running = True
+        self._build_camera_grid()
+        
+        # Thread capture riêng cho từng camera, pool nhận diện dùng chung
+        self.recognition_pool = RecognitionPool(
+            self.face_recognizer, self.streams, self.recognition_workers
+        )
+        for stream in self.streams:
+            stream.start()
+        self.recognition_pool.start()
+        
+        self.start_camera_btn.config(state=tk.DISABLED)
+        self.stop_camera_btn.config(state=tk.NORMAL)
+        if failed:
+            self.status_var.set(f"Camera đang chạy... (không mở được: {', '.join(failed)})")
+        else:
+            self.status_var.set("Camera đang chạy...")
+        self.update_camera_feed()
+    
+    def _build_camera_grid(self):
+        """Tạo lưới label hiển thị cho các camera"""
+        for child in self.camera_grid.winfo_children():
+            child.destroy()
+        self.camera_views = []
+        
+        cols = math.ceil(math.sqrt(len(self.streams)))
+        width, height = 640 // cols, 480 // cols
+        for idx, stream in enumerate(self.streams):
+            cell = ttk.Frame(self.camera_grid)
+            cell.grid(row=idx // cols, column=idx % cols, padx=2, pady=2)
+            label = ttk.Label(cell)
+            label.pack()
+            fps_var = tk.StringVar(value=stream.name)
+            ttk.Label(cell, textvariable=fps_var).pack()
+            self.camera_views.append({
+                'label': label,
+                'fps_var': fps_var,
+                'size': (width, height),
+                'rendered_seq': 0,
+                'result_seq': 0,
+            })
     
     def stop_camera(self):
         """Tắt camera"""
         self.camera_running = False
-        if self.camera:
-            self.camera.release()
+        if self.recognition_pool:
+            self.recognition_pool.stop()
+            self.recognition_pool = None
+        for stream in self.streams:
+            stream.stop()
+        self.streams = []
         self.start_camera_btn.config(state=tk.NORMAL)
         self.stop_camera_btn.config(state=tk.DISABLED)
         self.status_var.set("Camera đã tắt")
-        self.camera_label.config(image='')
+        for child in self.camera_grid.winfo_children():
+            child.destroy()
+        self.camera_views = []
     
     def update_camera_feed(self):
-        """Cập nhật video feed từ camera"""
-        if self.camera_running and self.camera:
-            ret, frame = self.camera.read()
-            if ret:
-                self.current_frame = frame.copy()
-                
-                # Nhận diện khuôn mặt
-                face_results = self.face_recognizer.detect_and_recognize(frame)
-                
-                # Xử lý từng khuôn mặt
-                for face_info in face_results:
-                    employee_id = face_info['employee_id']
-                    
-                    if employee_id:
-                        employee = self.db.get_employee(employee_id)
-                        name = employee['name']
-                        
-                        # Vẽ bounding box
-                        frame = self.face_recognizer.draw_face_box(frame, face_info, name)
-                        
-                        # Kiểm tra và ghi log chấm công
-                        self.process_attendance(employee_id, name)
-                    else:
-                        # Khuôn mặt lạ
-                        frame = self.face_recognizer.draw_face_box(frame, face_info, "Unknown")
-                
-                # Chuyển đổi frame để hiển thị trong Tkinter
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame_resized = cv2.resize(frame_rgb, (640, 480))
-                img = Image.fromarray(frame_resized)
-                imgtk = ImageTk.PhotoImage(image=img)
-                
-                self.camera_label.imgtk = imgtk
-                self.camera_label.config(image=imgtk)
+        """
+        Hiển thị frame mới nhất với kết quả nhận diện mới nhất của từng camera
+        Việc đọc camera và nhận diện chạy ở thread riêng, vòng lặp Tk chỉ vẽ
+        """
+        if not (self.camera_running and self.streams):
+            return
+        
+        for idx, (stream, view) in enumerate(zip(self.streams, self.camera_views)):
+            result = stream.latest_result
+            if result is not None and result.seq != view['result_seq']:
+                view['result_seq'] = result.seq
+                self.last_face_results = result.faces
+            
+            frame_seq, frame, frame_time = stream.frames.get()
+            if frame is None or frame_seq == view['rendered_seq']:
+                continue
+            view['rendered_seq'] = frame_seq
+            if idx == 0:
+                # Camera đầu tiên dùng để chụp ảnh khi thêm nhân viên
+                self.frame_count += 1
+                self.current_frame = frame
+            display = frame.copy()
             
-            # Lặp lại sau 10ms
-            self.root.after(10, self.update_camera_feed)
+            # Vẽ bounding box theo vị trí dự đoán của tracker để overlay bám theo
+            # khuôn mặt giữa các lần nhận diện
+            for face_info in stream.tracker.predicted_faces(frame_time):
+                employee_id = face_info['employee_id']
+                name = self.employee_names.get(employee_id) or "Unknown"
+                display = self.face_recognizer.draw_face_box(display, face_info, name)
+            
+            # Chuyển đổi frame để hiển thị trong Tkinter
+            frame_rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
+            frame_resized = cv2.resize(frame_rgb, view['size'])
+            img = Image.fromarray(frame_resized)
+            imgtk = ImageTk.PhotoImage(image=img)
+            
+            view['label'].imgtk = imgtk
+            view['label'].config(image=imgtk)
+            
+            detector = stream.detector or self.face_recognizer.detector
+            view['fps_var'].set(
+                f"{stream.name} | Camera: {stream.capture.fps.rate:.1f} fps | "
+                f"Nhận diện: {stream.recognition_fps.rate:.1f} fps | "
+                f"N = {stream.scheduler.process_every_n_frames} | "
+                f"{detector.name}: {detector.avg_cost_ms:.0f} ms"
+            )
+        
+        # Lặp lại sau 10ms
+        self.root.after(10, self.update_camera_feed)
+    
+    def _on_recognition(self, stream, result):
+        """Listener của CameraStream (thread nhận diện): chấm công các khuôn mặt đã biết"""
+        for face_info in result.faces:
+            employee_id = face_info['employee_id']
+            name = self.employee_names.get(employee_id) if employee_id else None
+            if name:
+                self.process_attendance(employee_id, name)
     
     def process_attendance(self, employee_id, name):
-        """Xử lý chấm công cho nhân viên"""
-        now = datetime.now()
-        
+        """Xử lý chấm công cho nhân viên (thread nền, giao diện cập nhật qua EventBus)"""
         # Kiểm tra cooldown
-        if employee_id in self.last_recognized:
-            time_diff = (now - self.last_recognized[employee_id]).total_seconds()
-            if time_diff < self.recognition_cooldown:
-                return
+        if not self.attendance_cooldown.should_log(employee_id, time.time()):
+            return
         
         # Ghi log chấm công
         timestamp = self.attendance_log.log_attendance(employee_id, name)
-        self.last_recognized[employee_id] = now
         
         # Chào nhân viên
         self.greeting_system.greet_employee(name, employee_id)
         
-        # Cập nhật UI
-        self.update_employee_info(employee_id, name, timestamp)
-        self.refresh_today_attendance()
-        
-        self.status_var.set(f"✅ {name} đã chấm công lúc {timestamp}")
+        self.events.publish('attendance', (employee_id, name, timestamp))
+        self.events.publish_latest('status', f"✅ {name} đã chấm công lúc {timestamp}")
+    
+    def _handle_events(self, events, latest):
+        """Thread Tk: cập nhật giao diện 1 lần cho cả lô sự kiện"""
+        attendances = [data for kind, data in events if kind == 'attendance']
+        if attendances:
+            self.update_employee_info(*attendances[-1])
+            self._append_today_attendance()
+        if 'status' in latest:
+            status = latest['status']
+            if len(attendances) > 1:
+                status += f" (+{len(attendances) - 1} người khác)"
+            self.status_var.set(status)
     
     def update_employee_info(self, employee_id, name, timestamp):
         """Cập nhật thông tin nhân viên lên UI"""
@@ -269,11 +481,24 @@ class AttendanceApp:
     def refresh_today_attendance(self):
         """Làm mới danh sách chấm công hôm nay"""
         self.attendance_listbox.delete(0, tk.END)
-        
+        self._listbox_day = datetime.now().strftime('%Y-%m-%d')
+        self._listbox_count = 0
+        self._append_today_attendance()
+    
+    def _append_today_attendance(self):
+        """Chỉ thêm các dòng chấm công mới vào cuối danh sách (sang ngày mới thì làm lại)"""
+        if self._listbox_day != datetime.now().strftime('%Y-%m-%d'):
+            self.refresh_today_attendance()
+            return
         today_records = self.attendance_log.get_today_attendance()
-        for record in today_records:
-            display_text = f"{record['Thời gian']} - {record['Tên']} ({record['Loại']})"
-            self.attendance_listbox.insert(tk.END, display_text)
+        new_records = today_records[self._listbox_count:]
+        if not new_records:
+            return
+        self.attendance_listbox.insert(tk.END, *(
+            f"{record['Thời gian']} - {record['Tên']} ({record['Loại']})" for record in new_records
+        ))
+        self._listbox_count = len(today_records)
+        self.attendance_listbox.see(tk.END)
     
     def add_employee_dialog(self):
         """Dialog thêm nhân viên mới với form đầy đủ"""
@@ -429,9 +654,11 @@ class AttendanceApp:
                 if face_encoding is not None:
                     # Lưu vào database
                     self.db.add_employee(employee_id, name, face_encoding, birth_date)
+                    self.greeting_system.prepare_greetings(name)
                     
-                    # Reload known faces
-                    self.face_recognizer.load_known_faces(self.db.get_all_employees())
+                    # Thêm vào danh sách nhận diện (không load lại toàn bộ)
+                    self.face_recognizer.add_known_face(employee_id, face_encoding)
+                    self.employee_names[employee_id] = name
                     
                     dialog.destroy()
                     messagebox.showinfo("Thành công", f"✅ Đã thêm nhân viên:\n\n👤 {name}\n🆔 {employee_id}\n🎂 {birth_date}")
@@ -540,12 +767,33 @@ class AttendanceApp:
                 
                 if messagebox.askyesno("Xác nhận", f"🗑️ Xóa nhân viên?\n\n👤 {emp_name}\n🆔 {emp_id}"):
                     self.db.delete_employee(emp_id)
-                    self.face_recognizer.load_known_faces(self.db.get_all_employees())
+                    self.face_recognizer.remove_known_face(emp_id)
+                    self.employee_names.pop(emp_id, None)
                     tree.delete(selected[0])
                     messagebox.showinfo("Thành công", f"✅ Đã xóa nhân viên {emp_name}!")
                     # Update count
                     count_label.config(text=f"Tổng số: {len(self.db.get_all_employees())} nhân viên")
         
+        # Button thêm ảnh mẫu (đeo kính, ánh sáng khác...) từ camera
+        def add_template_selected():
+            selected = tree.selection()
+            if not selected:
+                return
+            item = tree.item(selected[0])
+            emp_id = item['values'][0]
+            emp_name = item['values'][1]
+            if self.current_frame is None:
+                messagebox.showwarning("Lỗi", "⚠️ Không có hình ảnh từ camera!")
+                return
+            face_encoding = self.face_recognizer.create_face_encoding(self.current_frame)
+            if face_encoding is None:
+                messagebox.showwarning("Lỗi", "⚠️ Không phát hiện khuôn mặt! Vui lòng đối diện camera.")
+                return
+            count = self.db.add_face_template(emp_id, face_encoding)
+            if count:
+                self.face_recognizer.add_face_template(emp_id, face_encoding)
+                messagebox.showinfo("Thành công", f"✅ Đã thêm ảnh mẫu cho {emp_name} ({count} ảnh mẫu)")
+        
         # Buttons frame
         btn_frame = ttk.Frame(view_window, padding="10")
         btn_frame.pack(fill=tk.X)
@@ -556,6 +804,12 @@ class AttendanceApp:
             command=delete_selected
         ).pack(side=tk.LEFT, padx=5)
         
+        ttk.Button(
+            btn_frame,
+            text="📸 Thêm ảnh mẫu",
+            command=add_template_selected
+        ).pack(side=tk.LEFT, padx=5)
+        
         ttk.Button(
             btn_frame,
             text="❌ Đóng",
@@ -563,29 +817,135 @@ class AttendanceApp:
         ).pack(side=tk.RIGHT, padx=5)
     
     def export_attendance(self):
-        """Xuất file CSV chấm công"""
+        """Xuất file CSV chấm công (chạy ở thread nền, tiến độ hiện trên thanh trạng thái)"""
+        if getattr(self, '_export_thread', None) is not None:
+            messagebox.showinfo("Đang xuất", "Đang xuất file, vui lòng chờ...")
+            return
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            filetypes=[("CSV files", "*.csv"), ("CSV nén gzip", "*.csv.gz"), ("All files", "*.*")],
             initialfile=f"attendance_{datetime.now().strftime('%Y%m%d')}.csv"
         )
+        if not filename:
+            return
+        
+        self._export_progress = (0, 0)
+        self._export_result = None
+        
+        def run():
+            try:
+                self._export_result = self.attendance_log.export_to_csv(
+                    filename, progress=lambda done, total: setattr(self, '_export_progress', (done, total))
+                )
+            except OSError as e:
+                self._export_result = e
         
-        if filename:
-            output_file = self.attendance_log.export_to_csv(filename)
-            if output_file:
-                messagebox.showinfo("Thành công", f"Đã xuất file: {output_file}")
-                self.status_var.set(f"Đã xuất CSV: {output_file}")
+        self._export_thread = threading.Thread(target=run, daemon=True)
+        self._export_thread.start()
+        self._check_export()
+    
+    def _check_export(self):
+        if self._export_thread.is_alive():
+            done, total = self._export_progress
+            percent = done * 100 // total if total else 0
+            self.status_var.set(f"Đang xuất CSV... {percent}%")
+            self.root.after(100, self._check_export)
+            return
+        self._export_thread = None
+        output_file = self._export_result
+        if isinstance(output_file, OSError):
+            messagebox.showerror("Lỗi", f"Không xuất được file: {output_file}")
+            self.status_var.set("Xuất CSV thất bại")
+        elif output_file:
+            messagebox.showinfo("Thành công", f"Đã xuất file: {output_file}")
+            self.status_var.set(f"Đã xuất CSV: {output_file}")
+        else:
+            self.status_var.set("Chưa có dữ liệu chấm công để xuất")
     
     def on_closing(self):
         """Xử lý khi đóng ứng dụng"""
         if self.camera_running:
             self.stop_camera()
+        self._stop_events()
+        # Lưu ANN index (đã cập nhật khi thêm / xoá nhân viên)
+        known_faces = self.face_recognizer.known_faces
+        if getattr(known_faces, 'path', None):
+            known_faces.save()
+        if isinstance(self.face_recognizer, ProcessPoolRecognizer):
+            self.face_recognizer.close()
+        self.db.close()
+        self.rollup.close()
+        self.attendance_log.close()
         self.root.destroy()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Hệ thống chấm công nhận diện khuôn mặt")
+    parser.add_argument(
+        '--source', action='append', dest='sources',
+        help="Nguồn camera: device index, file video hoặc URL (lặp lại cho nhiều camera)"
+    )
+    parser.add_argument(
+        '--cameras', default=None,
+        help="File JSON cấu hình camera (nguồn, tên, detector riêng từng camera)"
+    )
+    parser.add_argument(
+        '--detector', default='hog', choices=sorted(DETECTORS),
+        help="Detector mặc định: hog (chính xác), haar (nhanh, máy yếu), dnn (cần file model)"
+    )
+    parser.add_argument(
+        '--two-stage', action='store_true',
+        help="Detect nhanh trên frame nhỏ, encode trên vùng cắt độ phân giải đầy đủ"
+    )
+    parser.add_argument(
+        '--index', default='flat', choices=INDEXES,
+        help="Index so khớp: flat (chính xác) hoặc ivf (gần đúng, cho danh sách rất lớn)"
+    )
+    parser.add_argument(
+        '--nprobe', type=int, default=8,
+        help="Số cụm IVF quét cho mỗi khuôn mặt (chỉ dùng với --index ivf)"
+    )
+    parser.add_argument(
+        '--quantize', default=None, choices=QUANTIZE,
+        help="Quét danh sách nhân viên dạng int8 / float16 (ít RAM), xếp hạng lại bằng float32"
+    )
+    parser.add_argument(
+        '--spill', action='store_true',
+        help="Với --quantize: giữ bản float32 trong file tạm trên đĩa thay vì RAM"
+    )
+    parser.add_argument(
+        '--db', default='employees.pkl',
+        help="Database nhân viên: .pkl (mặc định), .db (SQLite) hoặc .emb (ma trận map từ file)"
+    )
+    parser.add_argument(
+        '--log-partition', default='month', choices=['none', 'month', 'day'],
+        help="Chia log chấm công mỗi tháng / mỗi ngày 1 file (none = 1 file như cũ)"
+    )
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help="Số thread nhận diện dùng chung cho tất cả camera"
+    )
+    parser.add_argument(
+        '--processes', type=int, default=0,
+        help="Số process nhận diện (0 = chỉ dùng thread trong process chính)"
+    )
+    args = parser.parse_args()
+    startup = StartupTimer(_import_start)
+    startup.mark('import module')
+    
+    sources = list(args.sources or [])
+    if args.cameras:
+        sources += load_camera_config(args.cameras)
+    
     root = tk.Tk()
-    app = AttendanceApp(root)
+    startup.mark('tạo cửa sổ Tk')
+    app = AttendanceApp(
+        root, sources=sources, recognition_workers=args.workers,
+        recognition_processes=args.processes, detector=args.detector,
+        two_stage=args.two_stage, index=args.index, nprobe=args.nprobe,
+        quantize=args.quantize, spill=args.spill, db_file=args.db,
+        log_partition=None if args.log_partition == 'none' else args.log_partition, startup=startup
+    )
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
@@ -0,0 +1,416 @@
+"""
+Nhận diện khuôn mặt bằng nhiều process (tận dụng nhiều core CPU)
+- Frame được ghi vào ring buffer multiprocessing.shared_memory, worker chỉ
+  nhận chỉ số slot nên không có frame nào bị pickle qua process khác
+- Kích thước slot lấy theo frame đầu tiên; frame lớn hơn thì tạo ring mới,
+  ring cũ được giải phóng khi các slot đang dùng đã trả về
+- Mỗi worker có hàng đợi riêng: danh sách nhân viên và frame đi cùng 1 hàng đợi
+  nên đúng thứ tự; worker chỉ nhận frame sau khi đã có danh sách nhân viên
+- Thay đổi danh sách nhân viên và lệnh gửi worker làm cùng trong _lock, bản chụp
+  danh sách cho worker mới cũng lấy trong _lock: worker khởi động lại không
+  nhận 1 thay đổi 2 lần (vừa trong bản chụp vừa trong hàng đợi)
+- Kết quả trả về theo đúng thứ tự gửi
+- Worker chết hoặc treo quá task_timeout: các frame của nó báo lỗi, slot được
+  trả lại, worker được khởi động lại (quá max_restarts thì bớt worker)
+- Hết slot trống hoặc chưa có worker sẵn sàng thì frame mới bị bỏ qua
+"""
+import multiprocessing as mp
+import pickle
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedFrameRing:
+    """Ring buffer các slot frame trong shared memory"""
+
+    def __init__(self, slots, max_frame_shape=(1080, 1920, 3)):
+        self.slots = slots
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def idle(self):
+        """Tất cả slot đều trống"""
+        return self._free.qsize() == self.slots
+
+    def write(self, frame):
+        """
+        Ghi frame vào 1 slot trống
+        Returns: chỉ số slot, hoặc None nếu hết slot (frame bị bỏ qua)
+        """
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame {frame.shape} lớn hơn kích thước slot ({self.slot_bytes} bytes)")
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            return None
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+        view[...] = frame
+        return slot
+
+    def release(self, slot):
+        """Trả slot về danh sách trống"""
+        self._free.put(slot)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _worker_main(worker_id, recognizer_options, tasks, results):
+    """Vòng lặp của process worker: đọc frame từ shared memory và nhận diện"""
+    # Import trong process con để process cha không phải nạp dlib nếu không dùng
+    from face_detectors import create_detector
+    from face_recognition_module import FaceRecognizer
+
+    recognizer = FaceRecognizer(**recognizer_options)
+    # Nạp model trước khi nhận frame đầu tiên
+    try:
+        recognizer.warm_up()
+    except Exception as e:
+        print(f"Lỗi warm-up worker: {e}")
+    detectors = {}  # detector tạo theo spec, dùng lại giữa các frame
+    shm, shm_name = None, None
+    ready = False
+    try:
+        while True:
+            item = tasks.get()
+            if item is None:
+                break
+            command, *args = item
+            if command == 'index':
+                recognizer.known_faces = pickle.loads(args[0])
+                if not ready:
+                    # Đã có danh sách nhân viên: process cha bắt đầu gửi frame
+                    ready = True
+                    results.put(('ready', worker_id))
+                continue
+            if command == 'add':
+                recognizer.add_known_face(*args)
+                continue
+            if command == 'template':
+                recognizer.add_face_template(*args)
+                continue
+            if command == 'remove':
+                recognizer.remove_known_face(*args)
+                continue
+
+            seq, ring_name, slot_bytes, slot, shape, dtype, skip_locations, \
+                (detector_name, detector_options), plan = args
+            if ring_name != shm_name:
+                # Ring mới (frame lớn hơn): các frame của ring cũ đã xử lý xong
+                if shm is not None:
+                    shm.close()
+                shm, shm_name = shared_memory.SharedMemory(name=ring_name), ring_name
+            frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=slot * slot_bytes)
+            key = (detector_name, tuple(sorted(detector_options.items())))
+            detect_cost = 0.0
+            try:
+                if key not in detectors:
+                    detectors[key] = create_detector(detector_name, **detector_options)
+                detector = detectors[key]
+                faces = recognizer.detect_and_recognize(
+                    frame, skip_locations, detector=detector, planner=plan
+                )
+                detect_cost = detector.last_cost
+                error = None
+            except Exception as e:
+                faces, error = [], str(e)
+            del frame
+            results.put(('result', worker_id, seq, faces, error, detect_cost))
+    finally:
+        if shm is not None:
+            shm.close()
+
+
+class _Worker:
+    """Process worker và các frame đang giao cho nó"""
+
+    def __init__(self, worker_id, process, tasks):
+        self.worker_id = worker_id
+        self.process = process
+        self.tasks = tasks
+        self.ready = False
+        self.in_flight = deque()   # seq theo thứ tự worker xử lý
+        self.busy_since = None     # thời điểm bắt đầu frame đầu hàng đợi
+
+
+class ProcessPoolRecognizer:
+    """
+    Chạy FaceRecognizer.detect_and_recognize trên nhiều process
+    Dùng thay cho FaceRecognizer trong RecognitionPool (cùng interface);
+    các hàm khác (create_face_encoding, draw_face_box...) chạy ở process chính
+    """
+
+    def __init__(self, face_recognizer, num_workers=None, slots=None,
+                 max_frame_shape=None, task_timeout=10.0, max_restarts=3):
+        """
+        num_workers: số process (mặc định = số core)
+        slots: số slot frame trong shared memory (mặc định = num_workers + 2)
+        max_frame_shape: kích thước slot (cao, rộng, kênh); None = theo frame đầu tiên
+        task_timeout: giây tối đa cho 1 frame, quá thì coi worker bị treo
+        max_restarts: số lần khởi động lại worker chết, quá thì bớt worker
+        """
+        self.face_recognizer = face_recognizer
+        self.num_workers = num_workers or mp.cpu_count()
+        self.slots = slots or self.num_workers + 2
+        self.task_timeout = task_timeout
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.dropped_frames = 0
+        self.ring = SharedFrameRing(self.slots, max_frame_shape) if max_frame_shape else None
+        self._retired_rings = []
+
+        # Worker tạo FaceRecognizer cùng cấu hình (detector gửi kèm từng frame)
+        self._recognizer_options = {
+            'tolerance': face_recognizer.tolerance,
+            'two_stage': face_recognizer.two_stage,
+            'crop_padding': face_recognizer.crop_padding,
+            'crop_face_size': face_recognizer.crop_face_size,
+        }
+        self._ctx = mp.get_context('spawn')
+        self._results = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._next_worker_id = 0
+        self._workers = [self._spawn() for _ in range(self.num_workers)]
+
+        # Trả kết quả theo đúng thứ tự gửi
+        self._next_seq = 0
+        self._next_deliver = 0
+        self._pending = {}   # seq -> (Future, detector, planner, ring, slot, worker_id)
+        self._finished = {}  # seq -> (faces, error, chi phí) đã xong nhưng chưa đến lượt
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def __getattr__(self, name):
+        return getattr(self.face_recognizer, name)
+
+    def _snapshot(self):
+        """
+        Danh sách nhân viên hiện tại (đã pickle): Queue.put chỉ pickle ở thread nền
+        sau đó, lúc danh sách có thể đã có thêm thay đổi cũng được gửi riêng
+        """
+        return pickle.dumps(self.face_recognizer.known_faces, pickle.HIGHEST_PROTOCOL)
+
+    def _spawn(self):
+        """Khởi động 1 worker, gửi ngay danh sách nhân viên hiện tại (gọi khi giữ _lock)"""
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        tasks = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self._recognizer_options, tasks, self._results),
+            daemon=True
+        )
+        process.start()
+        # Gửi cả index (kể cả tâm cụm IVF) để worker không phải train lại
+        tasks.put(('index', self._snapshot()))
+        return _Worker(worker_id, process, tasks)
+
+    def _broadcast(self, change, *command):
+        """Áp dụng change() ở process chính và gửi command cho các worker trong cùng _lock"""
+        with self._lock:
+            result = change()
+            for worker in self._workers:
+                worker.tasks.put(command)
+        return result
+
+    def _send_roster(self):
+        with self._lock:
+            snapshot = self._snapshot()
+            for worker in self._workers:
+                worker.tasks.put(('index', snapshot))
+
+    def load_known_faces(self, employees_dict):
+        """Load lại danh sách nhân viên ở process chính và tất cả worker"""
+        self.face_recognizer.load_known_faces(employees_dict)
+        self._send_roster()
+
+    def load_database(self, db):
+        """Load danh sách nhân viên từ database ở process chính và tất cả worker"""
+        self.face_recognizer.load_database(db)
+        self._send_roster()
+
+    def add_known_face(self, employee_id, face_encoding):
+        """Thêm 1 nhân viên ở process chính và tất cả worker"""
+        face_encoding = np.array(face_encoding, dtype=np.float32)
+        self._broadcast(lambda: self.face_recognizer.add_known_face(employee_id, face_encoding),
+                        'add', employee_id, face_encoding)
+
+    def add_face_template(self, employee_id, face_encoding):
+        """Thêm 1 template ở process chính và tất cả worker"""
+        face_encoding = np.array(face_encoding, dtype=np.float32)
+        self._broadcast(lambda: self.face_recognizer.add_face_template(employee_id, face_encoding),
+                        'template', employee_id, face_encoding)
+
+    def remove_known_face(self, employee_id):
+        """Xoá 1 nhân viên ở process chính và tất cả worker"""
+        return self._broadcast(lambda: self.face_recognizer.remove_known_face(employee_id),
+                               'remove', employee_id)
+
+    def _ring_for(self, frame):
+        """Ring có slot đủ lớn cho frame (tạo ring mới nếu frame lớn hơn slot hiện tại)"""
+        if self.ring is None or frame.nbytes > self.ring.slot_bytes:
+            if self.ring is not None:
+                self._retired_rings.append(self.ring)
+            self.ring = SharedFrameRing(self.slots, frame.shape)
+        return self.ring
+
+    def _release(self, ring, slot):
+        ring.release(slot)
+        if ring in self._retired_rings and ring.idle:
+            self._retired_rings.remove(ring)
+            ring.close()
+
+    def submit(self, frame, skip_locations=None, detector=None, planner=None):
+        """
+        Gửi frame cho worker
+        detector: FaceDetector ở process chính; worker tạo detector cùng cấu hình
+            và chi phí đo được ghi ngược lại vào detector này
+        planner: DetectionPlanner của camera; worker nhận kế hoạch detect đã
+            tính sẵn, kích thước khuôn mặt được cập nhật lại vào planner ở đây
+        Returns: Future chứa list khuôn mặt, hoặc None nếu frame bị bỏ qua
+        """
+        detector = detector or self.face_recognizer.detector
+        plan = planner.snapshot(frame.shape) if planner is not None else None
+        with self._lock:
+            workers = [worker for worker in self._workers if worker.ready]
+            ring = self._ring_for(frame)
+            slot = ring.write(frame) if workers else None
+            if slot is None:
+                self.dropped_frames += 1
+                return None
+            # Giao cho worker đang ít frame nhất
+            worker = min(workers, key=lambda worker: len(worker.in_flight))
+            future = Future()
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending[seq] = (future, detector, planner, ring, slot, worker.worker_id)
+            if not worker.in_flight:
+                worker.busy_since = time.monotonic()
+            worker.in_flight.append(seq)
+            worker.tasks.put(('frame', seq, ring.name, ring.slot_bytes, slot, frame.shape,
+                              frame.dtype.str, skip_locations, detector.spec, plan))
+        return future
+
+    def detect_and_recognize(self, frame, skip_locations=None, detector=None, planner=None):
+        """
+        Giống FaceRecognizer.detect_and_recognize nhưng chạy ở process worker
+        Returns: None nếu frame bị bỏ qua do worker không theo kịp
+        """
+        future = self.submit(frame, skip_locations, detector, planner)
+        if future is None:
+            return None
+        try:
+            # Worker treo / chết được phát hiện sau task_timeout, đây chỉ là chốt chặn
+            return future.result(timeout=self.task_timeout * self.slots)
+        except FutureTimeoutError:
+            self.dropped_frames += 1
+            return None
+
+    def _worker(self, worker_id):
+        for worker in self._workers:
+            if worker.worker_id == worker_id:
+                return worker
+        return None
+
+    def _finish(self, seq, faces, error, detect_cost):
+        """Ghi nhận kết quả 1 frame (đã giữ _lock), trả slot"""
+        _, _, _, ring, slot, worker_id = self._pending[seq]
+        self._release(ring, slot)
+        self._finished[seq] = (faces, error, detect_cost)
+        worker = self._worker(worker_id)
+        if worker is not None and seq in worker.in_flight:
+            worker.in_flight.remove(seq)
+            worker.busy_since = time.monotonic() if worker.in_flight else None
+
+    def _check_workers(self):
+        """Phát hiện worker chết / treo (đã giữ _lock): báo lỗi frame, khởi động lại"""
+        now = time.monotonic()
+        for idx, worker in enumerate(list(self._workers)):
+            stuck = worker.busy_since is not None and now - worker.busy_since > self.task_timeout
+            if worker.process.is_alive() and not stuck:
+                continue
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.process.join(1.0)
+            reason = "bị treo" if stuck else f"đã dừng (exit code {worker.process.exitcode})"
+            print(f"Worker nhận diện {worker.worker_id} {reason}")
+            for seq in list(worker.in_flight):
+                self._finish(seq, [], f"Worker nhận diện {reason}", 0.0)
+            self._workers.remove(worker)
+            if self.restarts < self.max_restarts:
+                self.restarts += 1
+                self._workers.insert(idx, self._spawn())
+            elif not self._workers:
+                print("Không còn worker nhận diện nào")
+
+    def _collect(self):
+        while True:
+            try:
+                item = self._results.get(timeout=0.2)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            ready = []
+            with self._lock:
+                if item and item[0] == 'ready':
+                    worker = self._worker(item[1])
+                    if worker is not None:
+                        worker.ready = True
+                elif item:
+                    _, worker_id, seq, faces, error, detect_cost = item
+                    # Frame đã bị báo lỗi (worker bị coi là treo) thì bỏ qua
+                    if seq in self._pending and seq not in self._finished:
+                        self._finish(seq, faces, error, detect_cost)
+                self._check_workers()
+                while self._next_deliver in self._finished:
+                    faces, error, detect_cost = self._finished.pop(self._next_deliver)
+                    future, detector, planner, _, _, _ = self._pending.pop(self._next_deliver)
+                    ready.append((future, detector, planner, faces, error, detect_cost))
+                    self._next_deliver += 1
+            for future, detector, planner, faces, error, detect_cost in ready:
+                if error is None:
+                    detector.record_cost(detect_cost)
+                    if planner is not None:
+                        planner.observe([face['location'] for face in faces])
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result(faces)
+
+    def close(self, timeout=2.0):
+        """Dừng tất cả worker và giải phóng shared memory"""
+        self._results.put(None)
+        self._collector.join(timeout)
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.tasks.put(None)
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        with self._lock:
+            for future, _, _, _, _, _ in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        for ring in self._retired_rings + ([self.ring] if self.ring is not None else []):
+            ring.close()
+        self._retired_rings = []
+        self.ring = None
@@ -0,0 +1,73 @@
+"""
+Test xuất log chấm công (AttendanceLog.export_to_csv): chép nguyên partition,
+lọc theo khoảng ngày / nhân viên / loại, nén gzip, tiến độ
+Chạy: python -m pytest -q test_attendance_export.py
+"""
+import csv
+import gzip
+from datetime import datetime, timedelta
+
+from database import AttendanceLog
+
+START = datetime(2025, 9, 25, 8, 0, 0)
+
+
+def open_log(tmp_path, partition='month'):
+    log = AttendanceLog(str(tmp_path / 'attendance_log.csv'), fsync=False, flush_interval=0.05,
+                        partition=partition)
+    for day in range(20):  # 25/09 -> 14/10
+        for employee in range(3):
+            when = START + timedelta(days=day, minutes=employee)
+            log.log_attendance(f'NV{employee}', f'Người {employee}', when=when)
+            log.log_attendance(f'NV{employee}', f'Người {employee}', 'check-out',
+                               when=when + timedelta(hours=9))
+    log.flush()
+    return log
+
+
+def read_export(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_export_matches_query(tmp_path):
+    log = open_log(tmp_path)
+    cases = [
+        {},                                                       # chép nguyên các partition
+        {'start_date': '2025-09-28', 'end_date': '2025-10-03'},   # 2 đầu lọc từng dòng
+        {'start_date': '2025-10-01', 'end_date': '2025-10-31'},   # 1 partition trọn tháng
+        {'employee_ids': ['NV1'], 'attendance_type': 'check-out'},
+    ]
+    for i, options in enumerate(cases):
+        output = str(tmp_path / f'export_{i}.csv')
+        assert log.export_to_csv(output, **options) == output
+        expected = list(log.query(options.get('start_date', '0000-01-01'),
+                                  options.get('end_date', '9999-12-31'),
+                                  options.get('employee_ids'), options.get('attendance_type')))
+        assert read_export(output) == expected, options
+    assert len(read_export(str(tmp_path / 'export_0.csv'))) == 120
+    assert log.export_to_csv(str(tmp_path / 'empty.csv'), '2024-01-01', '2024-12-31') is None
+    log.close()
+
+
+def test_export_gzip_and_progress(tmp_path):
+    log = open_log(tmp_path, partition='day')
+    progress = []
+    output = log.export_to_csv(str(tmp_path / 'all.csv.gz'), '2025-09-30', '2025-10-02',
+                               progress=lambda done, total: progress.append((done, total)))
+    rows = read_export(output)
+    assert [row['Thời gian'][:10] for row in rows[::6]] == ['2025-09-30', '2025-10-01', '2025-10-02']
+    assert len(rows) == 18
+    assert progress[-1][0] == progress[-1][1]  # đã xử lý hết số byte của các partition
+    assert all(a[0] <= b[0] for a, b in zip(progress, progress[1:]))
+
+    # Log 1 file: xuất toàn bộ cũng là chép nguyên
+    single = AttendanceLog(str(tmp_path / 'single.csv'), fsync=False)
+    single.log_attendance('NV1', 'An', when=START)
+    single.flush()
+    exported = single.export_to_csv(str(tmp_path / 'single_export.csv'))
+    with open(exported, 'rb') as f, open(single.log_file, 'rb') as log_file:
+        assert f.read() == log_file.read()
+    single.close()
+    log.close()
@@ -0,0 +1,190 @@
+"""
+Test log chấm công chia partition (AttendanceLog): file theo tháng + index .idx
+Chạy: python -m pytest -q test_attendance_partitions.py
+"""
+import os
+from datetime import datetime, timedelta
+
+from database import AttendanceLog
+
+START = datetime(2025, 9, 28, 8, 0, 0)
+
+
+def open_log(tmp_path, partition='month'):
+    return AttendanceLog(str(tmp_path / 'attendance_log.csv'), fsync=False, flush_interval=0.05,
+                         partition=partition)
+
+
+def write_days(log, days=10, start=START):
+    """Mỗi ngày 2 nhân viên chấm công, từ 28/09 sang tháng 10"""
+    for day in range(days):
+        for employee in range(2):
+            log.log_attendance(f'NV{employee}', f'Người {employee}',
+                               when=start + timedelta(days=day, minutes=employee))
+    log.flush()
+
+
+def times(rows):
+    return [row['Thời gian'] for row in rows]
+
+
+def test_round_trip(tmp_path):
+    log = open_log(tmp_path)
+    write_days(log)
+    log.close()
+    assert sorted(os.listdir(log.log_dir)) == ['2025-09.csv', '2025-10.csv']
+
+    log = open_log(tmp_path)
+    rows = list(log.query('2025-09-30', '2025-10-02'))
+    assert times(rows) == ['2025-09-30 08:00:00', '2025-09-30 08:01:00',
+                           '2025-10-01 08:00:00', '2025-10-01 08:01:00',
+                           '2025-10-02 08:00:00', '2025-10-02 08:01:00']
+    assert os.path.exists(os.path.join(log.log_dir, '2025-10.csv.idx'))
+    assert [row['ID nhân viên'] for row in log.query('2025-10-03', employee_ids=['NV1'])] == ['NV1']
+    assert len(log.employee_history('NV0')) == 10
+    log.close()
+
+
+def test_index_follows_appends(tmp_path):
+    log = open_log(tmp_path)
+    write_days(log, days=5)
+    assert len(list(log.query('2025-09-01', '2025-10-31'))) == 10  # đã tạo .idx
+
+    # Process khác ghi thêm vào cùng partition
+    other = open_log(tmp_path)
+    other.log_attendance('NV9', 'Người 9', when=datetime(2025, 10, 2, 9, 0, 0))
+    other.close()
+    assert [row['ID nhân viên'] for row in log.query('2025-10-02')] == ['NV0', 'NV1', 'NV9']
+    log.close()
+
+
+def test_broken_index_is_rebuilt(tmp_path):
+    log = open_log(tmp_path)
+    write_days(log)
+    expected = list(log.query('2025-09-01', '2025-10-31'))
+    log.close()
+    index_file = os.path.join(log.log_dir, '2025-10.csv.idx')
+    with open(index_file, 'w', encoding='utf-8') as f:
+        f.write('{"size": 12, "dates": {"2025-10-0')  # ghi dở
+
+    log = open_log(tmp_path)
+    assert list(log.query('2025-09-01', '2025-10-31')) == expected
+    log.close()
+
+
+def test_torn_tail(tmp_path):
+    log = open_log(tmp_path)
+    write_days(log, days=5)
+    log.close()
+    # Crash giữa lúc ghi 1 dòng: dòng cuối không có xuống dòng
+    with open(os.path.join(log.log_dir, '2025-10.csv'), 'a', encoding='utf-8') as f:
+        f.write('2025-10-02 09:00:00,NV')
+
+    log = open_log(tmp_path)
+    assert len(list(log.query('2025-10-01', '2025-10-31'))) == 4
+    log.log_attendance('NV5', 'Người 5', when=datetime(2025, 10, 2, 10, 0, 0))
+    log.close()
+
+    log = open_log(tmp_path)
+    rows = list(log.query('2025-10-02'))
+    assert [(row['Thời gian'], row['ID nhân viên']) for row in rows] == [
+        ('2025-10-02 08:00:00', 'NV0'), ('2025-10-02 08:01:00', 'NV1'),
+        ('2025-10-02 10:00:00', 'NV5')]
+    log.close()
+
+
+def test_today_with_backdated_rows(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    today = now.replace(hour=0, minute=0, second=1)
+    log = open_log(tmp_path, partition='day')
+    log.log_attendance('NV0', 'Người 0', when=today)
+    log.log_attendance('NV1', 'Người 1', when=today - timedelta(days=1))  # video ghi lại
+    log.log_attendance('NV2', 'Người 2', when=today)
+    log.close()
+
+    log = AttendanceLog(str(tmp_path / 'single.csv'), fsync=False, flush_interval=0.05)
+    log.log_attendance('NV0', 'Người 0', when=today)
+    log.log_attendance('NV1', 'Người 1', when=today - timedelta(days=1))
+    log.log_attendance('NV2', 'Người 2', when=today)
+    log.close()
+
+    for partition, name in (('day', 'attendance_log.csv'), (None, 'single.csv')):
+        log = AttendanceLog(str(tmp_path / name), fsync=False, partition=partition)
+        assert [row['ID nhân viên'] for row in log.get_today_attendance()] == ['NV0', 'NV2']
+        log.close()
+
+
+def test_migrate_single_file(tmp_path):
+    single = open_log(tmp_path, partition=None)
+    write_days(single, days=5)
+    single.close()
+
+    # Chưa chia: mở với partition vẫn dùng 1 file, không tự chia
+    log = open_log(tmp_path)
+    assert log.partition is None
+    log.log_attendance('NV9', 'Người 9', when=datetime(2025, 10, 3, 9, 0, 0))
+    log.close()
+    assert os.path.exists(log.log_file)
+    assert not os.path.exists(str(tmp_path / 'attendance_log'))
+
+    # Đang có process khác chia
+    open(log.log_file + '.lock', 'w').close()
+    assert AttendanceLog.migrate_to_partitions(log.log_file, 'month') is None
+    os.remove(log.log_file + '.lock')
+
+    assert AttendanceLog.migrate_to_partitions(log.log_file, 'month') == 11
+    assert not os.path.exists(log.log_file)
+    assert os.path.exists(log.log_file + '.bak')
+    assert not os.path.exists(log.log_file + '.lock')
+    assert AttendanceLog.migrate_to_partitions(log.log_file, 'month') is None
+
+    log = open_log(tmp_path)
+    assert log.partition == 'month'
+    assert sorted(os.listdir(log.log_dir)) == ['2025-09.csv', '2025-10.csv']
+    rows = list(log.query('2025-09-01', '2025-10-31'))
+    assert len(rows) == 11 and rows[-1]['ID nhân viên'] == 'NV9'
+    log.close()
+
+
+def test_migrate_into_existing_partition(tmp_path):
+    # Partition đã có dòng (ghi trước khi chia) thì dòng cũ được nối thêm, không ghi đè
+    log = open_log(tmp_path)
+    log.log_attendance('NV7', 'Người 7', when=datetime(2025, 10, 20, 9, 0, 0))
+    log.close()
+    single = open_log(tmp_path, partition=None)
+    write_days(single, days=5)
+    single.close()
+
+    assert AttendanceLog.migrate_to_partitions(single.log_file, 'month') == 10
+    log = open_log(tmp_path)
+    employee_ids = [row['ID nhân viên'] for row in log.query('2025-10-01', '2025-10-31')]
+    assert sorted(employee_ids) == ['NV0', 'NV0', 'NV1', 'NV1', 'NV7']
+    log.close()
+
+
+def test_index_is_appended_in_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(AttendanceLog, 'INDEX_BLOCK', 256)  # nhiều khối với ít dòng
+    log = open_log(tmp_path)
+    write_days(log, days=10)
+    assert len(log.employee_history('NV1')) == 10
+    index_file = os.path.join(log.log_dir, '2025-10.csv.idx')
+    with open(index_file, 'rb') as f:
+        before = f.read()
+
+    log.log_attendance('NV1', 'Người 1', when=datetime(2025, 10, 8, 9, 0, 0))
+    history = log.employee_history('NV1', '2025-10-01', '2025-10-31')
+    assert [row['Thời gian'] for row in history][-2:] == ['2025-10-07 08:01:00', '2025-10-08 09:00:00']
+    assert len(history) == 8
+    with open(index_file, 'rb') as f:
+        after = f.read()
+    assert after.startswith(before) and after.count(b'\n') == 2  # chỉ nối phần mới
+    # Index giữ khối theo nhân viên, không giữ offset từng dòng
+    employees = log._index(os.path.join(log.log_dir, '2025-10.csv'))['employees']
+    assert len(employees['NV1']) < len(history)
+    log.close()
+
+    # Process khác đọc lại .idx (nhiều phần) ra cùng kết quả
+    log = open_log(tmp_path)
+    assert log.employee_history('NV1', '2025-10-01', '2025-10-31') == history
+    assert log.date_span('2025-10-08') is not None
+    log.close()
@@ -0,0 +1,85 @@
+"""
+Test bảng công theo ngày (DailyRollup): chỉ tin file đã chốt có span khớp với log
+Chạy: python -m pytest -q test_attendance_rollup.py
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from attendance_rollup import DailyRollup
+from database import AttendanceLog
+
+START = datetime(2025, 10, 1, 8, 0, 0)
+
+
+def open_log(tmp_path):
+    log = AttendanceLog(str(tmp_path / 'attendance_log.csv'), fsync=False, flush_interval=0.05,
+                        partition='month')
+    for day in range(5):
+        for employee in range(3):
+            when = START + timedelta(days=day, minutes=10 * employee)
+            log.log_attendance(f'NV{employee}', f'Người {employee}', when=when)
+            log.log_attendance(f'NV{employee}', f'Người {employee}', 'check-out',
+                               when=when + timedelta(hours=8, minutes=30))
+    log.flush()
+    return log
+
+
+def no_rebuild(self, start, end):
+    raise AssertionError(f"dựng lại {start} -> {end}")
+
+
+def test_days_match_log_and_are_finalised(tmp_path, monkeypatch):
+    log = open_log(tmp_path)
+    rollup = DailyRollup(log, attach=False)
+    rows = rollup.days('2025-10-01', '2025-10-05')
+    expected = log.first_in_last_out('2025-10-01', '2025-10-05')
+    assert [{k: v for k, v in row.items() if k != 'hours'} for row in rows] == expected
+    assert {row['hours'] for row in rows} == {8.5}
+    assert rollup.hours_worked('2025-10-01', '2025-10-05') == {'NV0': 42.5, 'NV1': 42.5, 'NV2': 42.5}
+    assert [row['employee_id'] for row in rollup.late_arrivals('2025-10-02', '08:05:00')] == ['NV1', 'NV2']
+
+    with open(rollup._path('2025-10-03'), encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['complete'] and saved['span'] == log.date_span('2025-10-03')
+
+    # Lần sau chỉ đọc file đã chốt
+    monkeypatch.setattr(DailyRollup, '_build', no_rebuild)
+    assert DailyRollup(log, attach=False).days('2025-10-01', '2025-10-05') == rows
+    assert rollup.days('2025-10-01', '2025-10-05', employee_ids=['NV2']) == [
+        row for row in rows if row['employee_id'] == 'NV2']
+    log.close()
+
+
+def test_rows_added_later_invalidate_the_day(tmp_path, monkeypatch):
+    log = open_log(tmp_path)
+    rollup = DailyRollup(log, attach=False)
+    rollup.days('2025-10-01', '2025-10-05')
+
+    # Process khác ghi thêm dòng cho ngày đã chốt (video ghi lại): span của ngày đổi
+    other = AttendanceLog(log.log_file, fsync=False, partition='month')
+    other.log_attendance('NV7', 'Người 7', when=datetime(2025, 10, 2, 19, 0, 0))
+    other.close()
+    rows = rollup.days('2025-10-02')
+    assert [row['employee_id'] for row in rows] == ['NV0', 'NV1', 'NV2', 'NV7']
+
+    # Đã chốt lại với span mới: không dựng lại nữa
+    monkeypatch.setattr(DailyRollup, '_build', no_rebuild)
+    assert rollup.days('2025-10-02') == rows
+    log.close()
+
+
+@pytest.mark.parametrize('saved', [
+    {'complete': False},                                   # ghi lúc sang ngày, chưa chốt
+    {'complete': True, 'span': ['2025-10.csv', 0, 10]},    # span không khớp log
+    {'complete': True},                                    # file kiểu cũ, không có span
+])
+def test_untrusted_files_are_rebuilt(tmp_path, saved):
+    log = open_log(tmp_path)
+    rollup = DailyRollup(log, attach=False)
+    expected = rollup.days('2025-10-04')
+    rollup._save('2025-10-04', {'NV9': ['Sai', '01:00:00', '02:00:00', 1]}, saved['complete'],
+                 saved.get('span'))
+    assert rollup.days('2025-10-04') == expected
+    log.close()
@@ -0,0 +1,74 @@
+"""
+Test thread ghi log chấm công theo lô (AttendanceLog._write_loop / flush / close)
+Chạy: python -m pytest -q test_attendance_writer.py
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from database import AttendanceLog
+
+WHEN = datetime(2025, 10, 6, 8, 0, 0)
+
+
+def open_log(tmp_path, **options):
+    return AttendanceLog(str(tmp_path / 'attendance_log.csv'), fsync=False, flush_interval=0.05,
+                         **options)
+
+
+class FailingDisk:
+    """Thay _end_torn_line (gọi trước khi mở file partition) để giả lập đĩa lỗi"""
+
+    def __init__(self, monkeypatch):
+        self.failing = True
+        original = database._end_torn_line
+
+        def end_torn_line(path):
+            if self.failing:
+                raise OSError("đĩa lỗi")
+            original(path)
+
+        monkeypatch.setattr(database, '_end_torn_line', end_torn_line)
+
+
+def test_batches_are_written_in_order(tmp_path):
+    log = open_log(tmp_path, flush_every=7)
+    for i in range(50):
+        log.log_attendance(f'NV{i}', f'Người {i}', when=WHEN + timedelta(seconds=i))
+    log.flush()
+    rows = list(log.query(WHEN))
+    assert [row['ID nhân viên'] for row in rows] == [f'NV{i}' for i in range(50)]
+    log.close()
+
+
+def test_flush_raises_while_rows_are_unwritten(tmp_path, monkeypatch):
+    disk = FailingDisk(monkeypatch)
+    log = open_log(tmp_path)
+    log.log_attendance('NV1', 'Người 1', when=WHEN)
+    with pytest.raises(OSError):
+        log.flush()  # không trả về như thể đã ghi xong
+    assert log._queue.unfinished_tasks == 1
+
+    disk.failing = False
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            log.flush()
+            break
+        except OSError:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    assert [row['ID nhân viên'] for row in log.query(WHEN)] == ['NV1']
+    log.close()
+
+
+def test_close_reports_dropped_rows(tmp_path, monkeypatch):
+    FailingDisk(monkeypatch)
+    log = open_log(tmp_path)
+    log.log_attendance('NV1', 'Người 1', when=WHEN)
+    log.log_attendance('NV2', 'Người 2', when=WHEN)
+    with pytest.raises(OSError, match='2 dòng'):
+        log.close()
+    assert log._queue.unfinished_tasks == 0
@@ -0,0 +1,107 @@
+"""
+Test database nhân viên pickle + journal (EmployeeDatabase)
+Chạy: python -m pytest -q test_employee_journal.py
+"""
+import os
+import pickle
+
+import numpy as np
+
+from database import EmployeeDatabase
+
+
+def encoding(seed):
+    return np.random.default_rng(seed).normal(size=128)
+
+
+def open_db(tmp_path, **options):
+    return EmployeeDatabase(str(tmp_path / 'employees.pkl'), fsync=False, **options)
+
+
+def test_round_trip(tmp_path):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(1), '1990-01-01')
+    db.add_employees([('NV002', 'An', [encoding(2), encoding(3)], None)])
+    db.add_face_template('NV001', encoding(4))
+    db.delete_employee('NV002')
+    db.close()
+    assert not os.path.exists(db.db_file)  # chưa gộp: chỉ có journal
+
+    db = open_db(tmp_path)
+    assert list(db.get_all_employees()) == ['NV001']
+    employee = db.get_employee('NV001')
+    assert employee['name'] == 'Khương' and employee['birth_date'] == '1990-01-01'
+    assert len(employee['face_encodings']) == 2
+    np.testing.assert_array_equal(employee['face_encodings'][1], encoding(4))
+    db.close()
+
+
+def test_compact_keeps_records(tmp_path):
+    db = open_db(tmp_path, compact_every=3)
+    for i in range(10):
+        db.add_employee(f'NV{i:03d}', f'Người {i}', encoding(i))
+    db.save_database()
+    db.add_employee('NV999', 'Sau khi gộp', encoding(99))
+    db.close()
+
+    db = open_db(tmp_path)
+    assert len(db.get_all_employees()) == 11
+    assert not os.path.exists(db.journal_file + '.1')
+    db.close()
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(1))
+    db.add_employee('NV002', 'An', encoding(2))
+    db.close()
+    good_size = os.path.getsize(db.journal_file)
+    # Crash giữa lúc ghi bản ghi thứ 3: chỉ có header và 1 phần payload
+    with open(db.journal_file, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x12\x34\x56\x78partial')
+
+    db = open_db(tmp_path)
+    assert sorted(db.get_all_employees()) == ['NV001', 'NV002']
+    assert os.path.getsize(db.journal_file) == good_size  # đuôi hỏng đã bị cắt
+    db.add_employee('NV003', 'Bình', encoding(3))
+    db.close()
+
+    db = open_db(tmp_path)
+    assert sorted(db.get_all_employees()) == ['NV001', 'NV002', 'NV003']
+    db.close()
+
+
+def test_corrupt_record_stops_replay(tmp_path):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(1))
+    db.add_employee('NV002', 'An', encoding(2))
+    db.close()
+    # Sai crc32 ở bản ghi cuối: không áp dụng bản ghi đó
+    with open(db.journal_file, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    db = open_db(tmp_path)
+    assert list(db.get_all_employees()) == ['NV001']
+    db.close()
+
+
+def test_migrate_from_snapshot_only(tmp_path):
+    # Database cũ: chỉ có file pickle, chưa có journal
+    employees = {'NV001': {'name': 'Khương', 'face_encoding': encoding(1), 'birth_date': None,
+                           'created_at': '2025-01-01 08:00:00'}}
+    with open(tmp_path / 'employees.pkl', 'wb') as f:
+        pickle.dump(employees, f)
+
+    db = open_db(tmp_path)
+    assert db.get_employee('NV001')['name'] == 'Khương'
+    assert db.add_face_template('NV001', encoding(2)) == 2
+    db.close()
+
+    db = open_db(tmp_path)
+    templates = db.get_employee('NV001')['face_encodings']
+    assert len(templates) == 2
+    np.testing.assert_array_equal(templates[0], encoding(1))
+    db.close()
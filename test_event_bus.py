@@ -0,0 +1,98 @@
+"""
+Test EventBus: giao theo lô, gộp trạng thái, giới hạn hàng đợi, vòng lặp pump
+Chạy: python -m pytest -q test_event_bus.py
+"""
+import threading
+
+from event_bus import EventBus
+
+
+class FakeRoot:
+    """Thay Tk root: after() chỉ ghi lại callback, test tự gọi tick()"""
+
+    def __init__(self):
+        self.pending = {}
+        self._next_id = 0
+
+    def after(self, interval_ms, callback):
+        self._next_id += 1
+        self.pending[self._next_id] = callback
+        return self._next_id
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def tick(self):
+        callbacks, self.pending = list(self.pending.values()), {}
+        for callback in callbacks:
+            callback()
+
+
+def test_events_in_order_and_latest_coalesced():
+    bus = EventBus()
+    for i in range(10):
+        bus.publish('attendance', i)
+        bus.publish_latest('status', f'lần {i}')
+    events, latest = bus.drain()
+    assert events == [('attendance', i) for i in range(10)]
+    assert latest == {'status': 'lần 9'}
+    assert bus.drain() == ([], {})
+
+
+def test_queue_is_bounded():
+    bus = EventBus(max_events=5)
+    for i in range(8):
+        bus.publish('attendance', i)
+    events, _ = bus.drain()
+    assert [data for _, data in events] == [3, 4, 5, 6, 7]
+    assert bus.dropped == 3
+
+
+def test_publish_from_many_threads():
+    bus = EventBus()
+
+    def publish(worker):
+        for i in range(1000):
+            bus.publish('attendance', (worker, i))
+
+    threads = [threading.Thread(target=publish, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    events, _ = bus.drain()
+    assert len(events) == 4000
+    for worker in range(4):
+        assert [i for _, (w, i) in events if w == worker] == list(range(1000))
+
+
+def test_pump_handles_each_burst_once():
+    bus, root, batches = EventBus(), FakeRoot(), []
+
+    def handler(events, latest):
+        batches.append((len(events), latest.get('status')))
+        if len(events) == 1:
+            raise RuntimeError("lỗi giao diện")  # không làm dừng vòng lặp
+
+    stop = bus.pump(root, handler, interval_ms=100)
+    root.tick()
+    assert batches == []  # không có sự kiện: không vẽ lại
+
+    for i in range(10):  # 10 người đến cùng lúc
+        bus.publish('attendance', i)
+        bus.publish_latest('status', f'người {i}')
+    root.tick()
+    assert batches == [(10, 'người 9')]
+
+    bus.publish('attendance', 10)
+    root.tick()
+    bus.publish('attendance', 11)
+    bus.publish('attendance', 12)
+    root.tick()
+    assert batches[1:] == [(1, None), (2, None)]
+
+    stop()
+    assert root.pending == {}
+    bus.publish('attendance', 13)
+    root.tick()
+    assert len(batches) == 3
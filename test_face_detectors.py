@@ -0,0 +1,30 @@
+"""
+Test FaceDetector.record_cost: nhiều thread nhận diện dùng chung 1 detector
+Chạy: python -m pytest -q test_face_detectors.py
+"""
+import sys
+import threading
+
+from face_detectors import FaceDetector
+
+
+def test_record_cost_from_many_threads():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # đổi thread liên tục để lộ race nếu thiếu lock
+    detector = FaceDetector()
+
+    def record():
+        for _ in range(20000):
+            detector.record_cost(0.01)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert detector.calls == 80000
+    assert abs(detector.avg_cost - 0.01) < 1e-9 and detector.last_cost == 0.01
+    assert abs(detector.avg_cost_ms - 10.0) < 1e-6
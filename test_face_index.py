@@ -0,0 +1,165 @@
+"""
+Test index so khớp khuôn mặt (face_index): kết quả so với tìm vét cạn bằng numpy
+Chạy: python -m pytest -q test_face_index.py
+"""
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from benchmark_ann import make_queries, synthetic_roster
+from face_index import EmbeddingMatrix, IVFIndex, QuantizedMatrix, TemplateGallery, create_index
+
+
+def roster(count, seed=0):
+    """Encoding giả: count người, mỗi người 1 vector 128 chiều"""
+    rng = np.random.default_rng(seed)
+    return [f'NV{i:05d}' for i in range(count)], rng.normal(scale=0.1, size=(count, 128))
+
+
+def brute_force(ids, encodings, queries):
+    dists = np.linalg.norm(queries[:, None, :] - encodings[None, :, :], axis=2)
+    best = dists.argmin(axis=1)
+    return [ids[row] for row in best], dists[np.arange(len(queries)), best]
+
+
+def recall(best_ids, expected_ids):
+    return np.mean([a == b for a, b in zip(best_ids, expected_ids)])
+
+
+def test_embedding_matrix_matches_brute_force():
+    ids, encodings = roster(500)
+    queries = encodings[::7] + np.random.default_rng(1).normal(scale=0.02, size=(72, 128))
+    index = EmbeddingMatrix()
+    index.load(ids, encodings)
+    best_ids, dists = index.search(queries)
+    expected_ids, expected_dists = brute_force(ids, encodings, queries)
+    assert best_ids == expected_ids
+    np.testing.assert_allclose(dists, expected_dists, rtol=1e-4)
+    assert index.match(queries[:1], tolerance=0.0) == [None]
+
+
+def test_embedding_matrix_add_remove():
+    ids, encodings = roster(5)
+    index = EmbeddingMatrix(capacity=2)
+    for employee_id, encoding in zip(ids, encodings):
+        index.add(employee_id, encoding)
+    assert index.capacity >= 5 and len(index) == 5
+    # Xoá: hàng cuối chuyển vào chỗ trống, tìm kiếm vẫn đúng
+    assert index.remove('NV00001') and not index.remove('NV00001')
+    assert index.search(encodings[4:5])[0] == ['NV00004']
+    assert index.search(encodings[1:2])[0] != ['NV00001']
+    index.add('NV00002', encodings[0])  # thay encoding
+    np.testing.assert_allclose(index.get('NV00002'), encodings[0], rtol=1e-6)
+
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy.ids == index.ids
+    np.testing.assert_array_equal(copy.matrix, index.matrix)
+
+
+def test_embedding_matrix_maps_without_copy(tmp_path):
+    ids, encodings = roster(10)
+    path = tmp_path / 'matrix.f32'
+    encodings.astype(np.float32).tofile(path)
+    matrix = np.memmap(path, dtype=np.float32, mode='c', shape=(10, 128))
+    index = EmbeddingMatrix()
+    index.map(ids, matrix)
+    assert np.shares_memory(index.matrix, matrix)
+    assert index.search(encodings[3:4])[0] == ['NV00003']
+    # Thêm người: chép sang RAM, file không bị sửa
+    index.add('NEW', np.zeros(128))
+    assert not np.shares_memory(index.matrix, matrix)
+    np.testing.assert_array_equal(np.fromfile(path, dtype=np.float32).reshape(10, 128),
+                                  encodings.astype(np.float32))
+
+
+def test_ivf_recall_against_brute_force(tmp_path):
+    ids, encodings = synthetic_roster(4000)
+    queries = make_queries(encodings, 300, noise=0.6)
+    expected_ids, expected_dists = brute_force(ids, encodings, queries)
+
+    index = IVFIndex(nprobe=8, path=str(tmp_path / 'employees.ivf.npz'))
+    index.load(ids, encodings)
+    assert len(index.lists) == 63  # ~ sqrt(N) cụm
+    assert recall(index.search(queries)[0], expected_ids) >= 0.95
+    # Quét tất cả các cụm = tìm vét cạn
+    best_ids, dists = index.search(queries, nprobe=len(index.lists))
+    assert best_ids == expected_ids
+    np.testing.assert_allclose(dists, expected_dists, rtol=1e-4)
+
+    # Mở lại từ file: dùng lại tâm cụm, không train lại, cùng kết quả
+    reopened = IVFIndex.open(index.path)
+    np.testing.assert_array_equal(reopened.centroids, index.centroids)
+    assert reopened.search(queries)[0] == index.search(queries)[0]
+
+    index.remove(ids[0])
+    index.add('NEW', encodings[0])
+    assert index.search(encodings[:1], nprobe=len(index.lists))[0] == ['NEW']
+    assert len(index) == 4000
+
+
+@pytest.mark.parametrize('dtype', ['int8', 'float16'])
+def test_quantized_recall_against_brute_force(tmp_path, dtype):
+    ids, encodings = synthetic_roster(3000)
+    queries = make_queries(encodings, 300, noise=0.6)
+    expected_ids, expected_dists = brute_force(ids, encodings, queries)
+
+    index = QuantizedMatrix(dtype=dtype, spill_dir=str(tmp_path), chunk_rows=512)
+    index.load(ids, encodings)
+    best_ids, dists = index.search(queries)
+    # Xếp hạng lại bằng float32: khoảng cách chính xác, quyết định giống tìm vét cạn
+    assert recall(best_ids, expected_ids) >= 0.99
+    hits = np.array([a == b for a, b in zip(best_ids, expected_ids)])
+    np.testing.assert_allclose(dists[hits], expected_dists[hits], rtol=1e-4)
+    # Bản float32 nằm trong file tạm không tên: RAM chỉ giữ bản lượng tử hoá
+    assert index.resident_bytes == len(ids) * (128 * np.dtype(dtype).itemsize + 8)
+    assert os.listdir(tmp_path) == []
+
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy.search(queries)[0] == best_ids
+
+
+def test_quantized_ivf_spills_cluster_rows(tmp_path):
+    ids, encodings = synthetic_roster(2000)
+    queries = make_queries(encodings, 200, noise=0.6)
+    expected_ids, _ = brute_force(ids, encodings, queries)
+
+    index = create_index('ivf', str(tmp_path / 'employees.emb'), quantize='int8', spill=True,
+                         nprobe=8)
+    index.load(ids, encodings)
+    assert all(item.spill_dir == str(tmp_path) for item in index.lists)
+    assert all(isinstance(item._data, np.memmap) for item in index.lists)
+    assert recall(index.search(queries)[0], expected_ids) >= 0.95
+    # Không spill nếu không yêu cầu
+    assert create_index('flat', str(tmp_path / 'employees.emb'), quantize='int8').spill_dir is None
+
+
+def test_gallery_matches_any_template():
+    ids, encodings = roster(200)
+    # Ảnh mẫu khác (đeo kính, ánh sáng khác): cách ảnh đầu 0.5, người khác cách ~1.6
+    glasses = encodings[0] + np.full(128, 0.5 / np.sqrt(128))
+    gallery = TemplateGallery()
+    gallery.load(ids, list(encodings))
+    assert gallery.match(glasses[None, :], tolerance=0.3) == [None]
+
+    gallery.add_template(ids[0], glasses)
+    assert len(gallery.templates[ids[0]]) == 2
+    # Tâm 2 template nằm giữa, vẫn khớp chính xác với từng template
+    assert gallery.match(np.stack([glasses, encodings[0]]), tolerance=0.01) == [ids[0], ids[0]]
+    assert gallery.search(encodings[5:6])[0] == [ids[5]]
+
+    copy = pickle.loads(pickle.dumps(gallery))
+    assert copy.match(glasses[None, :], tolerance=0.01) == [ids[0]]
+    assert gallery.remove(ids[0]) and ids[0] not in gallery.templates
+    assert gallery.match(glasses[None, :], tolerance=0.3) == [None]
+
+
+def test_gallery_keeps_newest_templates():
+    gallery = TemplateGallery(max_templates=3)
+    _, encodings = roster(6)
+    gallery.load(['NV1'], [encodings[:5]])
+    np.testing.assert_allclose(gallery.templates['NV1'], encodings[2:5], rtol=1e-6)
+    gallery.add_template('NV1', encodings[5])
+    np.testing.assert_allclose(gallery.templates['NV1'], encodings[3:6], rtol=1e-6)
+    assert gallery.match(encodings[2:3], tolerance=0.01) == [None]  # template cũ đã bỏ
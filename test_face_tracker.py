@@ -0,0 +1,74 @@
+"""
+Test FaceTracker: ghép track bằng IoU / tâm box, dự đoán chuyển động, chỉ encode
+lại khi track mới, bị mất dấu hoặc đến hạn xác minh lại
+Chạy: python -m pytest -q test_face_tracker.py
+"""
+import pytest
+
+from face_tracker import FaceTracker, box_iou
+
+
+def face(box, employee_id=None, encoded=True):
+    """Kết quả detect_and_recognize: encoding None khi khuôn mặt được bỏ qua bước encode"""
+    return {'location': box, 'employee_id': employee_id, 'encoding': [0.0] if encoded else None}
+
+
+def shift(box, dx, dy=0):
+    top, right, bottom, left = box
+    return (top + dy, right + dx, bottom + dy, left + dx)
+
+
+BOX = (100, 200, 200, 100)  # (top, right, bottom, left)
+
+
+def test_box_iou():
+    assert box_iou(BOX, BOX) == 1.0
+    assert box_iou(BOX, shift(BOX, 100)) == 0.0
+    assert box_iou(BOX, shift(BOX, 50)) == pytest.approx(50 * 100 / (2 * 100 * 100 - 50 * 100))
+
+
+def test_identity_follows_track():
+    tracker = FaceTracker()
+    [first] = tracker.update([face(BOX, 'NV1')], now=0.0)
+    # Lần sau khuôn mặt được bỏ qua bước encode: vẫn giữ track ID và danh tính
+    [second] = tracker.update([face(shift(BOX, 10), encoded=False)], now=0.1)
+    assert second['track_id'] == first['track_id']
+    assert second['employee_id'] == 'NV1'
+
+    # 2 người cạnh nhau: mỗi detection ghép với track có IoU cao nhất
+    faces = tracker.update([face(shift(BOX, 300), 'NV2'), face(shift(BOX, 15), encoded=False)], now=0.2)
+    by_id = {info['employee_id']: info['track_id'] for info in faces}
+    assert by_id == {'NV1': first['track_id'], 'NV2': first['track_id'] + 1}
+
+
+def test_fast_motion_uses_prediction_and_centers():
+    tracker = FaceTracker()
+    [first] = tracker.update([face(BOX, 'NV1')], now=0.0)
+    tracker.update([face(shift(BOX, 40), encoded=False)], now=0.1)
+    # Đang đi sang phải: vị trí dự đoán lệch theo vận tốc
+    [predicted] = tracker.predicted_faces(now=0.2)
+    assert predicted['location'][3] > 140
+    # Bước nhảy lớn (IoU thấp) vẫn ghép được theo tâm box
+    [moved] = tracker.update([face(shift(BOX, 120), encoded=False)], now=0.2)
+    assert moved['track_id'] == first['track_id'] and moved['employee_id'] == 'NV1'
+
+
+def test_reverify_schedule():
+    tracker = FaceTracker(reverify_interval=5.0, unknown_reverify_interval=1.0, max_age=1.0)
+    tracker.update([face(BOX, 'NV1'), face(shift(BOX, 300))], now=0.0)
+    assert tracker.encode_count == 2
+    # Chưa đến hạn: cả 2 track được bỏ qua bước encode
+    assert len(tracker.locations_to_skip(now=0.5)) == 2
+    # Người lạ xác minh lại sau 1 giây, người đã nhận diện sau 5 giây
+    assert tracker.locations_to_skip(now=1.0) == [BOX]
+    assert tracker.locations_to_skip(now=5.0) == []
+
+    # Mất dấu 1 lần: encode lại dù chưa đến hạn
+    tracker.update([face(shift(BOX, 300), encoded=False)], now=1.2)
+    assert tracker.locations_to_skip(now=1.3) == []
+
+    # Không thấy quá max_age thì xoá track, lần sau là track mới
+    tracker.update([], now=3.0)
+    assert tracker.tracks == {}
+    [again] = tracker.update([face(BOX, 'NV1')], now=3.1)
+    assert again['track_id'] == 3
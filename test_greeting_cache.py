@@ -0,0 +1,75 @@
+"""
+Test GreetingCache: tổng hợp trước, đọc từ bộ nhớ, LRU giới hạn dung lượng
+Chạy: python -m pytest -q test_greeting_cache.py
+"""
+import os
+
+from greeting_cache import GreetingCache, greeting_message
+
+
+class StubSynthesizer:
+    """Thay gTTS / pyttsx3: mỗi lời chào 1 file ~1 KB, đếm số lần tổng hợp"""
+    extension = '.wav'
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, message, path):
+        self.calls += 1
+        with open(path, 'wb') as f:
+            f.write(b'RIFF' + message.encode('utf-8').ljust(1000, b'\0'))
+
+
+def open_cache(tmp_path, max_bytes=100 * 1024):
+    synthesizer = StubSynthesizer()
+    return GreetingCache(str(tmp_path / 'greeting_cache'), max_bytes, synthesizer), synthesizer
+
+
+def test_greeting_message_by_time_of_day():
+    assert greeting_message('An', 7).startswith('Chào buổi sáng An')
+    assert greeting_message('An', 13).startswith('Chào buổi chiều An')
+    assert greeting_message('An', 20).startswith('Chào buổi tối An')
+
+
+def test_warm_once_and_read_from_memory(tmp_path):
+    cache, synthesizer = open_cache(tmp_path)
+    assert cache.warm([('NV1', 'An'), ('NV2', 'Bình')]) == 6  # 3 buổi x 2 người
+    assert cache.warm([('NV1', 'An')]) == 0
+    assert synthesizer.calls == 6
+    data, extension = cache.get(greeting_message('An', 7))
+    assert data.startswith(b'RIFF') and extension == 'wav'
+    assert cache.get(greeting_message('Người lạ', 7)) is None
+
+    # Lời chào tải về lúc chào (gTTS) được lưu lại, thay bản cũ
+    cache.put(greeting_message('An', 7), b'ID3mp3', '.mp3')
+    assert cache.get(greeting_message('An', 7)) == (b'ID3mp3', 'mp3')
+    assert len(os.listdir(cache.cache_dir)) == 6
+
+
+def test_lru_eviction_keeps_recently_played(tmp_path):
+    cache, _ = open_cache(tmp_path, max_bytes=4 * 1004)
+    messages = [greeting_message(f'Người {i}', 7) for i in range(4)]
+    for age, message in enumerate(messages):
+        cache.synthesize(message)
+        path = os.path.join(cache.cache_dir, cache.key(message) + '.wav')
+        os.utime(path, (1000 + age, 1000 + age))  # Người 0 cũ nhất
+    cache.get(messages[0])  # vừa phát: thành mới nhất
+
+    cache.synthesize(greeting_message('Người 4', 7))
+    assert cache.total_bytes <= cache.max_bytes
+    assert messages[0] in cache and messages[1] not in cache
+    assert all(message in cache for message in messages[2:])
+    assert len(os.listdir(cache.cache_dir)) == 4
+
+
+def test_reopen_scans_directory(tmp_path):
+    cache, _ = open_cache(tmp_path)
+    cache.warm([('NV1', 'An')])
+    # File tổng hợp dở khi crash bị xoá lúc mở lại
+    with open(os.path.join(cache.cache_dir, 'abc.tmp.wav'), 'wb') as f:
+        f.write(b'RI')
+
+    reopened, synthesizer = open_cache(tmp_path)
+    assert reopened.total_bytes == cache.total_bytes
+    assert not os.path.exists(os.path.join(cache.cache_dir, 'abc.tmp.wav'))
+    assert reopened.warm([('NV1', 'An')]) == 0 and synthesizer.calls == 0
@@ -0,0 +1,96 @@
+"""
+Test chạy nhận diện không giao diện (HeadlessRunner) từ đầu đến cuối:
+thư mục ảnh -> nhận diện (giả) -> log chấm công + lời chào phát từ GreetingCache
+Chạy: python -m pytest -q test_headless_runner.py
+"""
+import io
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from database import AttendanceLog, EmployeeDatabase
+from greeting_cache import GreetingCache, greeting_message
+from greeting_system import GreetingSystem
+from headless_runner import HeadlessRunner, iter_frames
+
+START = datetime(2025, 10, 6, 7, 30, 0)
+LEFT, RIGHT = (10, 50, 50, 10), (10, 110, 50, 70)
+
+
+class StubRecognizer:
+    """Ảnh tối: NV1 bên trái; ảnh sáng: thêm NV2 bên phải"""
+
+    def __init__(self):
+        self.detector = SimpleNamespace(name='stub', avg_cost_ms=0.0)
+        self.calls = 0
+
+    def detect_and_recognize(self, frame, skip_locations=None, planner=None):
+        self.calls += 1
+        faces = [(LEFT, 'NV1')]
+        if frame.mean() > 100:
+            faces.append((RIGHT, 'NV2'))
+        return [{'location': location, 'employee_id': employee_id, 'encoding': np.zeros(128)}
+                for location, employee_id in faces]
+
+
+class StubSynthesizer:
+    extension = '.wav'
+
+    def __call__(self, message, path):
+        with open(path, 'wb') as f:
+            f.write(b'RIFF' + message.encode('utf-8'))
+
+
+def write_images(directory, values):
+    directory.mkdir()
+    for idx, value in enumerate(values):
+        cv2.imwrite(str(directory / f'{idx:03d}.png'), np.full((60, 120, 3), value, np.uint8))
+
+
+def test_attendance_rows_and_greetings(tmp_path):
+    write_images(tmp_path / 'frames', [10, 10, 10, 200, 200, 200])
+    db = EmployeeDatabase(str(tmp_path / 'employees.pkl'), fsync=False)
+    db.add_employee('NV1', 'An', np.zeros(128))
+    db.add_employee('NV2', 'Bình', np.ones(128))
+    log = AttendanceLog(str(tmp_path / 'attendance_log.csv'), fsync=False, flush_interval=0.05,
+                        partition='month')
+
+    cache = GreetingCache(str(tmp_path / 'greeting_cache'), synthesizer=StubSynthesizer())
+    assert cache.warm([('NV1', 'An'), ('NV2', 'Bình')]) == 6
+    warmed_bytes = cache.total_bytes
+    greeting = GreetingSystem(use_gtts=False, cache=cache)
+    assert greeting.ready.wait(10)
+    played = []
+    greeting.mixer = True  # không có loa khi test: ghi lại âm thanh thay vì phát
+    greeting._play = lambda data, extension: played.append(data)
+
+    output = io.StringIO()
+    recognizer = StubRecognizer()
+    runner = HeadlessRunner(db, log, recognizer, cooldown=30, start_time=START, output=output,
+                            source_name='frames', still_images=True, greeting_system=greeting)
+    summary = runner.run(iter_frames(str(tmp_path / 'frames'), image_fps=1.0))
+
+    assert summary['frames'] == summary['processed_frames'] == recognizer.calls == 6
+    assert summary['attendance_events'] == 2  # cooldown: mỗi người 1 lần
+    events = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(event['employee_id'], event['time'], event['greeted']) for event in events] == [
+        ('NV1', '2025-10-06 07:30:00', True), ('NV2', '2025-10-06 07:30:03', True)]
+
+    rows = list(log.query('2025-10-06'))
+    assert [(row['Thời gian'], row['ID nhân viên'], row['Tên']) for row in rows] == [
+        ('2025-10-06 07:30:00', 'NV1', 'An'), ('2025-10-06 07:30:03', 'NV2', 'Bình')]
+    log.close()
+
+    # Lời chào phát từ cache (thread riêng), không tổng hợp lại
+    deadline = time.monotonic() + 10
+    while len(played) < 2:
+        assert time.monotonic() < deadline, "chưa phát lời chào"
+        time.sleep(0.01)
+    hour = datetime.now().hour
+    assert sorted(played) == sorted(b'RIFF' + greeting_message(name, hour).encode('utf-8')
+                                    for name in ('An', 'Bình'))
+    assert cache.total_bytes == warmed_bytes
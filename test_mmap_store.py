@@ -0,0 +1,202 @@
+"""
+Test database nhân viên dạng ma trận map từ file (MmapEmployeeDatabase, .emb + .emb.meta)
+Chạy: python -m pytest -q test_mmap_store.py
+"""
+import os
+
+import numpy as np
+
+from database import EmployeeDatabase, MmapEmployeeDatabase
+
+
+def encoding(seed):
+    return np.random.default_rng(seed).normal(size=128).astype(np.float32)
+
+
+def open_db(tmp_path):
+    return MmapEmployeeDatabase(str(tmp_path / 'employees.emb'))
+
+
+def test_round_trip(tmp_path):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(1), '1990-01-01')
+    db.add_employees([('NV002', 'An', [encoding(2), encoding(3)], None),
+                      ('NV003', 'Bình', encoding(4), None)])
+    db.add_face_template('NV001', encoding(5))
+    db.delete_employee('NV003')
+    db.close()
+
+    db = open_db(tmp_path)
+    employees = db.get_all_employees()
+    assert sorted(employees) == ['NV001', 'NV002']
+    assert employees['NV001']['name'] == 'Khương'
+    assert employees['NV001']['birth_date'] == '1990-01-01'
+    np.testing.assert_array_equal(employees['NV001']['face_encodings'][1], encoding(5))
+    assert len(employees['NV002']['face_encodings']) == 2
+
+    assert db.compact() == 1  # hàng của NV003 đã xoá
+    row_ids, matrix, source = db.map_face_matrix()
+    assert sorted(row_ids) == ['NV001', 'NV001', 'NV002', 'NV002']  # hàng theo thứ tự ghi
+    np.testing.assert_array_equal(matrix[row_ids.index('NV002')], encoding(2))
+    assert source is not None
+    db.close()
+
+
+def test_template_cap(tmp_path):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(0))
+    for i in range(1, 15):
+        count = db.add_face_template('NV001', encoding(i))
+    assert count == 10
+    templates = db.get_employee('NV001')['face_encodings']
+    np.testing.assert_array_equal(templates[-1], encoding(14))
+    np.testing.assert_array_equal(templates[0], encoding(5))
+    db.close()
+
+
+def test_torn_row_is_ignored(tmp_path):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(1))
+    db.close()
+    size = os.path.getsize(db.db_file)
+    # Crash khi đang ghi hàng mới: dữ liệu đã nối nhưng số hàng trong header chưa đổi
+    with open(db.db_file, 'ab') as f:
+        f.write(b'NV002'.ljust(64, b'\0') + encoding(2).tobytes()[:100])
+
+    db = open_db(tmp_path)
+    assert db.count == 1
+    assert list(db.get_all_employees()) == ['NV001']
+    db.add_employee('NV003', 'Bình', encoding(3))
+    db.close()
+
+    db = open_db(tmp_path)
+    assert sorted(db.get_all_employees()) == ['NV001', 'NV003']
+    assert os.path.getsize(db.db_file) == size + db.row_dtype.itemsize
+    np.testing.assert_array_equal(db.get_employee('NV003')['face_encoding'], encoding(3))
+    db.close()
+
+
+def test_torn_meta_line(tmp_path):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(1))
+    db.close()
+    with open(db.meta_file, 'a', encoding='utf-8') as f:
+        f.write('{"op": "put", "id": "NV0')  # dòng cuối ghi dở
+
+    db = open_db(tmp_path)
+    assert list(db.metadata()) == ['NV001']
+    db.add_employee('NV002', 'An', encoding(2))
+    db.add_employees([('NV003', 'Bình', encoding(3), None)])
+    db.close()
+
+    # Bản ghi sau dòng hỏng vẫn đọc được
+    db = open_db(tmp_path)
+    names = {employee_id: data['name'] for employee_id, data in db.metadata().items()}
+    assert names == {'NV001': 'Khương', 'NV002': 'An', 'NV003': 'Bình'}
+    db.close()
+
+
+def test_compact_is_explicit(tmp_path):
+    db = open_db(tmp_path)
+    for i in range(8):
+        db.add_employee(f'NV{i:03d}', f'Người {i}', encoding(i))
+    for i in range(4):
+        db.delete_employee(f'NV{i:03d}')
+    db.close()
+    assert db.count == 8  # close / đọc không tự gộp file
+
+    db = open_db(tmp_path)
+    row_ids, matrix, source = db.map_face_matrix()
+    assert source is None and row_ids == ['NV004', 'NV005', 'NV006', 'NV007']
+    assert db.count == 8
+    assert db.compact() == 4
+    assert db.count == 4 and db.generation == 1
+    assert sorted(db.get_all_employees()) == ['NV004', 'NV005', 'NV006', 'NV007']
+    db.close()
+
+
+def test_writer_follows_compaction_by_other_process(tmp_path):
+    app = open_db(tmp_path)
+    for i in range(5):
+        app.add_employee(f'E{i}', f'Người {i}', encoding(i))
+    app.delete_employee('E1')
+    app.get_all_employees()  # ánh xạ hàng của layout cũ
+
+    other = open_db(tmp_path)
+    assert other.compact() == 1
+
+    # Process cũ phải thấy generation mới, không xoá nhầm hàng
+    assert app.delete_employee('E3')
+    db = open_db(tmp_path)
+    assert sorted(db.get_all_employees()) == ['E0', 'E2', 'E4']
+    np.testing.assert_array_equal(db.get_employee('E4')['face_encoding'], encoding(4))
+    app.add_employee('E9', 'Người 9', encoding(9))
+    assert sorted(open_db(tmp_path).get_all_employees()) == ['E0', 'E2', 'E4', 'E9']
+
+
+def test_mapped_source_rejects_replaced_file(tmp_path):
+    import pickle
+
+    from face_index import EmbeddingMatrix
+
+    db = open_db(tmp_path)
+    for i in range(3):
+        db.add_employee(f'E{i}', f'Người {i}', encoding(i))
+    index = EmbeddingMatrix()
+    index.map(*db.map_face_matrix())
+    assert 'mapped' in index.__getstate__()  # process khác map lại cùng file
+
+    db.delete_employee('E0')
+    assert open_db(tmp_path).compact() == 1
+    # File đã bị thay: gửi bản copy thay vì map layout mới với mã cũ
+    state = index.__getstate__()
+    assert 'mapped' not in state
+    copy = pickle.loads(pickle.dumps(index))
+    assert copy.ids == ['E0', 'E1', 'E2']
+    np.testing.assert_array_equal(copy.matrix[2], encoding(2))
+
+
+def test_migrate_from_pickle(tmp_path):
+    source = EmployeeDatabase(str(tmp_path / 'employees.pkl'), fsync=False)
+    source.add_employee('NV001', 'Khương', encoding(1), '1990-01-01')
+    source.add_face_template('NV001', encoding(2))
+    source.add_employee('NV002', 'An', encoding(3))
+    source.close()
+
+    db = open_db(tmp_path)
+    assert db.migrate_from_pickle(source.db_file) == 2
+    db.close()
+
+    db = open_db(tmp_path)
+    employees = db.get_all_employees()
+    assert sorted(employees) == ['NV001', 'NV002']
+    assert employees['NV001']['birth_date'] == '1990-01-01'
+    assert len(employees['NV001']['face_encodings']) == 2
+    np.testing.assert_allclose(employees['NV002']['face_encoding'], encoding(3))
+    db.close()
+
+
+def test_failed_replace_keeps_old_encoding(tmp_path, monkeypatch):
+    db = open_db(tmp_path)
+    db.add_employee('NV001', 'Khương', encoding(1))
+
+    def fail(*args):
+        raise OSError("đĩa đầy")
+
+    monkeypatch.setattr(db, '_append_records', fail)
+    for replace in (lambda: db.add_employee('NV001', 'Khương', encoding(2)),
+                    lambda: db.add_employees([('NV001', 'Khương', encoding(2), None)])):
+        try:
+            replace()
+        except OSError:
+            pass
+        np.testing.assert_array_equal(db.get_employee('NV001')['face_encoding'], encoding(1))
+    monkeypatch.undo()
+    db = open_db(tmp_path)
+    np.testing.assert_array_equal(db.get_employee('NV001')['face_encoding'], encoding(1))
+
+    # Thay thành công: chỉ còn encoding mới
+    db.add_employee('NV001', 'Khương', encoding(3))
+    templates = open_db(tmp_path).get_employee('NV001')['face_encodings']
+    assert len(templates) == 1
+    np.testing.assert_array_equal(templates[0], encoding(3))
@@ -0,0 +1,108 @@
+"""
+Test nhận diện nhiều process (ProcessPoolRecognizer): thứ tự kết quả, khởi động lại worker
+face_recognition được thay bằng module giả (đặt trên sys.path để process worker cũng dùng):
+mỗi frame có 1 khuôn mặt, encoding = độ sáng trung bình của frame
+Chạy: python -m pytest -q test_process_pool.py
+"""
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from face_recognition_module import FaceRecognizer
+from process_pool import ProcessPoolRecognizer
+
+FAKE_FACE_RECOGNITION = '''
+import numpy as np
+
+def face_locations(img, number_of_times_to_upsample=1, model='hog'):
+    return [(10, 50, 50, 10)]
+
+def face_encodings(img, known_face_locations=None, num_jitters=1, model='small'):
+    locations = known_face_locations or face_locations(img)
+    return [np.full(128, img.mean() / 255.0) for _ in locations]
+'''
+
+
+@pytest.fixture
+def pool_factory(tmp_path, monkeypatch):
+    (tmp_path / 'face_recognition.py').write_text(FAKE_FACE_RECOGNITION)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, 'face_recognition', raising=False)
+    pools = []
+
+    def make(num_workers):
+        recognizer = FaceRecognizer(tolerance=0.3)
+        recognizer.load_known_faces({'DARK': {'face_encoding': np.zeros(128)}})
+        pool = ProcessPoolRecognizer(recognizer, num_workers, slots=8, task_timeout=5.0)
+        pools.append(pool)
+        wait_ready(pool, num_workers)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def wait_ready(pool, count, timeout=60):
+    deadline = time.monotonic() + timeout
+    while sum(worker.ready for worker in pool._workers) < count:
+        assert time.monotonic() < deadline, "worker không sẵn sàng"
+        time.sleep(0.05)
+
+
+def frame(value):
+    return np.full((64, 64, 3), value, np.uint8)
+
+
+def employee_at(pool, value, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        faces = pool.detect_and_recognize(frame(value))
+        if faces is not None:
+            return faces[0]['employee_id']
+        assert time.monotonic() < deadline, "frame luôn bị bỏ qua"
+        time.sleep(0.05)
+
+
+def test_results_in_submit_order(pool_factory):
+    pool = pool_factory(2)
+    futures = []
+    for value in range(0, 240, 10):
+        future = None
+        while future is None:
+            future = pool.submit(frame(value))
+            if future is None:
+                time.sleep(0.01)
+        futures.append((value, future))
+
+    delivered = []
+    for value, future in futures:
+        future.add_done_callback(lambda _, value=value: delivered.append(value))
+    for value, future in futures:
+        encoding = future.result(timeout=30)[0]['encoding']
+        assert encoding[0] == pytest.approx(value / 255.0)
+    assert delivered == [value for value, _ in futures]
+
+
+def test_restarted_worker_gets_current_roster(pool_factory):
+    pool = pool_factory(1)
+    assert employee_at(pool, 0) == 'DARK'
+    pool.add_known_face('BRIGHT', np.full(128, 200 / 255.0))
+    pool.add_face_template('DARK', np.full(128, 100 / 255.0))
+    assert employee_at(pool, 200) == 'BRIGHT'
+
+    old = pool._workers[0]
+    old.process.terminate()
+    deadline = time.monotonic() + 30
+    while not pool._workers or pool._workers[0] is old:
+        assert time.monotonic() < deadline, "worker chết không được khởi động lại"
+        time.sleep(0.05)
+    wait_ready(pool, 1)
+    assert pool.restarts == 1
+    # Worker mới nhận bản chụp đã có cả nhân viên và template thêm sau khi khởi động
+    assert employee_at(pool, 200) == 'BRIGHT'
+    assert employee_at(pool, 100) == 'DARK'
+    assert pool.remove_known_face('BRIGHT')
+    assert employee_at(pool, 200) is None
@@ -0,0 +1,59 @@
+"""
+Test RecognitionScheduler: N theo ngân sách CPU, giới hạn max_latency, chế độ chờ,
+chuyển động chỉ rút ngắn khoảng cách giữa 2 lần nhận diện
+Chạy: python -m pytest -q test_recognition_scheduler.py
+"""
+import numpy as np
+
+from camera_pipeline import RecognitionScheduler
+
+FPS = 30.0
+DARK = np.zeros((48, 64, 3), np.uint8)
+BRIGHT = np.full((48, 64, 3), 255, np.uint8)
+
+
+def run(scheduler, frames, cost=0.09, faces=('mặt',)):
+    """Chạy scheduler qua các frame 30 fps, trả về chỉ số các frame được nhận diện"""
+    processed = []
+    for seq, frame in enumerate(frames):
+        if scheduler.should_process(seq, frame, seq / FPS):
+            processed.append(seq)
+            scheduler.record_result(list(faces), cost)
+    return processed
+
+
+def test_every_n_follows_cpu_budget():
+    # 90 ms / lần, 50% của 1 core ở 30 fps: 1/60 giây mỗi frame -> N = ceil(5.4) = 6
+    scheduler = RecognitionScheduler(cpu_budget=0.5)
+    processed = run(scheduler, [DARK] * 61)
+    assert scheduler.process_every_n_frames == 6
+    assert processed == list(range(0, 61, 6))
+
+
+def test_every_n_is_capped_by_max_latency():
+    scheduler = RecognitionScheduler(cpu_budget=0.5, max_latency=0.52)
+    processed = run(scheduler, [DARK] * 61, cost=1.0)
+    assert scheduler.process_every_n_frames == 15  # không chờ quá max_latency
+    assert processed == [0, 15, 30, 45, 60]
+
+
+def test_idle_without_faces_or_motion():
+    scheduler = RecognitionScheduler(idle_interval=2.0)
+    processed = run(scheduler, [DARK] * 121, faces=())
+    assert processed == [0, 60, 120]
+
+
+def test_motion_is_bounded():
+    # Frame nhấp nháy liên tục: chuyển động ở mọi frame nhưng vẫn cách nhau
+    # ít nhất N / motion_speedup frame và min_motion_interval giây
+    scheduler = RecognitionScheduler(cpu_budget=0.5, motion_speedup=2, min_motion_interval=0.1)
+    frames = [DARK if seq % 2 else BRIGHT for seq in range(60)]
+    processed = run(scheduler, frames)
+    gaps = np.diff(processed)
+    assert scheduler.process_every_n_frames == 6
+    assert gaps.min() >= 3 and len(processed) <= 21
+
+    # Không có người: chuyển động đánh thức scheduler trước idle_interval
+    scheduler = RecognitionScheduler(idle_interval=2.0)
+    processed = run(scheduler, [DARK] * 10 + [BRIGHT] * 10, faces=())
+    assert processed == [0, 10]
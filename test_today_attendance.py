@@ -0,0 +1,89 @@
+"""
+Test danh sách chấm công hôm nay giữ trong bộ nhớ (AttendanceLog.get_today_attendance)
+Chạy: python -m pytest -q test_today_attendance.py
+"""
+import os
+from datetime import datetime
+
+import pytest
+
+import database
+from database import AttendanceLog
+
+
+class Clock(datetime):
+    """datetime.now() điều khiển được trong database"""
+    current = datetime(2025, 10, 6, 23, 59, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(database, 'datetime', Clock)
+    Clock.current = datetime(2025, 10, 6, 23, 59, 0)
+    return Clock
+
+
+def open_log(tmp_path, partition='month'):
+    return AttendanceLog(str(tmp_path / 'attendance_log.csv'), fsync=False, flush_interval=0.05,
+                         partition=partition)
+
+
+def ids(rows):
+    return [row['ID nhân viên'] for row in rows]
+
+
+def test_own_rows_pending_and_written(tmp_path, clock):
+    log = open_log(tmp_path)
+    log.log_attendance('NV1', 'An')
+    assert ids(log.get_today_attendance()) == ['NV1']  # chưa ghi ra file vẫn thấy
+    log.log_attendance('NV2', 'Bình')
+    log.flush()
+    # Dòng tự ghi không bị đọc lại thành 2 lần
+    assert ids(log.get_today_attendance()) == ['NV1', 'NV2']
+    log.close()
+
+
+def test_rows_from_other_process(tmp_path, clock):
+    log = open_log(tmp_path)
+    log.log_attendance('NV1', 'An')
+    assert ids(log.get_today_attendance()) == ['NV1']
+
+    other = open_log(tmp_path)
+    other.log_attendance('NV9', 'Chín')
+    other.log_attendance('NV1', 'An')  # cùng nội dung với dòng của process kia
+    other.close()
+    log.flush()
+    assert ids(log.get_today_attendance()) == ['NV1', 'NV9', 'NV1']
+    log.close()
+
+
+def test_rollover_at_midnight(tmp_path, clock):
+    log = open_log(tmp_path, partition='day')
+    log.log_attendance('NV1', 'An')
+    assert ids(log.get_today_attendance()) == ['NV1']
+
+    clock.current = datetime(2025, 10, 7, 0, 0, 5)
+    assert log.get_today_attendance() == []
+    log.log_attendance('NV2', 'Bình')
+    log.flush()
+    assert ids(log.get_today_attendance()) == ['NV2']
+    assert sorted(os.listdir(log.log_dir)) == ['2025-10-06.csv', '2025-10-07.csv']
+    log.close()
+
+
+def test_replaced_log_is_read_again(tmp_path, clock):
+    log = open_log(tmp_path, partition=None)
+    for employee_id in ('NV1', 'NV2', 'NV3'):
+        log.log_attendance(employee_id, 'Tên')
+    log.flush()
+    assert len(log.get_today_attendance()) == 3
+
+    # Log bị thay bằng file ngắn hơn (khôi phục bản sao lưu): đọc lại từ đầu
+    with open(log.log_file, 'w', encoding='utf-8') as f:
+        f.write(','.join(AttendanceLog.FIELDS) + '\n2025-10-06 08:00:00,NV7,Bảy,check-in\n')
+    assert ids(log.get_today_attendance()) == ['NV7']
+    log.close()